@@ -1,6 +1,6 @@
 import os
 from flask import Flask
-from app.models import db
+from app.models import db, upgrade_schema
 from app.models.analysis_task import AnalysisTask  # 确保模型被导入
 from app.models.user import User  # 导入User模型
 from app.routes.routes import api  # Blueprint 路由
@@ -25,6 +25,7 @@ def create_app(config_overrides=None):
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        upgrade_schema()
         db.session.commit()
 
     # 注册 Blueprint 路由
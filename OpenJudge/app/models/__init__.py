@@ -3,4 +3,27 @@ from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
 from app.models.analysis_task import AnalysisTask
-from app.models.user import User
\ No newline at end of file
+from app.models.user import User
+
+
+def upgrade_schema():
+    """
+    为已存在的表补上模型中新增的列（db.create_all 只创建缺失的表，不会修改已有表）
+    新增列均为可空列；PostgreSQL 上使用 IF NOT EXISTS，多个进程同时启动也不会冲突
+    """
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    if_not_exists = "IF NOT EXISTS " if db.engine.dialect.name == "postgresql" else ""
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(
+                f'ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{column.name} {column_type}'
+            ))
+    db.session.commit()
@@ -9,9 +9,13 @@ class AnalysisTask(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # 关联用户ID
     problem_id = db.Column(db.String(10), nullable=False)
     code = db.Column(db.Text, nullable=False)
+    language = db.Column(db.String(20), default="python")  # python/java/cpp/c/javascript，旧数据为空即 python
     result = db.Column(db.String(20), default="pending")  # pending/accepted/wrong_answer/runtime_error/time_limit_exceeded
     stdout = db.Column(db.Text)  # 运行输出
     testcase_result = db.Column(db.JSON)  # 测试用例结果详情
+    cpu_time_ms = db.Column(db.Float)  # 所有用例的 CPU 时间总和（用户态+内核态）
+    wall_time_ms = db.Column(db.Float)  # 所有用例的墙钟时间总和
+    max_rss_kb = db.Column(db.Integer)  # 单个用例的最大峰值内存
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))  # 创建时间（时区敏感）
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))  # 更新时间（时区敏感）
 
@@ -25,9 +29,13 @@ class AnalysisTask(db.Model):
             "user_id": self.user_id,
             "problem_id": self.problem_id,
             "code": self.code,
+            "language": self.language or "python",
             "result": self.result,
             "stdout": self.stdout,
             "testcase_result": self.testcase_result,
+            "cpu_time_ms": self.cpu_time_ms,
+            "wall_time_ms": self.wall_time_ms,
+            "max_rss_kb": self.max_rss_kb,
             "created_at": to_rfc3339_seconds_zulu(self.created_at) if self.created_at else None,
             "updated_at": to_rfc3339_seconds_zulu(self.updated_at) if self.updated_at else None,
         }
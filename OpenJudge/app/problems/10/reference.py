@@ -0,0 +1,2 @@
+nums = [int(x) for x in input().split()]
+print(f"max={max(nums)} min={min(nums)}")
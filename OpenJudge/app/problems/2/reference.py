@@ -0,0 +1,2 @@
+n = input().strip()
+print("yes" if sum(int(d) ** 3 for d in n) == int(n) else "no")
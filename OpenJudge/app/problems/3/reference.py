@@ -0,0 +1,3 @@
+n = int(input())
+prime = n >= 2 and all(n % d for d in range(2, int(n ** 0.5) + 1))
+print("yes" if prime else "no")
@@ -0,0 +1,2 @@
+s = input().strip().lower()
+print("yes" if s == s[::-1] else "no")
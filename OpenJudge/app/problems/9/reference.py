@@ -0,0 +1,2 @@
+s = input()
+print(sum(1 for c in s if ('a' <= c <= 'z') or ('A' <= c <= 'Z')))
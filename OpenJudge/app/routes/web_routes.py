@@ -3,6 +3,7 @@ from app.routes.problems import problems
 from app.models.analysis_task import AnalysisTask
 from app.models import db
 from app.utils.auth import login_required_web, get_current_user
+from app.utils.result_codec import decode_judge_output
 import requests
 import json
 from datetime import datetime
@@ -108,7 +109,7 @@ def submit_code():
         from app.views.analysis import submit_judge_internal
         
         # 调用内部函数
-        result = submit_judge_internal(api_data)
+        result = submit_judge_internal(api_data, authenticated_user_id=current_user.id)
         
         if result['success']:
             flash('Code submitted successfully!', 'success')
@@ -163,7 +164,8 @@ def get_submission_detail(submission_id):
     test_results = []
     if submission.testcase_result:
         try:
-            judge_output = json.loads(submission.testcase_result)
+            # 紧凑格式的结果在这里还原 input/expected
+            judge_output = decode_judge_output(submission.testcase_result)
             print(f"Parsed judge output: {json.dumps(judge_output, indent=2)}")
             
             # 从judge_output中获取results
@@ -2,18 +2,35 @@ import os
 import subprocess
 import json
 from celery import Celery
+from celery.signals import task_postrun, worker_init, worker_process_init, worker_process_shutdown
 from app.models import db
 from app.models.analysis_task import AnalysisTask
 from app import create_app
 from datetime import datetime
-from app.utils.judge import judge_submission
+from app.utils.judge import (
+    PROBLEMS_DIR, judge_submission, load_problem_config, max_judge_time, problem_fingerprint, problem_limits,
+    testcase_digest, warm_testcase_cache
+)
+from app.utils.judge_queues import DEFAULT_KIND, HEAVY_CPU_TIME, QUEUES, VISIBILITY_TIMEOUTS, queue_depth
+from app.utils.sandbox_io import set_child_subreaper
+from app.utils.result_codec import encode_judge_output
+from app.utils.result_writer import close_result_writer, get_result_writer
+from app.utils.verdict_cache import verdict_cache
+from app.utils.fair_share import DEFAULT_LEASE, FairShareScheduler, fair_share_enabled
+from app.utils.redis_client import redis_client
+from app.utils.task_results import store_task_results
 
 # Celery 配置
 celery = Celery('coughoverflow')
 celery.conf.broker_url = 'sqs://'
-celery.conf.task_default_queue = "celery"
+# 判题任务按提交类型路由到不同队列（见 enqueue_judge 与 judge_queues.py），未指定队列的任务进入 interactive
+celery.conf.task_default_queue = QUEUES[DEFAULT_KIND]
+# 每个 worker 进程只预取一个任务：长任务不会压住已取出的交互式提交
+celery.conf.worker_prefetch_multiplier = 1
 celery.conf.broker_transport_options = {
-    "region": "us-east-1"
+    "region": "us-east-1",
+    # 由 Celery 创建的队列（及 Redis broker）使用的可见性超时；已存在的 SQS 队列以 sqs.tf 为准
+    "visibility_timeout": max(VISIBILITY_TIMEOUTS.values())
 }
 
 raw_db_url = os.environ.get("DATABASE_URL", "")
@@ -22,14 +39,126 @@ if raw_db_url.startswith("postgresql://"):
 else:
     celery.conf.result_backend = raw_db_url
 
-@celery.task(name='process_judge', bind=True)
-def process_judge(self, submission_id: str, problem_id: str, user_code: str):
-    """处理判题任务"""
+# 判题结果保存在 analysis_tasks 中，默认不再写 Celery 结果后端的副本（见 task_results.py）
+STORE_TASK_RESULTS = store_task_results()
+
+# worker 的数据库连接池：每个子进程同一时间只处理一个任务，少量连接即可；
+# pool_pre_ping 在取出连接时检测已被数据库断开的空闲连接，pool_recycle 定期更换长期存活的连接
+WORKER_ENGINE_OPTIONS = {
+    "pool_size": int(os.getenv("WORKER_DB_POOL_SIZE", 2)),
+    "max_overflow": int(os.getenv("WORKER_DB_MAX_OVERFLOW", 2)),
+    "pool_pre_ping": True,
+    "pool_recycle": int(os.getenv("WORKER_DB_POOL_RECYCLE", 1800)),
+}
+
+_worker_app = None
+_worker_app_pid = None
+
+def worker_app():
+    """
+    当前 worker 子进程的 Flask app（懒加载，每个进程只创建一次，建表与补列也只执行一次）
+    创建后推入应用上下文并保持到进程退出：任务中直接使用 db.session，数据库引擎及其连接池在任务之间复用
+    """
+    global _worker_app, _worker_app_pid
+    if _worker_app is None or _worker_app_pid != os.getpid():
+        if _worker_app is not None:
+            # fork 继承的连接属于父进程：丢弃而不关闭，避免影响父进程正在使用的连接
+            db.engine.dispose(close=False)
+        app = create_app({"SQLALCHEMY_ENGINE_OPTIONS": WORKER_ENGINE_OPTIONS})
+        app.app_context().push()
+        _worker_app, _worker_app_pid = app, os.getpid()
+    return _worker_app
+
+@worker_process_init.connect
+def init_worker_app(**kwargs):
+    """worker 子进程启动时创建 app 并连接数据库，第一个任务不再承担初始化开销"""
     try:
-        self.update_state(state='STARTED')
-        
-        # 直接调用本地判题函数，不再使用docker容器
-        judge_output = judge_submission(problem_id, submission_id, user_code)
+        worker_app()
+    except Exception as e:
+        # 数据库暂不可用时不阻止 worker 启动，第一个任务会重试
+        print(f"[WARN] Failed to initialize worker app: {e}")
+
+@task_postrun.connect
+def release_db_session(**kwargs):
+    """任务结束后归还会话持有的连接（应用上下文一直存在，不会在任务之间自动清理会话）"""
+    if _worker_app is not None and _worker_app_pid == os.getpid():
+        db.session.remove()
+
+@worker_process_shutdown.connect
+def close_worker_app(**kwargs):
+    """worker 子进程退出前写完缓冲的判题结果，并关闭连接池中的连接"""
+    if _worker_app is not None and _worker_app_pid == os.getpid():
+        close_result_writer()
+        db.engine.dispose()
+
+@worker_init.connect
+def check_visibility_timeouts(**kwargs):
+    """worker 启动时检查：最长判题耗时超过 heavy 队列可见性超时的问题会被重复投递"""
+    try:
+        problem_ids = sorted(os.listdir(PROBLEMS_DIR))
+    except OSError:
+        return
+    for problem_id in problem_ids:
+        try:
+            seconds = max_judge_time(problem_id)
+        except Exception:
+            continue
+        if seconds > VISIBILITY_TIMEOUTS["heavy"]:
+            print(f"[WARN] Problem {problem_id} can take up to {seconds:.0f}s to judge, "
+                  f"longer than the heavy queue visibility timeout ({VISIBILITY_TIMEOUTS['heavy']}s)")
+
+@worker_process_init.connect
+def warm_worker_caches(**kwargs):
+    """worker 子进程启动时预加载测试用例，避免部署后的第一个提交承担解析开销"""
+    loaded = warm_testcase_cache()
+    print(f"[INFO] Warmed testcase cache for {loaded} problems")
+
+@worker_process_init.connect
+def adopt_sandbox_orphans(**kwargs):
+    """worker 子进程设为 subreaper：沙箱进程遗留的孤儿进程由 worker 收养并回收，而不是交给 init"""
+    if not set_child_subreaper():
+        print("[WARN] PR_SET_CHILD_SUBREAPER unavailable, orphaned sandbox processes are reaped by init")
+
+def store_result(row):
+    """逐行写入一条判题结果（row 的字段见 result_writer.COLUMNS）"""
+    task = db.session.get(AnalysisTask, row['submission_id'])
+    if task:
+        for column, value in row.items():
+            if column != 'submission_id':
+                setattr(task, column, value)
+    db.session.commit()
+
+# acks_late：结果落库后才确认消息，worker 中途退出时消息重新投递（重新判题结果相同）
+# ignore_result：返回值与状态不写入结果后端，每个提交只写一次数据库
+@celery.task(name='process_judge', bind=True, acks_late=True, ignore_result=not STORE_TASK_RESULTS)
+def process_judge(self, submission_id: str, problem_id: str, user_code: str, policy: str = None,
+                  runtime: str = None, language: str = None, user_id=None, use_cache: bool = True):
+    """
+    处理判题任务（policy / runtime 为空时使用问题配置中的判题策略与运行时，language 为空时按 python 评测）
+    user_id 只在经公平调度放行时传入（见 enqueue_judge），任务结束后释放该用户的在判名额
+    use_cache 为 False 时不读取缓存的判题结果，重新判题并覆盖缓存（见 rejudge.py）
+    """
+    try:
+        if STORE_TASK_RESULTS:
+            self.update_state(state='STARTED')
+
+        # 相同代码重复提交时直接复用缓存的判题结果
+        try:
+            fingerprint = problem_fingerprint(problem_id, policy, runtime, language)
+        except Exception:
+            fingerprint = None
+        judge_output = None
+        if fingerprint and use_cache:
+            judge_output = verdict_cache.get(problem_id, fingerprint, user_code)
+        elif fingerprint:
+            verdict_cache.discard(problem_id, fingerprint, user_code)
+
+        if judge_output is None:
+            # 直接调用本地判题函数，不再使用docker容器
+            judge_output = judge_submission(problem_id, submission_id, user_code, policy=policy,
+                                            runtime=runtime, language=language)
+            if fingerprint:
+                verdict_cache.put(problem_id, fingerprint, user_code, judge_output)
         
         # 确保judge_output有results字段
         if 'results' not in judge_output:
@@ -44,35 +173,49 @@ def process_judge(self, submission_id: str, problem_id: str, user_code: str):
         else:  # status == 'err'
             final_result = "error"
         
-        # 更新数据库
-        app = create_app()
-        with app.app_context():
-            task = db.session.get(AnalysisTask, submission_id)
-            if task:
-                # 存储结果
-                testcase_result = json.dumps(judge_output)  # 保存完整的judge_output
-                
-                # 映射judge状态到数据库状态
-                status_mapping = {
-                    'ok': 'ok',  # 直接显示为PASS
-                    'fail': 'fail',
-                    'err': 'error'
-                }
-                
-                db_status = status_mapping.get(status, 'error')
-                
-                task.result = db_status
-                task.status = 'completed'  # 不再使用中间状态
-                task.updated_at = datetime.utcnow()
-                task.testcase_result = testcase_result
-                task.stdout = json.dumps(judge_output)  # 将judge输出作为stdout
-            db.session.commit()
-        
+        # 紧凑编码：不再重复保存每个用例的 input/expected，读取时从测试用例还原
+        try:
+            digest = testcase_digest(problem_id)
+        except Exception:
+            digest = None
+        compact_output = encode_judge_output(judge_output, problem_id, digest)
+
+        # 映射judge状态到数据库状态
+        status_mapping = {
+            'ok': 'ok',  # 直接显示为PASS
+            'fail': 'fail',
+            'err': 'error'
+        }
+        # 资源统计汇总
+        stats = judge_output.get('stats') or {}
+        row = {
+            'submission_id': submission_id,
+            'result': status_mapping.get(status, 'error'),
+            'testcase_result': json.dumps(compact_output),
+            'stdout': judge_output.get('message'),  # 只保存判题摘要，完整结果见 testcase_result
+            'cpu_time_ms': stats.get('cpu_time_ms'),
+            'wall_time_ms': stats.get('wall_time_ms'),
+            'max_rss_kb': stats.get('max_rss_kb'),
+            'updated_at': datetime.utcnow()
+        }
+
+        # 更新数据库：启用了结果写入器时与其他任务的结果合并成一条语句，返回前一定已经落库
+        worker_app()
+        writer = get_result_writer(db.engine)
+        if writer is not None:
+            try:
+                writer.write(row)
+            except Exception as e:
+                print(f"[WARN] Bulk result write failed for {submission_id}, writing directly: {e}")
+                store_result(row)
+        else:
+            store_result(row)
+
+        # 只返回状态：完整结果已在 analysis_tasks 中
         return {
             'status': 'SUCCESS',
             'submission_id': submission_id,
-            'judge_status': final_result,
-            'result': judge_output
+            'judge_status': final_result
         }
     
     except Exception as e:
@@ -90,18 +233,121 @@ def process_judge(self, submission_id: str, problem_id: str, user_code: str):
             }]
         }
         
-        app = create_app()
-        with app.app_context():
-            task = db.session.get(AnalysisTask, submission_id)
-            if task:
-                task.result = final_result
-                task.stdout = f"Internal error: {str(e)}"
-                task.testcase_result = json.dumps(judge_output)  # 保存完整的judge_output
-                db.session.commit()
+        worker_app()
+        # 放弃失败任务留在会话中的未提交修改
+        db.session.rollback()
+        task = db.session.get(AnalysisTask, submission_id)
+        if task:
+            task.result = final_result
+            task.stdout = f"Internal error: {str(e)}"
+            task.testcase_result = json.dumps(judge_output)  # 保存完整的judge_output
+            db.session.commit()
         
-        self.update_state(state='FAILURE')
+        if STORE_TASK_RESULTS:
+            self.update_state(state='FAILURE')
         return {
             'status': 'FAILURE',
             'error': str(e),
             'submission_id': submission_id
         }
+
+    finally:
+        if user_id is not None:
+            # 经公平调度放行的提交：释放该用户的在判名额，并放行下一个提交
+            fair_share.complete(user_id, submission_id)
+
+def judge_queue(problem_id: str, kind: str = DEFAULT_KIND) -> str:
+    """
+    判题任务进入的队列
+    :param kind: 提交类型，interactive（网页 / API 提交）或 batch（批量重判等后台任务，见 rejudge.py）；
+                 interactive 提交遇到重题目时改为进入 heavy 队列
+    """
+    if kind not in QUEUES:
+        raise ValueError(f"Unknown queue: {kind}")
+    if kind == DEFAULT_KIND and is_heavy_problem(problem_id):
+        kind = "heavy"
+    return QUEUES[kind]
+
+def is_heavy_problem(problem_id: str) -> bool:
+    """
+    问题配置 "queue" 为 heavy，CPU 时间限制不低于 HEAVY_CPU_TIME，
+    或最长判题耗时超过 interactive 队列的可见性超时（否则判题未完成消息就会被重新投递）
+    """
+    try:
+        config = load_problem_config(problem_id)
+        if config.get("queue") == "heavy":
+            return True
+        cpu_time = problem_limits(config).get("cpu_time")
+        if cpu_time is not None and cpu_time >= HEAVY_CPU_TIME:
+            return True
+        return max_judge_time(problem_id) > VISIBILITY_TIMEOUTS[DEFAULT_KIND]
+    except Exception:
+        return False
+
+def enqueue_judge(submission_id: str, problem_id: str, user_code: str, kind: str = DEFAULT_KIND,
+                  user_id=None, **kwargs):
+    """
+    提交判题任务到对应的队列（取代直接调用 process_judge.delay）
+    启用公平调度时先进入该用户的待判列表，按用户轮转放行（见 fair_share.py）
+    :param kind: 提交类型，见 judge_queue
+    :param user_id: 公平调度的分组键，必须是已认证的用户ID或服务端确定的值（如客户端地址），
+                    不能直接使用请求中客户端填写的字段；为空时直接放行
+    :param kwargs: 传给 process_judge 的其他参数（policy / runtime / language / use_cache）
+    """
+    job = {
+        "submission_id": submission_id,
+        "problem_id": problem_id,
+        "user_code": user_code,
+        "kind": kind,
+        "kwargs": kwargs
+    }
+    if user_id is not None and fair_share_enabled():
+        job["user_id"] = user_id
+        fair_share.submit(job)
+    else:
+        dispatch_judge(job)
+
+def dispatch_judge(job):
+    """把 enqueue_judge 的 job 发送给 Celery（公平调度放行时也调用此函数）"""
+    kwargs = dict(job["kwargs"])
+    if job.get("user_id") is not None:
+        kwargs["user_id"] = job["user_id"]
+    queue = judge_queue(job["problem_id"], job["kind"])
+    return process_judge.apply_async((job["submission_id"], job["problem_id"], job["user_code"]),
+                                     kwargs, queue=queue)
+
+# 在判名额的租约不短于判题队列的可见性超时：process_judge 以 acks_late 运行，一次投递最长判到可见性超时，
+# 租约更短时仍在判的提交会被当作丢失、提前释放名额，该用户的在判提交数超过上限
+FAIR_SHARE_LEASE = max(DEFAULT_LEASE, max(VISIBILITY_TIMEOUTS.values()))
+fair_share = FairShareScheduler(redis_client, enqueue=dispatch_judge, lease=FAIR_SHARE_LEASE)
+
+# 公平调度的定期放行间隔（秒）：放行时发送失败退回待判列表、或在判提交的租约过期后，
+# 即使没有新的提交或判题完成，待判提交也会在下一次定期放行时发出
+FAIR_SHARE_DISPATCH_INTERVAL = float(os.getenv("JUDGE_FAIR_SHARE_INTERVAL", 15))
+if fair_share_enabled():
+    celery.conf.beat_schedule = {
+        "fair-share-dispatch": {
+            "task": "fair_share_dispatch",
+            "schedule": FAIR_SHARE_DISPATCH_INTERVAL,
+            # 积压在队列中的旧触发没有意义，过期丢弃
+            "options": {"expires": FAIR_SHARE_DISPATCH_INTERVAL}
+        }
+    }
+
+@celery.task(name='fair_share_dispatch', ignore_result=True)
+def fair_share_dispatch():
+    """定期放行公平调度中可以放行的提交（由 celery beat 触发，见 judge_queues 的 -B）"""
+    return fair_share.dispatch()
+
+def queue_depths():
+    """
+    各判题队列的积压
+    :return: {类型: {"queue": 队列名, "depth": 等待中的消息数, "in_flight": 已取出未确认的消息数}}，
+             查询失败时 depth / in_flight 为 None
+    """
+    region = celery.conf.broker_transport_options.get("region")
+    depths = {}
+    for kind, queue in QUEUES.items():
+        depth = queue_depth(celery.conf.broker_url, queue, region) or {"depth": None, "in_flight": None}
+        depths[kind] = {"queue": queue, **depth}
+    return depths
@@ -0,0 +1,207 @@
+"""
+问题资源限制校准
+
+在当前硬件上多次运行问题的参考解 app/problems/<id>/reference.py，
+以测得的运行时间与内存为基准，按倍数推导该问题的限制并写入 config.json 的 "limits"。
+更换 Fargate CPU 规格后重新校准，限制随硬件变化，而不是沿用固定的 2 秒。
+
+用法：
+    python -m app.utils.calibrate                  # 校准所有有参考解的问题（只打印）
+    python -m app.utils.calibrate 1 3 --runs 30 --write
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from app.utils.judge import (
+    DEFAULT_EXECUTION_MODE, DEFAULT_LIMITS, DEFAULT_PARALLEL_WORKERS, PROBLEMS_DIR, _problem_dir,
+    compile_submission, evaluate_testcases, evaluate_testcases_batch, evaluate_testcases_parallel,
+    judge_testcases, load_problem_config, load_testcases, submission_program
+)
+
+REFERENCE_FILENAME = "reference.py"
+
+DEFAULT_RUNS = 20
+# 限制 = 倍数 × 参考解的 p95；同时不低于下限，避免解释器启动抖动导致误判
+DEFAULT_TIME_FACTOR = 3.0
+DEFAULT_MEMORY_FACTOR = 2.0
+MIN_WALL_TIME = 1.0
+MIN_CPU_TIME = 0.5
+MIN_MEMORY_MB = 64
+# 输出上限：期望输出的倍数，且不低于 64KB
+OUTPUT_FACTOR = 4
+MIN_OUTPUT_BYTES = 64 * 1024
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def measure_reference(problem_id: str, runs: int = DEFAULT_RUNS) -> Dict:
+    """
+    多次运行参考解的所有用例
+    按问题配置的执行模式走与判题相同的评测路径，时间与峰值内存的测量方式与判题一致（见 zygote.get_spawner_pool）
+    :return: {"wall_ms": [...], "cpu_ms": [...], "max_rss_kb": [...], "max_output_bytes": int}，
+             每个列表元素为一次完整运行中各用例的最大值
+    :raises RuntimeError: 没有参考解或参考解未通过
+    """
+    reference_file = os.path.join(_problem_dir(problem_id), REFERENCE_FILENAME)
+    if not os.path.exists(reference_file):
+        raise RuntimeError(f"No reference solution: {reference_file}")
+    with open(reference_file, 'r') as f:
+        code = f.read()
+    testcases = load_testcases(problem_id)
+    config = load_problem_config(problem_id)
+    mode = config.get("execution_mode", DEFAULT_EXECUTION_MODE)
+    code_obj, syntax_error = compile_submission(code)
+    if syntax_error:
+        raise RuntimeError(f"Reference solution does not compile: {syntax_error}")
+
+    # 测量时放宽限制，避免参考解本身被截断
+    limits = dict(DEFAULT_LIMITS, wall_time=max(DEFAULT_LIMITS["wall_time"], 10), cpu_time=None, memory_mb=None)
+    walls, cpus, rss = [], [], []
+    for _ in range(runs):
+        if mode == "batch":
+            results = evaluate_testcases_batch(code, judge_testcases(testcases), limits=limits)
+        else:
+            with submission_program(code_obj, f"calibrate-{problem_id}") as program:
+                if mode == "parallel":
+                    workers = int(config.get("parallel_workers", DEFAULT_PARALLEL_WORKERS))
+                    results = evaluate_testcases_parallel(code, judge_testcases(testcases), workers,
+                                                          program=program, limits=limits)
+                else:
+                    results = evaluate_testcases(code, judge_testcases(testcases), program=program, limits=limits)
+        run_wall, run_cpu, run_rss = 0.0, 0.0, 0
+        for result in results:
+            if not result["pass"]:
+                raise RuntimeError(
+                    f"Reference solution failed on input {result['input']!r}: "
+                    f"{result['error'] or result['actual']!r}"
+                )
+            stats = result["stats"]
+            run_wall = max(run_wall, stats["wall_ms"])
+            run_cpu = max(run_cpu, stats.get("user_ms", 0) + stats.get("sys_ms", 0))
+            run_rss = max(run_rss, stats.get("max_rss_kb", 0))
+        walls.append(run_wall)
+        cpus.append(run_cpu)
+        rss.append(run_rss)
+
+    return {
+        "wall_ms": walls,
+        "cpu_ms": cpus,
+        "max_rss_kb": rss,
+        "max_output_bytes": max(len(expected.encode()) for _, expected in testcases)
+    }
+
+
+def derive_limits(measured: Dict, time_factor: float = DEFAULT_TIME_FACTOR,
+                  memory_factor: float = DEFAULT_MEMORY_FACTOR) -> Dict:
+    """
+    由测量结果推导限制
+    :return: {"wall_time", "cpu_time", "memory_mb", "output_bytes"}
+    """
+    wall_p95 = _percentile(measured["wall_ms"], 95) / 1000
+    cpu_p95 = _percentile(measured["cpu_ms"], 95) / 1000
+    rss_mb = max(measured["max_rss_kb"]) / 1024
+    return {
+        "wall_time": round(max(wall_p95 * time_factor, MIN_WALL_TIME), 2),
+        "cpu_time": round(max(cpu_p95 * time_factor, MIN_CPU_TIME), 2),
+        "memory_mb": max(math.ceil(rss_mb * memory_factor), MIN_MEMORY_MB),
+        "output_bytes": max(measured["max_output_bytes"] * OUTPUT_FACTOR, MIN_OUTPUT_BYTES)
+    }
+
+
+def hardware_profile() -> Dict:
+    """
+    记录校准时的硬件信息，便于发现规格变化后未重新校准的问题
+    """
+    model = None
+    try:
+        with open("/proc/cpuinfo", 'r') as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {
+        "cpu_model": model or platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version()
+    }
+
+
+def calibrate_problem(problem_id: str, runs: int = DEFAULT_RUNS,
+                      time_factor: float = DEFAULT_TIME_FACTOR,
+                      memory_factor: float = DEFAULT_MEMORY_FACTOR,
+                      write: bool = False) -> Dict:
+    """
+    校准单个问题
+    :param write: 是否把结果写回 config.json（保留其他配置项）
+    :return: {"limits": 推导出的限制, "calibration": 测量摘要}
+    """
+    measured = measure_reference(problem_id, runs)
+    limits = derive_limits(measured, time_factor, memory_factor)
+    calibration = {
+        "runs": runs,
+        "time_factor": time_factor,
+        "memory_factor": memory_factor,
+        "reference_wall_ms_p95": round(_percentile(measured["wall_ms"], 95), 1),
+        "reference_cpu_ms_p95": round(_percentile(measured["cpu_ms"], 95), 1),
+        "reference_max_rss_kb": max(measured["max_rss_kb"]),
+        "hardware": hardware_profile(),
+        "calibrated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    }
+
+    if write:
+        config = load_problem_config(problem_id)
+        config["limits"] = limits
+        config["calibration"] = calibration
+        config_file = os.path.join(_problem_dir(problem_id), 'config.json')
+        with open(config_file, 'w') as f:
+            json.dump(config, f, indent=2)
+            f.write("\n")
+    return {"limits": limits, "calibration": calibration}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate per-problem resource limits from reference solutions")
+    parser.add_argument("problem_ids", nargs="*", help="problems to calibrate (default: all with a reference solution)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--time-factor", type=float, default=DEFAULT_TIME_FACTOR)
+    parser.add_argument("--memory-factor", type=float, default=DEFAULT_MEMORY_FACTOR)
+    parser.add_argument("--write", action="store_true", help="write limits into app/problems/<id>/config.json")
+    args = parser.parse_args(argv)
+
+    problem_ids = args.problem_ids or sorted(
+        (name for name in os.listdir(PROBLEMS_DIR)
+         if os.path.exists(os.path.join(PROBLEMS_DIR, name, REFERENCE_FILENAME))),
+        key=lambda name: (not name.isdigit(), int(name) if name.isdigit() else name)
+    )
+
+    failed = 0
+    for problem_id in problem_ids:
+        try:
+            outcome = calibrate_problem(problem_id, args.runs, args.time_factor,
+                                        args.memory_factor, args.write)
+        except Exception as e:
+            failed += 1
+            print(f"problem {problem_id}: {e}", file=sys.stderr)
+            continue
+        calibration = outcome["calibration"]
+        print(f"problem {problem_id}: {json.dumps(outcome['limits'])} "
+              f"(reference p95 wall={calibration['reference_wall_ms_p95']}ms "
+              f"cpu={calibration['reference_cpu_ms_p95']}ms rss={calibration['reference_max_rss_kb']}KB)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+执行槽：为并发运行的沙箱分配独占的 CPU 核心
+
+同一个 worker 上同时运行多个用例或提交时，它们会争抢相同的核心，计时波动很大。
+执行槽调度器给每个正在运行的沙箱分配一个核心（sched_setaffinity 绑定），
+同时运行的沙箱数不超过参与调度的核心数，多出的执行排队等待空闲核心。
+
+核心的占用通过每个核心一个锁文件（flock）在同一台机器的所有 worker 进程之间协调；
+进程退出时内核自动释放锁，worker 崩溃不会泄漏槽位。
+
+JUDGE_EXEC_SLOTS=1 启用（默认关闭）；JUDGE_EXEC_SLOT_CPUS 指定参与调度的核心，如 "2-7" 或 "0,2,4"，
+默认为当前进程可用的全部核心。
+"""
+import asyncio
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from app.utils import metrics
+
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), "openjudge-slots")
+
+# 没有空闲核心时重新尝试的间隔（秒）；其他 worker 进程释放核心时无法通知本进程，只能轮询
+POLL_INTERVAL = 0.005
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """
+    解析核心列表，格式与 taskset -c 相同
+    :param spec: 如 "0-3,6"
+    :return: [0, 1, 2, 3, 6]
+    """
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def available_cpus() -> List[int]:
+    """
+    当前进程可以使用的核心（受容器 cpuset 限制）
+    """
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def pin_to_cpu(pid: int, cpu: Optional[int]) -> None:
+    """
+    把已启动的子进程绑定到指定核心（与 limit_cpu_time 相同，在启动后设置，不使用 preexec_fn）
+    之后 fork 出的子孙进程继承该绑定
+    """
+    if cpu is None:
+        return
+    try:
+        os.sched_setaffinity(pid, {cpu})
+    except OSError:
+        # 子进程已经退出，或核心已不可用（不绑定，照常运行）
+        pass
+
+
+class ExecutionSlots:
+    """
+    一台机器上的执行槽（线程安全；同一台机器的多个 worker 进程通过锁文件共享）
+    :param cpus: 参与调度的核心
+    :param lock_dir: 锁文件目录，同一台机器上的所有 worker 必须相同
+    """
+
+    def __init__(self, cpus: Sequence[int], lock_dir: str = DEFAULT_LOCK_DIR):
+        if not cpus:
+            raise ValueError("No CPUs available for execution slots")
+        self.cpus = list(cpus)
+        self.lock_dir = lock_dir
+        self.owner_pid = os.getpid()
+        self._lock = threading.Lock()
+        # 本进程占用中的核心 -> 占用开始时间
+        self._busy: Dict[int, float] = {}
+        self._fds: Dict[int, int] = {}
+        # 不同 worker 进程从不同的核心开始查找，减少争抢同一个锁文件
+        self._next = os.getpid() % len(self.cpus)
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def detach(self) -> None:
+        """
+        fork 出的子进程丢弃继承的锁文件 fd（不解锁，锁仍属于父进程）
+        """
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+        self._busy = {}
+
+    def _lock_fd(self, cpu: int) -> int:
+        fd = self._fds.get(cpu)
+        if fd is None:
+            fd = os.open(os.path.join(self.lock_dir, f"cpu{cpu}.lock"),
+                         os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o666)
+            self._fds[cpu] = fd
+        return fd
+
+    def try_acquire(self) -> Optional[int]:
+        """
+        不等待地占用一个空闲核心
+        :return: 核心编号；没有空闲核心时为 None
+        """
+        with self._lock:
+            count = len(self.cpus)
+            for offset in range(count):
+                cpu = self.cpus[(self._next + offset) % count]
+                if cpu in self._busy:
+                    continue
+                try:
+                    fcntl.flock(self._lock_fd(cpu), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._busy[cpu] = time.monotonic()
+                self._next = (self._next + offset + 1) % count
+                return cpu
+        return None
+
+    def release(self, cpu: int) -> None:
+        with self._lock:
+            acquired_at = self._busy.pop(cpu)
+            fcntl.flock(self._fds[cpu], fcntl.LOCK_UN)
+        metrics.incr("exec_slots.busy_ms", int((time.monotonic() - acquired_at) * 1000))
+
+    def _record_wait(self, started: float) -> None:
+        waited_ms = int((time.monotonic() - started) * 1000)
+        metrics.incr("exec_slots.acquired")
+        if waited_ms:
+            metrics.incr("exec_slots.waited")
+            metrics.incr("exec_slots.wait_ms", waited_ms)
+
+    @contextmanager
+    def slot(self) -> Iterator[int]:
+        """
+        占用一个执行槽，没有空闲核心时等待
+        用法：with slots.slot() as cpu: ...
+        """
+        started = time.monotonic()
+        cpu = self.try_acquire()
+        while cpu is None:
+            time.sleep(POLL_INTERVAL)
+            cpu = self.try_acquire()
+        self._record_wait(started)
+        try:
+            yield cpu
+        finally:
+            self.release(cpu)
+
+    @asynccontextmanager
+    async def slot_async(self) -> AsyncIterator[int]:
+        """
+        slot 的 asyncio 版本，等待期间不阻塞事件循环
+        """
+        started = time.monotonic()
+        cpu = self.try_acquire()
+        while cpu is None:
+            await asyncio.sleep(POLL_INTERVAL)
+            cpu = self.try_acquire()
+        self._record_wait(started)
+        try:
+            yield cpu
+        finally:
+            self.release(cpu)
+
+    def stats(self) -> Dict:
+        """
+        :return: 槽位数、本进程与整台机器当前占用的槽位数，以及本进程累计的获取次数、等待与占用时间
+        """
+        with self._lock:
+            in_use = len(self._busy)
+            host_in_use = in_use
+            for cpu in self.cpus:
+                if cpu in self._busy:
+                    continue
+                # 试探其他进程是否占用（立即释放）
+                try:
+                    fcntl.flock(self._lock_fd(cpu), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    host_in_use += 1
+                    continue
+                fcntl.flock(self._fds[cpu], fcntl.LOCK_UN)
+
+        counters = metrics.snapshot()
+        acquired = counters.get("exec_slots.acquired", 0)
+        return {
+            "slots": len(self.cpus),
+            "in_use": in_use,
+            "host_in_use": host_in_use,
+            "occupancy": host_in_use / len(self.cpus),
+            "acquired": acquired,
+            "waited": counters.get("exec_slots.waited", 0),
+            "avg_wait_ms": counters.get("exec_slots.wait_ms", 0) / acquired if acquired else 0.0,
+            "busy_ms": counters.get("exec_slots.busy_ms", 0)
+        }
+
+
+_slots: Optional[ExecutionSlots] = None
+_slots_lock = threading.Lock()
+
+
+def get_execution_slots() -> Optional[ExecutionSlots]:
+    """
+    获取当前进程的执行槽调度器（懒加载）
+    JUDGE_EXEC_SLOTS 为 0（默认）时禁用；fork 出的新 worker 进程重新打开自己的锁文件
+    （继承的 fd 与父进程共享同一把 flock）
+    """
+    global _slots
+    if os.getenv("JUDGE_EXEC_SLOTS", "0") in ("0", "", "false"):
+        return None
+    with _slots_lock:
+        if _slots is None or _slots.owner_pid != os.getpid():
+            if _slots is not None:
+                _slots.detach()
+            cpus = available_cpus()
+            spec = os.getenv("JUDGE_EXEC_SLOT_CPUS")
+            if spec:
+                # 只使用容器内实际可用的核心
+                cpus = [cpu for cpu in parse_cpu_list(spec) if cpu in cpus] or cpus
+            _slots = ExecutionSlots(cpus, lock_dir=os.getenv("JUDGE_EXEC_SLOT_DIR", DEFAULT_LOCK_DIR))
+        return _slots
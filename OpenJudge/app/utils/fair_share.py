@@ -0,0 +1,207 @@
+"""
+按用户公平调度待判提交
+
+某个用户在截止时间前大量提交时会占满队列，其他用户的结果都要排在后面。
+公平调度器位于 submit_judge 与 process_judge 之间，在 Redis 中为每个用户维护待判列表：
+
+    fair_share:pending:<用户>    该用户尚未放行的提交（JSON，先进先出）
+    fair_share:inflight:<用户>   已放行、尚未完成的提交（有序集合，分数为放行时间）
+    fair_share:ring              有待判提交的用户轮转顺序
+    fair_share:active            ring 中的用户集合（去重）
+
+放行时按 ring 轮转：每个用户每轮最多放行一个提交，且同时在判的提交不超过 JUDGE_FAIR_SHARE_INFLIGHT 个；
+判题完成（process_judge 结束）后释放名额并继续放行。放行时间超过租约仍未完成的提交视为丢失（worker 崩溃等），
+不再占用名额；租约取 JUDGE_FAIR_SHARE_LEASE 秒与判题队列可见性超时中的较大值（见 tasks.FAIR_SHARE_LEASE）。
+发送给 Celery 失败的提交退回待判列表；这两种情况都没有新的提交或完成来触发放行，
+由 celery beat 每 JUDGE_FAIR_SHARE_INTERVAL 秒调用一次 dispatch（tasks.fair_share_dispatch）。
+
+队列与名额的修改都在 Lua 脚本中原子执行，多个 web / worker 进程可以同时提交与放行；
+脚本访问的键由用户ID拼出，只适用于单节点 Redis（非集群模式）。
+Redis 不可用时直接放行，不影响判题。JUDGE_FAIR_SHARE=1 启用（默认关闭）。
+"""
+import json
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from app.utils import metrics
+
+KEY_PREFIX = "fair_share:"
+RING_KEY = KEY_PREFIX + "ring"
+ACTIVE_KEY = KEY_PREFIX + "active"
+
+# 每个用户同时在判的提交数上限
+DEFAULT_INFLIGHT_CAP = int(os.getenv("JUDGE_FAIR_SHARE_INFLIGHT", 2))
+# 放行后多久未完成视为丢失（秒）的下限，tasks 中不短于判题队列的可见性超时
+DEFAULT_LEASE = float(os.getenv("JUDGE_FAIR_SHARE_LEASE", 600))
+# 一次放行最多检查的用户数（ring 中名额已满的用户会被跳过）
+MAX_SCAN = 1000
+
+# 加入用户的待判列表；用户原本没有待判提交时加入 ring
+_SUBMIT_SCRIPT = """
+redis.call('RPUSH', KEYS[3], ARGV[2])
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+return redis.call('LLEN', KEYS[3])
+"""
+
+# 沿 ring 找到下一个有待判提交且名额未满的用户，取出其最早的提交并占用名额
+_RELEASE_SCRIPT = """
+local now, lease, cap, scan = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local prefix = ARGV[5]
+local count = math.min(redis.call('LLEN', KEYS[1]), scan)
+for i = 1, count do
+    local user = redis.call('LPOP', KEYS[1])
+    if not user then
+        return nil
+    end
+    local pending = prefix .. 'pending:' .. user
+    local inflight = prefix .. 'inflight:' .. user
+    redis.call('ZREMRANGEBYSCORE', inflight, '-inf', now - lease)
+    if redis.call('LLEN', pending) == 0 then
+        redis.call('SREM', KEYS[2], user)
+    elseif redis.call('ZCARD', inflight) >= cap then
+        redis.call('RPUSH', KEYS[1], user)
+    else
+        local job = redis.call('LPOP', pending)
+        redis.call('ZADD', inflight, now, cjson.decode(job)['submission_id'])
+        redis.call('EXPIRE', inflight, math.ceil(lease))
+        if redis.call('LLEN', pending) > 0 then
+            redis.call('RPUSH', KEYS[1], user)
+        else
+            redis.call('SREM', KEYS[2], user)
+        end
+        return job
+    end
+end
+return nil
+"""
+
+# 放行失败：把提交放回用户待判列表的最前面并归还名额
+_REQUEUE_SCRIPT = """
+redis.call('LPUSH', KEYS[3], ARGV[2])
+redis.call('ZREM', KEYS[4], ARGV[3])
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+
+class FairShareScheduler:
+    """
+    基于 Redis 的按用户公平调度
+    :param client: Redis 客户端（decode_responses=True）
+    :param enqueue: 放行时调用，参数为提交时的 job 字典，负责把任务发给 Celery
+    :param inflight_cap: 每个用户同时在判的提交数上限
+    :param lease: 放行后多久未完成视为丢失（秒）
+    """
+
+    def __init__(self, client, enqueue: Callable[[Dict], None],
+                 inflight_cap: int = DEFAULT_INFLIGHT_CAP, lease: float = DEFAULT_LEASE):
+        self.client = client
+        self.enqueue = enqueue
+        self.inflight_cap = max(1, inflight_cap)
+        self.lease = lease
+        self._submit = client.register_script(_SUBMIT_SCRIPT)
+        self._release = client.register_script(_RELEASE_SCRIPT)
+        self._requeue = client.register_script(_REQUEUE_SCRIPT)
+
+    @staticmethod
+    def _pending_key(user_id) -> str:
+        return f"{KEY_PREFIX}pending:{user_id}"
+
+    @staticmethod
+    def _inflight_key(user_id) -> str:
+        return f"{KEY_PREFIX}inflight:{user_id}"
+
+    def submit(self, job: Dict) -> int:
+        """
+        加入用户的待判列表，并放行当前可以放行的提交
+        :param job: 至少包含 user_id 与 submission_id，其余字段原样交给 enqueue
+        :return: 本次放行的提交数；Redis 不可用时直接放行该提交，返回 1
+        """
+        user_id = str(job["user_id"])
+        try:
+            self._submit(keys=[RING_KEY, ACTIVE_KEY, self._pending_key(user_id)],
+                         args=[user_id, json.dumps(job)])
+        except Exception as e:
+            print(f"[WARN] Fair-share scheduler unavailable, dispatching directly: {e}")
+            metrics.incr("fair_share.bypass")
+            self.enqueue(job)
+            return 1
+        metrics.incr("fair_share.submitted")
+        return self.dispatch()
+
+    def dispatch(self, limit: Optional[int] = None) -> int:
+        """
+        按 ring 轮转放行，直到没有可放行的提交（或达到 limit）
+        :return: 放行的提交数
+        """
+        released = 0
+        while limit is None or released < limit:
+            try:
+                raw = self._release(keys=[RING_KEY, ACTIVE_KEY],
+                                    args=[time.time(), self.lease, self.inflight_cap, MAX_SCAN, KEY_PREFIX])
+            except Exception as e:
+                print(f"[WARN] Fair-share dispatch failed: {e}")
+                break
+            if raw is None:
+                break
+            job = json.loads(raw)
+            try:
+                self.enqueue(job)
+            except Exception as e:
+                print(f"[WARN] Failed to dispatch submission {job['submission_id']}, requeued: {e}")
+                user_id = str(job["user_id"])
+                self._requeue(keys=[RING_KEY, ACTIVE_KEY, self._pending_key(user_id), self._inflight_key(user_id)],
+                              args=[user_id, raw, job["submission_id"]])
+                break
+            released += 1
+        if released:
+            metrics.incr("fair_share.released", released)
+        return released
+
+    def complete(self, user_id, submission_id: str) -> int:
+        """
+        提交判题完成：释放名额并继续放行（重复调用无副作用）
+        :return: 因此放行的提交数
+        """
+        try:
+            self.client.zrem(self._inflight_key(user_id), submission_id)
+        except Exception as e:
+            print(f"[WARN] Fair-share scheduler unavailable: {e}")
+            return 0
+        return self.dispatch()
+
+    def user_stats(self, user_id) -> Dict[str, int]:
+        """
+        :return: 用户待放行与在判的提交数
+        """
+        pipe = self.client.pipeline()
+        pipe.llen(self._pending_key(user_id))
+        pipe.zcount(self._inflight_key(user_id), time.time() - self.lease, "+inf")
+        pending, inflight = pipe.execute()
+        return {"pending": pending, "inflight": inflight}
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: 有待判提交的用户数，以及当前进程累计的提交 / 放行 / 绕过次数
+        """
+        counters = metrics.snapshot()
+        try:
+            users = self.client.scard(ACTIVE_KEY)
+        except Exception:
+            users = None
+        return {
+            "waiting_users": users,
+            "submitted": counters.get("fair_share.submitted", 0),
+            "released": counters.get("fair_share.released", 0),
+            "bypassed": counters.get("fair_share.bypass", 0)
+        }
+
+
+def fair_share_enabled() -> bool:
+    return os.getenv("JUDGE_FAIR_SHARE", "0") not in ("0", "", "false")
+
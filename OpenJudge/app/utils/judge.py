@@ -1,121 +1,1055 @@
 import os
 import json
+import asyncio
+import marshal
 import subprocess
 import tempfile
-import signal
 import sys
-from typing import Dict, List, Optional, Tuple
+import time
+import importlib.util
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from types import CodeType
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from app.utils import metrics
+from app.utils.exec_slots import get_execution_slots, pin_to_cpu
+from app.utils.languages import COMPILE_TIMEOUT, LANGUAGES, build_cache, language_available
+from app.utils.sandbox_io import (
+    MEMORY_LIMIT_EXCEEDED, STOP_EOF, STOP_TIMEOUT, TIME_LIMIT_EXCEEDED, InputSlice, OutputComparator,
+    SandboxGroups, communicate_async, communicate_fds, interpret_outcome, is_out_of_memory, kill_process_group,
+    limit_cpu_time, limit_memory, reap_process_group, rusage_stats, sandbox_groups, stdin_payload, track_sandbox,
+    untrack_sandbox, usage_stats, wait_child
+)
+from app.utils.testcase_bundle import BUNDLE_FILENAME, TestcaseBundle, is_bundle
+from app.utils.testcase_cache import parse_testcases, testcase_cache
+from app.utils.zygote import Zygote, ZygoteError, get_spawner_pool, get_zygote_pool
 
-class TimeoutError(Exception):
-    pass
+# 评测执行模式：process 为每个用例启动一个解释器；parallel 同 process 但多个用例并发执行；
+# batch 为每个提交启动一个 zygote，代码只编译一次，每个用例 fork 一个子进程
+EXECUTION_MODES = ("process", "parallel", "batch")
+DEFAULT_EXECUTION_MODE = "process"
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Code execution timed out")
+# 问题目录 app/problems/<id>/
+PROBLEMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'problems')
 
-def run_code(code: str, input_data: str, timeout: int = 2) -> tuple[Optional[str], Optional[str]]:
+# 判题策略：full 运行全部用例；first_failure 遇到第一个未通过的用例即停止；
+# first_error 只在出现错误时停止。被跳过的用例在 results 中标记 skipped
+JUDGING_POLICIES = ("full", "first_failure", "first_error")
+DEFAULT_JUDGING_POLICY = "full"
+
+# parallel 模式下每个提交最多同时运行的用例数
+DEFAULT_PARALLEL_WORKERS = int(os.getenv("JUDGE_PARALLEL_WORKERS", os.cpu_count() or 1))
+
+# 预编译字节码文件头：magic + flags + 8 字节（直接运行 .pyc 时不校验源文件时间戳）
+PYC_HEADER = importlib.util.MAGIC_NUMBER + b'\x00' * 12
+
+# memfd 代码镜像在子进程中的路径前缀
+MEMFD_PREFIX = "/dev/fd/"
+
+# 异步引擎中单个 worker 进程同时运行的沙箱进程上限
+DEFAULT_ASYNC_CONCURRENCY = int(os.getenv("JUDGE_ASYNC_CONCURRENCY", 32))
+
+# 单个用例 stdout/stderr 各自允许的最大字节数，超过即杀掉子进程并报 output_limit_exceeded
+DEFAULT_OUTPUT_LIMIT = int(os.getenv("JUDGE_OUTPUT_LIMIT", 1 << 20))
+
+# 单个用例的默认资源限制，问题 config.json 中的 "limits" 可逐项覆盖（见 calibrate.py）
+# wall_time / cpu_time 单位为秒，memory_mb 为 MB，output_bytes 为字节；None 表示不限制
+# 时间限制以 CPU 时间为准（不受 worker 负载影响），墙钟时间只是兜底，见 wall_time_limit
+DEFAULT_LIMITS = {
+    "wall_time": float(os.getenv("JUDGE_WALL_TIME_LIMIT", 2)),
+    "cpu_time": float(os.getenv("JUDGE_CPU_TIME_LIMIT", 2)),
+    "memory_mb": None,
+    "output_bytes": DEFAULT_OUTPUT_LIMIT,
+}
+
+# 设置了 CPU 时间限制时，墙钟兜底至少为 CPU 限制的倍数，避免进程只是等待调度就被判超时
+WALL_TIME_FACTOR = float(os.getenv("JUDGE_WALL_TIME_FACTOR", 3))
+
+# 测试用例包中不小于该字节数的输入不解码为字符串，运行时经 sendfile 从文件直接写入子进程的 stdin
+LARGE_INPUT_THRESHOLD = int(os.getenv("JUDGE_SENDFILE_THRESHOLD", 64 * 1024))
+# 判题结果中为这类输入保存的预览长度（字节）
+RESULT_INPUT_PREVIEW = 1024
+
+# 用例输入：字符串，或测试用例包文件中的一段
+TestcaseInput = Union[str, InputSlice]
+
+# 可选的 Python 运行时，问题配置中的 "runtime" 或提交时指定（见 _prepare_submission）
+# command：解释器命令，可用环境变量覆盖
+# time_factor / memory_factor：相对 CPython 的时间与内存限制倍数（限制按 CPython 参考解校准）
+# precompile：能否运行 worker 编译出的 .pyc，只有与 worker 同版本的 CPython 可以；否则每次运行源码
+# 每个运行时有各自的 zygote 池，大小见 zygote.get_zygote_pool
+RUNTIMES = {
+    "cpython": {
+        "command": os.getenv("JUDGE_CPYTHON", "python3"),
+        "time_factor": 1.0,
+        "memory_factor": 1.0,
+        "precompile": True,
+    },
+    # PyPy 的启动与 JIT 预热比 CPython 慢，短程序不一定更快；常驻内存约为 CPython 的两倍
+    "pypy": {
+        "command": os.getenv("JUDGE_PYPY", "pypy3"),
+        "time_factor": float(os.getenv("JUDGE_PYPY_TIME_FACTOR", 1.5)),
+        "memory_factor": float(os.getenv("JUDGE_PYPY_MEMORY_FACTOR", 2.0)),
+        "precompile": False,
+    },
+}
+DEFAULT_RUNTIME = "cpython"
+
+# 提交的语言：python 按 RUNTIMES 运行，其他语言见 languages.LANGUAGES
+DEFAULT_LANGUAGE = "python"
+
+def run_code(code: str, input_data: TestcaseInput, timeout: int = 2,
+             program: Optional[str] = None, expected_output: Optional[str] = None,
+             output_limit: Optional[int] = DEFAULT_OUTPUT_LIMIT) -> tuple[Optional[str], Optional[str]]:
     """
     在沙箱中运行用户代码
     :param code: 用户代码
     :param input_data: 输入数据
     :param timeout: 超时时间（秒）
+    :param program: submission_program 提供的预编译 .pyc 路径，提供时直接运行
+    :param expected_output: 期望输出，提供时边读边比较，输出确定不匹配即杀掉子进程
+    :param output_limit: stdout/stderr 各自的字节上限，超过时杀掉子进程
     :return: (输出结果, 错误信息)
     """
-    with tempfile.NamedTemporaryFile(suffix='.py', mode='w', delete=False) as f:
-        f.write(code)
-        temp_file = f.name
+    actual_output, error, _ = execute_code(code, input_data, timeout, program,
+                                           expected_output, output_limit)
+    return actual_output, error
+
+def execute_code(code: str, input_data: TestcaseInput, timeout: int = 2,
+                 program: Optional[str] = None, expected_output: Optional[str] = None,
+                 output_limit: Optional[int] = DEFAULT_OUTPUT_LIMIT,
+                 cpu_limit: Optional[float] = None,
+                 runtime: str = DEFAULT_RUNTIME,
+                 command: Optional[List[str]] = None,
+                 memory_limit: Optional[float] = None) -> Tuple[Optional[str], Optional[str], Dict]:
+    """
+    与 run_code 相同，额外返回本次执行的资源统计
+    :param cpu_limit: CPU 时间限制（秒），通过 RLIMIT_CPU 由内核强制执行；timeout 只作为墙钟兜底
+    :param memory_limit: 内存限制（MB），通过 RLIMIT_DATA 强制执行（见 sandbox_io.limit_memory）
+    :param runtime: 运行时名称（见 RUNTIMES）；不支持预编译的运行时忽略 program
+    :param command: 其他语言构建好的运行命令（见 languages.BuildCache.build），提供时直接运行，
+                    忽略 code / program / runtime
+    :return: (输出结果, 错误信息, 资源统计)，资源统计见 sandbox_io.usage_stats
+    """
+    spec = RUNTIMES[runtime]
+    if not spec["precompile"]:
+        program = None
+    # 启用了执行槽时先占用一个核心（等待空闲核心的时间不计入超时）
+    with _execution_slot() as cpu:
+        if command is not None:
+            return _run_program(command, input_data, timeout, expected_output, output_limit,
+                                cpu_limit, cpu, memory_limit)
+
+        # 启用了 zygote 池时优先使用预热进程，池不可用时回退到冷启动
+        pool = get_zygote_pool(runtime, spec["command"])
+        if pool is not None:
+            outcome = pool.run(code, input_data, timeout, program=program,
+                               expected_output=expected_output, output_limit=output_limit,
+                               cpu_limit=cpu_limit, cpu=cpu, memory_limit=memory_limit)
+            if outcome is not None:
+                return outcome
+
+        if program:
+            # .pyc 与编译它的解释器版本绑定，因此用当前解释器运行
+            return _run_program([sys.executable, program], input_data, timeout,
+                                expected_output, output_limit, cpu_limit, cpu, memory_limit)
+        with code_image(code.encode(), 'solution.py') as source:
+            return _run_program([spec["command"], source], input_data, timeout,
+                                expected_output, output_limit, cpu_limit, cpu, memory_limit)
+
+def _execution_slot():
+    """
+    占用一个执行槽（见 exec_slots.py），得到要绑定的核心；未启用时为 None
+    用法：with _execution_slot() as cpu: ...（asyncio 中用 async with）
+    """
+    slots = get_execution_slots()
+    return slots.slot() if slots is not None else nullcontext()
+
+def _execution_slot_async():
+    slots = get_execution_slots()
+    return slots.slot_async() if slots is not None else nullcontext()
+
+def _run_program(command: List[str], input_data: TestcaseInput, timeout: int,
+                 expected_output: Optional[str] = None,
+                 output_limit: Optional[int] = None,
+                 cpu_limit: Optional[float] = None,
+                 cpu: Optional[int] = None,
+                 memory_limit: Optional[float] = None) -> Tuple[Optional[str], Optional[str], Dict]:
+    # 优先由 spawner 启动：峰值内存不包含 worker 自身的内存（见 zygote.get_spawner_pool）
+    spawner = get_spawner_pool()
+    if spawner is not None:
+        outcome = spawner.run(None, input_data, timeout, expected_output=expected_output,
+                              output_limit=output_limit, cpu_limit=cpu_limit, cpu=cpu, wait=0,
+                              memory_limit=memory_limit, command=command)
+        if outcome is not None:
+            return outcome
 
+    started = time.monotonic()
+    process = None
     try:
-        # 设置超时处理器
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
-
-        # 运行代码
-        process = subprocess.Popen(
-            ['python3', temp_file],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
+        # 使用原始管道增量读取输出（超时由截止时间控制，不使用进程级的 SIGALRM，可在任意线程调用）
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
         try:
-            stdout, stderr = process.communicate(input=input_data, timeout=timeout)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            return None, "Execution timed out"
+            process = subprocess.Popen(
+                command,
+                stdin=stdin_r,
+                stdout=stdout_w,
+                stderr=stderr_w,
+                pass_fds=_image_fds(command[-1]),
+                # 独立的会话与进程组：用户代码 fork 出的子孙进程可以随沙箱进程一起杀掉
+                start_new_session=True
+            )
+        except Exception:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise
         finally:
-            # 取消超时
-            signal.alarm(0)
-        
-        if process.returncode != 0:
-            return None, stderr.strip()
-        return stdout.strip(), None
-
-    except TimeoutError:
-        return None, "Execution timed out"
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+        track_sandbox(process.pid)
+        limit_cpu_time(process.pid, cpu_limit)
+        limit_memory(process.pid, memory_limit)
+        pin_to_cpu(process.pid, cpu)
+
+        deadline = started + timeout
+        comparator = OutputComparator(expected_output) if expected_output is not None else None
+        outcome = communicate_fds(stdin_w, stdout_r, stderr_r, stdin_payload(input_data), deadline,
+                                  comparator, output_limit, group=process.pid)
+        # 用 wait4 回收子进程以取得 CPU 时间
+        reaped = None
+        try:
+            if outcome["stop"] == STOP_EOF:
+                # 输出管道已关闭，但进程可能仍在运行
+                reaped = wait_child(process.pid, deadline)
+                if reaped is None:
+                    outcome["stop"] = STOP_TIMEOUT
+        finally:
+            if reaped is None:
+                kill_process_group(process.pid)
+                metrics.incr("sandbox.killed")
+                reaped = wait_child(process.pid)
+            process.returncode = reaped[0]
+            untrack_sandbox(process.pid)
+            _reap_sandbox(process.pid)
+
+        returncode, rusage = reaped
+        actual_output, error = interpret_outcome(outcome, returncode)
+        return actual_output, error, rusage_stats(rusage, time.monotonic() - started)
+
     except Exception as e:
-        return None, str(e)
+        return None, str(e), usage_stats(time.monotonic() - started)
+    finally:
+        if process is not None:
+            untrack_sandbox(process.pid)
+
+async def run_code_async(code: str, input_data: TestcaseInput, timeout: int = 2,
+                         program: Optional[str] = None, expected_output: Optional[str] = None,
+                         output_limit: Optional[int] = DEFAULT_OUTPUT_LIMIT) -> tuple[Optional[str], Optional[str]]:
+    """
+    run_code 的 asyncio 版本：基于 asyncio.create_subprocess_exec，每次运行有独立的截止时间，
+    一个事件循环可以同时驱动大量沙箱进程
+    :return: (输出结果, 错误信息)
+    """
+    actual_output, error, _ = await execute_code_async(code, input_data, timeout, program,
+                                                       expected_output, output_limit)
+    return actual_output, error
+
+async def execute_code_async(code: str, input_data: TestcaseInput, timeout: int = 2,
+                             program: Optional[str] = None, expected_output: Optional[str] = None,
+                             output_limit: Optional[int] = DEFAULT_OUTPUT_LIMIT,
+                             cpu_limit: Optional[float] = None,
+                             runtime: str = DEFAULT_RUNTIME,
+                             command: Optional[List[str]] = None,
+                             memory_limit: Optional[float] = None) -> Tuple[Optional[str], Optional[str], Dict]:
+    """
+    execute_code 的 asyncio 版本
+    子进程由 asyncio 的 child watcher 回收，取不到 rusage，资源统计只有墙钟时间；
+    CPU 时间与内存限制仍由 RLIMIT_CPU / RLIMIT_DATA 强制执行
+    :return: (输出结果, 错误信息, 资源统计)
+    """
+    spec = RUNTIMES[runtime]
+    async with _execution_slot_async() as cpu:
+        if command is not None:
+            return await _run_program_async(command, input_data, timeout, expected_output,
+                                            output_limit, cpu_limit, cpu, memory_limit)
+        if program and spec["precompile"]:
+            return await _run_program_async([sys.executable, program], input_data, timeout,
+                                            expected_output, output_limit, cpu_limit, cpu, memory_limit)
+        with code_image(code.encode(), 'solution.py') as source:
+            return await _run_program_async([spec["command"], source], input_data, timeout,
+                                            expected_output, output_limit, cpu_limit, cpu, memory_limit)
+
+async def _run_program_async(command: List[str], input_data: TestcaseInput, timeout: int,
+                             expected_output: Optional[str] = None,
+                             output_limit: Optional[int] = None,
+                             cpu_limit: Optional[float] = None,
+                             cpu: Optional[int] = None,
+                             memory_limit: Optional[float] = None) -> Tuple[Optional[str], Optional[str], Dict]:
+    started = time.monotonic()
+    process = None
+    try:
+        spawn = asyncio.ensure_future(asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=_image_fds(command[-1]),
+            start_new_session=True
+        ))
+        try:
+            process = await asyncio.shield(spawn)
+        except asyncio.CancelledError:
+            # 在启动过程中被取消：等进程创建完成，再由 finally 杀掉并回收
+            process = await spawn
+            raise
+        limit_cpu_time(process.pid, cpu_limit)
+        limit_memory(process.pid, memory_limit)
+        pin_to_cpu(process.pid, cpu)
+
+        comparator = OutputComparator(expected_output) if expected_output is not None else None
+
+        async def communicate() -> Dict:
+            outcome = await communicate_async(process, stdin_payload(input_data), comparator, output_limit)
+            if outcome["stop"] == STOP_EOF:
+                await process.wait()
+            return outcome
+
+        # 沙箱进程退出后立即杀掉残留的子孙进程，避免它们持有输出管道使读取等到超时
+        # （process.wait() 要等管道关闭才返回，因此直接监听 pidfd）
+        loop = asyncio.get_running_loop()
+        try:
+            exit_fd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            exit_fd = None
+
+        def on_exit():
+            loop.remove_reader(exit_fd)
+            kill_process_group(process.pid)
+
+        if exit_fd is not None:
+            loop.add_reader(exit_fd, on_exit)
+        try:
+            outcome = await asyncio.wait_for(communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None, "Execution timed out", usage_stats(time.monotonic() - started)
+        finally:
+            if exit_fd is not None:
+                loop.remove_reader(exit_fd)
+                os.close(exit_fd)
+        actual_output, error = interpret_outcome(outcome, process.returncode)
+        return actual_output, error, usage_stats(time.monotonic() - started)
+
+    except Exception as e:
+        return None, str(e), usage_stats(time.monotonic() - started)
     finally:
-        # 清理临时文件
+        # 超时、输出不匹配/超限或被取消（提前停止）时杀掉整个进程组并回收
+        # 直接发信号而不是 process.kill()：后者内部会 poll() 抢先回收子进程，与 asyncio 的 child watcher 冲突
+        if process is not None:
+            if process.returncode is None:
+                kill_process_group(process.pid)
+                metrics.incr("sandbox.killed")
+                await process.wait()
+            if _sandbox_group_alive(process.pid):
+                # 有残留进程时才需要等待，放到线程中执行，不阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(None, _reap_sandbox, process.pid)
+
+def _sandbox_group_alive(pgid: int) -> bool:
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+def _reap_sandbox(pgid: int) -> int:
+    """
+    沙箱进程回收后清理它的进程组，残留的进程计入 sandbox.leaked
+    :return: 残留的进程数
+    """
+    leaked = reap_process_group(pgid)
+    if leaked:
+        metrics.incr("sandbox.leaked", leaked)
+        print(f"[WARN] Killed {leaked} leaked processes from sandbox {pgid}")
+    return leaked
+
+def sandbox_stats() -> Dict[str, int]:
+    """
+    当前 worker 进程的沙箱进程统计
+    :return: {"killed": 超时/提前停止被杀掉的沙箱进程数, "leaked": 沙箱退出后残留并被清理的子孙进程数}
+    """
+    counters = metrics.snapshot()
+    return {
+        "killed": counters.get("sandbox.killed", 0),
+        "leaked": counters.get("sandbox.leaked", 0)
+    }
+
+@contextmanager
+def code_image(data: bytes, name: str) -> Iterator[str]:
+    """
+    把要运行的代码放进匿名内存文件（memfd），不经过磁盘
+    :param data: 源码或 .pyc 内容
+    :param name: 文件名（仅用于调试，决定临时文件后缀）
+    :return: 子进程可直接运行的路径 /dev/fd/N；不支持 memfd 的平台退回磁盘临时文件
+    """
+    try:
+        fd = os.memfd_create(name)
+    except (AttributeError, OSError):
+        fd = None
+
+    if fd is None:
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1], delete=False) as f:
+            f.write(data)
         try:
-            os.unlink(temp_file)
-        except:
-            pass
+            yield f.name
+        finally:
+            try:
+                os.unlink(f.name)
+            except OSError:
+                pass
+        return
+
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        # 子进程通过 /dev/fd/N 重新打开该文件，偏移量互不影响
+        yield f"{MEMFD_PREFIX}{fd}"
+    finally:
+        os.close(fd)
 
-def read_testcases(file_path: str) -> List[Tuple[str, str]]:
+def _image_fds(path: str) -> Tuple[int, ...]:
+    # memfd 需要以相同的 fd 号传给子进程
+    if path.startswith(MEMFD_PREFIX):
+        return (int(path[len(MEMFD_PREFIX):]),)
+    return ()
+
+def compile_submission(code: str) -> Tuple[Optional[CodeType], Optional[str]]:
+    """
+    编译用户代码（每个提交只编译一次）
+    :param code: 用户代码
+    :return: (代码对象, 错误信息)，语法错误时代码对象为 None，错误信息与解释器输出一致
+    """
+    try:
+        return compile(code, "solution.py", "exec", dont_inherit=True), None
+    except SyntaxError as e:
+        import traceback
+        return None, ''.join(traceback.format_exception_only(type(e), e)).strip()
+    except ValueError as e:
+        # 源码中包含空字符等
+        return None, str(e)
+
+def submission_program(code_obj: CodeType, submission_id: str, runtime: str = DEFAULT_RUNTIME):
+    """
+    把编译好的代码对象写成可直接运行的 .pyc 镜像（memfd），供该提交的所有用例复用
+    运行时不支持预编译时 program 为 None，各用例直接运行源码
+    用法：with submission_program(code_obj, submission_id, runtime) as program: ...
+    """
+    if not RUNTIMES[runtime]["precompile"]:
+        return nullcontext(None)
+    return code_image(PYC_HEADER + marshal.dumps(code_obj), f"{submission_id}.pyc")
+
+def run_code_batch(code: str, inputs: List[TestcaseInput], timeout: int = 2,
+                   expected: Optional[List[str]] = None,
+                   policy: str = DEFAULT_JUDGING_POLICY,
+                   output_limit: Optional[int] = DEFAULT_OUTPUT_LIMIT,
+                   cpu_limit: Optional[float] = None,
+                   runtime: str = DEFAULT_RUNTIME,
+                   memory_limit: Optional[float] = None) -> List[Tuple[Optional[str], Optional[str], Optional[Dict]]]:
+    """
+    为提交单独启动一个 zygote，代码只编译一次，每个用例由 zygote fork 出子进程运行（见 zygote.py）
+    子进程的标准输入输出是 worker 直接读写的管道，判定方式与 process 模式完全相同；
+    zygote 与子进程都拿不到期望输出，也没有可以伪造结果的回传通道
+    :param code: 用户代码
+    :param inputs: 各用例的输入数据（InputSlice 经 sendfile 写入子进程）
+    :param timeout: 单个用例的超时时间（秒）
+    :param expected: 各用例的期望输出，提供时边读边比较；policy 为 first_failure 时必须提供
+    :param policy: 判题策略，非 full 时在满足条件的用例后停止
+    :param output_limit: 单个用例 stdout/stderr 各自的字节上限
+    :param cpu_limit: 单个用例的 CPU 时间限制（秒），由子进程的 RLIMIT_CPU 强制执行
+    :param runtime: 运行 zygote 的运行时（见 RUNTIMES）
+    :param memory_limit: 单个用例的内存限制（MB），由子进程的 RLIMIT_DATA 强制执行
+    :return: 按顺序排列的 (输出结果, 错误信息, 资源统计) 列表；提前停止时比 inputs 短
+    """
+    outcomes = []
+    zygote = None
+    try:
+        # 整个提交占用一个执行槽
+        with _execution_slot() as cpu:
+            for index, input_data in enumerate(inputs):
+                expected_output = expected[index] if expected is not None else None
+                try:
+                    if zygote is None:
+                        zygote = Zygote(RUNTIMES[runtime]["command"])
+                        error = zygote.load(code)
+                        if error is not None:
+                            # 语法错误通常在 worker 中已经发现，这里只处理运行时版本不同的情况
+                            zygote.close()
+                            zygote = None
+                            outcomes.append((None, error, None))
+                            if policy != "full":
+                                break
+                            continue
+                    outcome = zygote.run(None, input_data, timeout, expected_output=expected_output,
+                                         output_limit=output_limit, cpu_limit=cpu_limit, cpu=cpu,
+                                         memory_limit=memory_limit)
+                except ZygoteError as e:
+                    # zygote 异常退出（如被用户代码杀掉）：当前用例记为失败，剩余用例由新的 zygote 继续执行
+                    if zygote is not None:
+                        zygote.close()
+                        zygote = None
+                    outcome = (None, f"Judge harness failed: {e}", None)
+                outcomes.append(outcome)
+                if _batch_should_stop(outcome, expected_output, policy):
+                    break
+    except Exception as e:
+        return outcomes + [(None, str(e), None)] * (len(inputs) - len(outcomes))
+    finally:
+        if zygote is not None:
+            zygote.close()
+    return outcomes
+
+def _batch_should_stop(outcome: Tuple[Optional[str], Optional[str], Optional[Dict]],
+                       expected_output: Optional[str], policy: str) -> bool:
+    # 与 should_stop 相同的判定（资源超限由调用方的 check_limits 判定，不在这里提前停止）
+    actual_output, error, _ = outcome
+    if error:
+        return policy in ("first_failure", "first_error")
+    if policy == "first_failure" and expected_output is not None:
+        return (actual_output or "").strip() != expected_output.strip()
+    return False
+
+def read_testcases(file_path: str) -> Sequence[Tuple[str, str]]:
     """
     读取测试用例文件
-    :param file_path: 测试用例文件路径
-    :return: 测试用例列表，每个用例为 (输入, 期望输出) 的元组
+    :param file_path: 测试用例文件路径（testcases.txt 或二进制测试用例包）
+    :return: 测试用例列表，每个用例为 (输入, 期望输出) 的元组；测试用例包返回按需解码的 TestcaseBundle
+    """
+    try:
+        if is_bundle(file_path):
+            return TestcaseBundle(file_path)
+        with open(file_path, 'rb') as f:
+            return list(parse_testcases(f.read()))
+    except Exception as e:
+        raise Exception(f"Error reading testcases: {str(e)}")
+
+def load_testcases(problem_id: str) -> Sequence[Tuple[str, str]]:
+    """
+    读取问题的测试用例（经过进程内缓存，文件修改后自动重新解析）
+    存在 testcases.bundle 时优先使用测试用例包，否则读取 testcases.txt
+    :param problem_id: 问题ID
+    :return: 不可变的测试用例序列
+    :raises FileNotFoundError: 测试用例文件不存在
     """
-    testcases = []
+    testcases_file = testcases_path(problem_id)
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            for i in range(0, len(lines), 2):
-                if i + 1 < len(lines):
-                    input_data = lines[i].strip()
-                    expected_output = lines[i + 1].strip()
-                    testcases.append((input_data, expected_output))
+        return testcase_cache.get(problem_id, testcases_file)
+    except FileNotFoundError:
+        raise
     except Exception as e:
         raise Exception(f"Error reading testcases: {str(e)}")
+
+def judge_testcases(testcases: Sequence[Tuple[str, str]]) -> Sequence[Tuple[TestcaseInput, str]]:
+    """
+    判题使用的测试用例序列：测试用例包中较大的输入（不小于 LARGE_INPUT_THRESHOLD）以 InputSlice 表示，
+    运行时从文件直接写入子进程，不在 worker 中生成字符串；其他测试用例原样返回
+    """
+    if isinstance(testcases, TestcaseBundle):
+        return testcases.sliced(LARGE_INPUT_THRESHOLD)
     return testcases
 
-def evaluate_testcase(code: str, input_data: str, expected_output: str) -> Dict:
+def result_input(input_data: TestcaseInput) -> Dict:
+    """
+    判题结果中的 "input" 字段：InputSlice 只保存开头 RESULT_INPUT_PREVIEW 字节并标记 input_truncated
+    """
+    if not isinstance(input_data, InputSlice):
+        return {"input": input_data}
+    preview = input_data.read(RESULT_INPUT_PREVIEW)
+    fields = {"input": preview.decode('utf-8', 'ignore')}
+    if input_data.length > len(preview):
+        fields["input_truncated"] = True
+    return fields
+
+def warm_testcase_cache() -> int:
+    """
+    预先加载所有问题的测试用例（worker 进程启动时调用）
+    :return: 加载的问题数
+    """
+    try:
+        problem_ids = sorted(os.listdir(PROBLEMS_DIR))
+    except OSError:
+        return 0
+    return testcase_cache.warm(
+        (problem_id, testcases_path(problem_id))
+        for problem_id in problem_ids
+    )
+
+def problem_fingerprint(problem_id: str, policy: Optional[str] = None,
+                        runtime: Optional[str] = None, language: Optional[str] = None) -> str:
+    """
+    问题的评测指纹：测试用例内容、评测配置、判题策略、运行时与语言的哈希
+    任何一项变化都会得到不同的指纹，用作判题结果缓存键的一部分
+    :raises FileNotFoundError: 测试用例文件不存在
+    """
+    import hashlib
+    digest = testcase_digest(problem_id)
+    config = json.dumps(load_problem_config(problem_id), sort_keys=True)
+    key = f"{digest}\n{config}\n{policy or ''}"
+    if runtime:
+        # 未指定运行时的指纹保持不变，已有的缓存条目继续有效
+        key += f"\n{runtime}"
+    if language and language != DEFAULT_LANGUAGE:
+        key += f"\nlanguage={language}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def testcase_digest(problem_id: str) -> str:
+    """
+    测试用例文件内容的 sha256（十六进制）
+    :raises FileNotFoundError: 测试用例文件不存在
+    """
+    return testcase_cache.digest(problem_id, testcases_path(problem_id))
+
+def testcases_path(problem_id: str) -> str:
+    """
+    问题实际使用的测试用例文件：优先 testcases.bundle，其次 testcases.txt
+    """
+    problem_dir = _problem_dir(problem_id)
+    bundle_file = os.path.join(problem_dir, BUNDLE_FILENAME)
+    if os.path.exists(bundle_file):
+        return bundle_file
+    return os.path.join(problem_dir, 'testcases.txt')
+
+def load_problem_config(problem_id: str) -> Dict:
+    """
+    读取问题的评测配置 app/problems/<id>/config.json（可选）
+    :param problem_id: 问题ID
+    :return: 配置字典，文件不存在时为空字典
+    """
+    config_file = os.path.join(_problem_dir(problem_id), 'config.json')
+    if not os.path.exists(config_file):
+        return {}
+    try:
+        with open(config_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        raise Exception(f"Error reading problem config: {str(e)}")
+
+def _problem_dir(problem_id: str) -> str:
+    # 问题目录路径 - 相对于app目录
+    return os.path.join(PROBLEMS_DIR, str(problem_id))
+
+def evaluate_testcase(code: str, input_data: TestcaseInput, expected_output: str,
+                      program: Optional[str] = None, limits: Optional[Dict] = None,
+                      runtime: str = DEFAULT_RUNTIME, command: Optional[List[str]] = None) -> Dict:
     """
     评测单个测试用例
+    :param limits: 资源限制（见 problem_limits），默认使用 DEFAULT_LIMITS
+    :param runtime: 运行时（见 RUNTIMES），limits 应已按该运行时缩放（见 runtime_limits）
+    :param command: 其他语言构建好的运行命令，见 execute_code
+    """
+    limits = limits or DEFAULT_LIMITS
+    actual_output, error, stats = execute_code(code, input_data, wall_time_limit(limits), program,
+                                               expected_output, limits["output_bytes"],
+                                               limits["cpu_time"], runtime, command, limits["memory_mb"])
+    error = check_limits(stats, limits, error) or error
+    return build_testcase_result(input_data, expected_output, actual_output, error, stats)
+
+def evaluate_testcases(code: str, testcases: Sequence[Tuple[str, str]],
+                       policy: str = DEFAULT_JUDGING_POLICY,
+                       program: Optional[str] = None,
+                       limits: Optional[Dict] = None,
+                       runtime: str = DEFAULT_RUNTIME,
+                       command: Optional[List[str]] = None) -> List[Dict]:
+    """
+    逐个评测测试用例，按判题策略提前停止
+    """
+    results = []
+    for input_data, expected_output in testcases:
+        result = evaluate_testcase(code, input_data, expected_output, program, limits, runtime, command)
+        results.append(result)
+        if should_stop(result, policy):
+            break
+    return _mark_skipped(results, testcases)
+
+def evaluate_testcases_parallel(code: str, testcases: Sequence[Tuple[str, str]],
+                                workers: int = DEFAULT_PARALLEL_WORKERS,
+                                policy: str = DEFAULT_JUDGING_POLICY,
+                                program: Optional[str] = None,
+                                limits: Optional[Dict] = None,
+                                runtime: str = DEFAULT_RUNTIME,
+                                command: Optional[List[str]] = None) -> List[Dict]:
+    """
+    并发评测所有测试用例，结果顺序与 testcases 保持一致
+    使用线程驱动各自的子进程，而不是进程池：Celery prefork 的子进程是 daemon 进程，
+    不能再创建 multiprocessing 子进程，而线程在等待子进程时不占用 GIL
+    """
+    workers = max(1, min(workers, len(testcases)))
+    results = []
+    groups = SandboxGroups()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="judge-case") as executor:
+        futures = [
+            executor.submit(_evaluate_in_groups, groups, code, input_data, expected_output, program, limits,
+                            runtime, command)
+            for input_data, expected_output in testcases
+        ]
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if should_stop(result, policy):
+                # 尚未开始的用例直接取消；已在运行的用例杀掉整个进程组（结果丢弃，与顺序执行一致），
+                # 退出 with 时不必等它们跑到超时
+                for pending in futures[len(results):]:
+                    pending.cancel()
+                killed = groups.stop()
+                if killed:
+                    metrics.incr("sandbox.killed", killed)
+                break
+    return _mark_skipped(results, testcases)
+
+def _evaluate_in_groups(groups: SandboxGroups, *args) -> Dict:
+    # 在线程池中运行 evaluate_testcase，启动的沙箱登记到本次并发评测的 groups
+    token = sandbox_groups.set(groups)
+    try:
+        return evaluate_testcase(*args)
+    finally:
+        sandbox_groups.reset(token)
+
+def evaluate_testcases_batch(code: str, testcases: Sequence[Tuple[str, str]],
+                             policy: str = DEFAULT_JUDGING_POLICY,
+                             limits: Optional[Dict] = None,
+                             runtime: str = DEFAULT_RUNTIME) -> List[Dict]:
+    """
+    批量模式评测所有测试用例，结果与逐个调用 evaluate_testcase 一致
+    （每个用例是 zygote fork 出的子进程，资源统计与内存限制都按用例计算）
+    """
+    limits = limits or DEFAULT_LIMITS
+    outcomes = run_code_batch(
+        code,
+        [input_data for input_data, _ in testcases],
+        timeout=wall_time_limit(limits),
+        expected=[expected_output for _, expected_output in testcases],
+        policy=policy,
+        output_limit=limits["output_bytes"],
+        cpu_limit=limits["cpu_time"],
+        runtime=runtime,
+        memory_limit=limits["memory_mb"]
+    )
+    results = [
+        build_testcase_result(input_data, expected_output, actual_output,
+                              check_limits(stats, limits, error) or error, stats)
+        for (input_data, expected_output), (actual_output, error, stats) in zip(testcases, outcomes)
+    ]
+    return _mark_skipped(results, testcases)
+
+def compile_error_results(testcases: Sequence[Tuple[str, str]], error: str,
+                          policy: str = DEFAULT_JUDGING_POLICY) -> List[Dict]:
+    """
+    代码无法编译时不运行任何用例，直接为每个用例生成与运行时相同的错误结果
+    """
+    results = []
+    for input_data, expected_output in testcases:
+        result = build_testcase_result(input_data, expected_output, None, error)
+        results.append(result)
+        if should_stop(result, policy):
+            break
+    return _mark_skipped(results, testcases)
+
+def problem_limits(config: Dict) -> Dict:
+    """
+    合并问题配置中的 "limits" 与默认限制
+    :param config: load_problem_config 的返回值
+    :return: {"wall_time", "cpu_time", "memory_mb", "output_bytes"}
+    :raises ValueError: 限制不是正数
+    """
+    limits = dict(DEFAULT_LIMITS)
+    for key, value in (config.get("limits") or {}).items():
+        if key not in DEFAULT_LIMITS:
+            continue
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            raise ValueError(f"Invalid limit {key}: {value!r}")
+        limits[key] = value
+    if limits["wall_time"] is None:
+        raise ValueError("wall_time limit is required")
+    return limits
+
+def runtime_limits(limits: Dict, runtime: str) -> Dict:
+    """
+    按运行时的倍数缩放时间与内存限制（输出上限不变）
+    :param limits: problem_limits 的返回值
+    """
+    return _scale_limits(limits, RUNTIMES[runtime])
+
+def language_limits(limits: Dict, language: str) -> Dict:
+    """
+    按语言的倍数缩放时间与内存限制（python 由 runtime_limits 处理）
+    """
+    return _scale_limits(limits, LANGUAGES[language])
+
+def _scale_limits(limits: Dict, spec: Dict) -> Dict:
+    scaled = dict(limits)
+    for key, factor in (("wall_time", spec["time_factor"]), ("cpu_time", spec["time_factor"]),
+                        ("memory_mb", spec["memory_factor"])):
+        if scaled[key] is not None and factor != 1.0:
+            scaled[key] = scaled[key] * factor
+    return scaled
+
+def runtime_available(runtime: str) -> bool:
+    """
+    运行时已注册，且其解释器在当前 worker 上可以找到
+    """
+    return runtime in RUNTIMES and shutil.which(RUNTIMES[runtime]["command"]) is not None
+
+def wall_time_limit(limits: Dict) -> float:
+    """
+    实际使用的墙钟超时：有 CPU 时间限制时取 wall_time 与 cpu_time × WALL_TIME_FACTOR 的较大值
+    """
+    if limits.get("cpu_time") is None:
+        return limits["wall_time"]
+    return max(limits["wall_time"], limits["cpu_time"] * WALL_TIME_FACTOR)
+
+def max_judge_time(problem_id: str) -> float:
+    """
+    一次提交最长的判题耗时（秒）：每个用例都跑到墙钟兜底，按最慢的运行时 / 语言的时间倍数计算，
+    再加一次编译超时；不含等待执行槽的时间
+    :raises FileNotFoundError: 测试用例文件不存在
+    """
+    factor = max(spec["time_factor"] for spec in list(RUNTIMES.values()) + list(LANGUAGES.values()))
+    limits = _scale_limits(problem_limits(load_problem_config(problem_id)),
+                           {"time_factor": factor, "memory_factor": 1.0})
+    return len(load_testcases(problem_id)) * wall_time_limit(limits) + COMPILE_TIMEOUT
+
+def check_limits(stats: Optional[Dict], limits: Dict, error: Optional[str] = None) -> Optional[str]:
+    """
+    根据执行后的资源统计检查 CPU 时间与内存限制
+    超限的判定优先于运行错误：被 RLIMIT_CPU 或墙钟兜底杀掉的进程，只要 CPU 时间已超限就报 time_limit_exceeded；
+    有内存限制时因 RLIMIT_DATA 分配失败（见 sandbox_io.is_out_of_memory）报 memory_limit_exceeded；
+    峰值内存只在统计中有 max_rss_kb 时比较，它是沙箱进程自身的峰值（见 zygote.get_spawner_pool），
+    由 worker 直接启动的进程没有这一项，只按分配失败判定
+    :param error: 本次执行的错误信息
+    :return: 超限时的错误信息，否则为 None
+    """
+    if limits.get("memory_mb") is not None and is_out_of_memory(error):
+        return MEMORY_LIMIT_EXCEEDED
+    if not stats:
+        return None
+    if limits.get("cpu_time") is not None and "user_ms" in stats:
+        if stats["user_ms"] + stats.get("sys_ms", 0) > limits["cpu_time"] * 1000:
+            return TIME_LIMIT_EXCEEDED
+    if limits.get("memory_mb") is not None and "max_rss_kb" in stats:
+        if stats["max_rss_kb"] > limits["memory_mb"] * 1024:
+            return MEMORY_LIMIT_EXCEEDED
+    return None
+
+def should_stop(result: Dict, policy: str) -> bool:
+    """
+    根据判题策略判断评测完该用例后是否停止
+    """
+    if policy == "first_failure":
+        return not result["pass"]
+    if policy == "first_error":
+        return bool(result.get("error"))
+    return False
+
+def _mark_skipped(results: List[Dict], testcases: Sequence[Tuple[str, str]]) -> List[Dict]:
+    # 提前停止时，剩余用例标记为 skipped
+    for input_data, expected_output in testcases[len(results):]:
+        results.append({
+            **result_input(input_data),
+            "expected": expected_output.strip(),
+            "actual": None,
+            "pass": False,
+            "error": None,
+            "skipped": True
+        })
+    return results
+
+def build_testcase_result(input_data: TestcaseInput, expected_output: str,
+                          actual_output: Optional[str], error: Optional[str],
+                          stats: Optional[Dict] = None) -> Dict:
+    """
+    根据运行结果构建单个测试用例的评测结果
+    :param stats: 本次执行的资源统计（CPU/墙钟时间、峰值内存），提供时附加到结果中
     """
-    actual_output, error = run_code(code, input_data)
-    
     if error:
-        return {
-            "input": input_data,
+        result = {
+            **result_input(input_data),
             "expected": expected_output,
             "actual": None,
             "pass": False,
             "error": error
         }
+    else:
+        # 标准化输出（去除首尾空白字符）
+        actual_output = actual_output.strip() if actual_output else ""
+        expected_output = expected_output.strip()
 
-    # 标准化输出（去除首尾空白字符）
-    actual_output = actual_output.strip() if actual_output else ""
-    expected_output = expected_output.strip()
-    
-    return {
-        "input": input_data,
-        "expected": expected_output,
-        "actual": actual_output,
-        "pass": actual_output == expected_output,
-        "error": None
-    }
+        result = {
+            **result_input(input_data),
+            "expected": expected_output,
+            "actual": actual_output,
+            "pass": actual_output == expected_output,
+            "error": None
+        }
+    if stats is not None:
+        result["stats"] = stats
+    return result
 
-def judge_submission(problem_id: str, submission_id: str, user_code: str) -> Dict:
+def judge_submission(problem_id: str, submission_id: str, user_code: str,
+                     mode: Optional[str] = None, policy: Optional[str] = None,
+                     runtime: Optional[str] = None, language: Optional[str] = None) -> Dict:
     """
     判题主函数
     :param problem_id: 问题ID
     :param submission_id: 提交ID
     :param user_code: 用户代码
+    :param mode: 执行模式（process/parallel/batch），默认取问题配置中的 execution_mode
+    :param policy: 判题策略（full/first_failure/first_error），默认取问题配置中的 judging_policy
+    :param runtime: 运行时（见 RUNTIMES），默认取问题配置中的 runtime；只对 python 有效
+    :param language: 提交的语言，默认 python（见 languages.LANGUAGES）
     :return: 判题结果
     """
+    prepared = _prepare_submission(problem_id, submission_id, user_code, mode, policy, runtime, language)
+    if "status" in prepared:
+        return prepared
+    testcases, config = prepared["testcases"], prepared["config"]
+    mode, policy, limits = prepared["mode"], prepared["policy"], prepared["limits"]
+    runtime, language = prepared["runtime"], prepared["language"]
+
+    if language != DEFAULT_LANGUAGE:
+        # 每个提交只构建一次（相同代码直接取缓存），编译错误直接返回，不运行任何用例；
+        # 评测期间锁住构建产物，不会被其他 worker 的缓存淘汰删除
+        with build_cache.acquire(language, user_code) as build:
+            if build["error"] is not None:
+                return summarize_results(compile_error_results(testcases, build["error"], policy))
+            if mode == "parallel":
+                workers = int(config.get("parallel_workers", DEFAULT_PARALLEL_WORKERS))
+                results = evaluate_testcases_parallel(user_code, testcases, workers, policy, None, limits,
+                                                      command=build["command"])
+            else:
+                results = evaluate_testcases(user_code, testcases, policy, None, limits,
+                                             command=build["command"])
+        return summarize_results(results)
+
+    # 只编译一次：语法错误直接返回，不运行任何用例
+    code_obj, syntax_error = compile_submission(user_code)
+
+    # 评测所有测试用例
+    if syntax_error:
+        results = compile_error_results(testcases, syntax_error, policy)
+    elif mode == "batch":
+        results = evaluate_testcases_batch(user_code, testcases, policy, limits, runtime)
+    else:
+        with submission_program(code_obj, submission_id, runtime) as program:
+            if mode == "parallel":
+                workers = int(config.get("parallel_workers", DEFAULT_PARALLEL_WORKERS))
+                results = evaluate_testcases_parallel(user_code, testcases, workers, policy, program,
+                                                      limits, runtime)
+            else:
+                results = evaluate_testcases(user_code, testcases, policy, program, limits, runtime)
+
+    return summarize_results(results)
+
+async def judge_submission_async(problem_id: str, submission_id: str, user_code: str,
+                                 mode: Optional[str] = None, policy: Optional[str] = None,
+                                 semaphore: Optional[asyncio.Semaphore] = None,
+                                 runtime: Optional[str] = None, language: Optional[str] = None) -> Dict:
+    """
+    judge_submission 的 asyncio 版本，返回值相同
+    所有用例并发启动，同时运行的沙箱进程数由 semaphore 限制；多个提交共享同一个
+    semaphore 时，一个 worker 进程即可同时评测多个提交（见 judge_submissions_async）
+    batch 模式在线程中执行同步的 run_code_batch
+    """
+    prepared = _prepare_submission(problem_id, submission_id, user_code, mode, policy, runtime, language)
+    if "status" in prepared:
+        return prepared
+    testcases, mode, policy = prepared["testcases"], prepared["mode"], prepared["policy"]
+    limits, runtime, language = prepared["limits"], prepared["runtime"], prepared["language"]
+
+    command = None
+    build_lease = nullcontext()
+    if language != DEFAULT_LANGUAGE:
+        build_lease = await asyncio.to_thread(build_cache.acquire, language, user_code)
+        build = build_lease.build
+        if build["error"] is not None:
+            build_lease.close()
+            return summarize_results(compile_error_results(testcases, build["error"], policy))
+        command = build["command"]
+        code_obj = None
+    else:
+        code_obj, syntax_error = compile_submission(user_code)
+        if syntax_error:
+            return summarize_results(compile_error_results(testcases, syntax_error, policy))
+    with build_lease:
+        return await _evaluate_async(user_code, submission_id, testcases, mode, policy, limits, runtime,
+                                     command, code_obj, semaphore)
+
+async def _evaluate_async(user_code: str, submission_id: str, testcases: Sequence[Tuple[TestcaseInput, str]],
+                          mode: str, policy: str, limits: Dict, runtime: str, command: Optional[List[str]],
+                          code_obj: Optional[CodeType], semaphore: Optional[asyncio.Semaphore]) -> Dict:
+    # judge_submission_async 准备好之后的评测部分（其他语言的构建产物在此期间保持锁定）
+    if mode == "batch":
+        results = await asyncio.to_thread(evaluate_testcases_batch, user_code, testcases, policy,
+                                          limits, runtime)
+        return summarize_results(results)
+
+    semaphore = semaphore or asyncio.Semaphore(DEFAULT_ASYNC_CONCURRENCY)
+
+    async def evaluate(input_data: TestcaseInput, expected_output: str, program: str) -> Dict:
+        async with semaphore:
+            actual_output, error, stats = await execute_code_async(
+                user_code, input_data, wall_time_limit(limits), program,
+                expected_output, limits["output_bytes"], limits["cpu_time"], runtime, command,
+                limits["memory_mb"]
+            )
+        error = check_limits(stats, limits, error) or error
+        return build_testcase_result(input_data, expected_output, actual_output, error, stats)
+
+    program_image = submission_program(code_obj, submission_id, runtime) if code_obj else nullcontext(None)
+    with program_image as program:
+        tasks = [
+            asyncio.ensure_future(evaluate(input_data, expected_output, program))
+            for input_data, expected_output in testcases
+        ]
+        results = []
+        try:
+            for task in tasks:
+                result = await task
+                results.append(result)
+                if should_stop(result, policy):
+                    break
+        finally:
+            # 提前停止时取消其余用例（run_code_async 会杀掉对应的子进程）
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return summarize_results(_mark_skipped(results, testcases))
+
+async def judge_submissions_async(submissions: List[Tuple[str, str, str]],
+                                  concurrency: int = DEFAULT_ASYNC_CONCURRENCY) -> List[Dict]:
+    """
+    在一个事件循环中同时评测多个提交
+    :param submissions: (问题ID, 提交ID, 用户代码) 列表
+    :param concurrency: 所有提交共享的沙箱进程并发上限
+    :return: 与 submissions 顺序一致的判题结果
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(
+        judge_submission_async(problem_id, submission_id, user_code, semaphore=semaphore)
+        for problem_id, submission_id, user_code in submissions
+    ))
+
+def _prepare_submission(problem_id: str, submission_id: str, user_code: str,
+                        mode: Optional[str], policy: Optional[str],
+                        runtime: Optional[str] = None, language: Optional[str] = None) -> Dict:
+    """
+    校验参数并加载测试用例与问题配置
+    :return: 出错时为可直接返回的判题结果（含 status），否则为
+             {"testcases", "config", "mode", "policy", "limits", "runtime", "language"}，
+             limits 已按运行时（python）或语言缩放
+    """
     if not all([problem_id, submission_id, user_code.strip()]):
         return {
             "status": "err",
@@ -125,47 +1059,136 @@ def judge_submission(problem_id: str, submission_id: str, user_code: str) -> Dic
 
     # 构建问题目录路径 - 相对于app目录
     app_dir = os.path.dirname(os.path.abspath(__file__))
-    problem_dir = os.path.join(app_dir, '..', 'problems', str(problem_id))
-    testcases_file = os.path.join(problem_dir, 'testcases.txt')
+    problem_dir = _problem_dir(problem_id)
+    testcases_file = testcases_path(problem_id)
     
     # 调试信息
     debug_info = {
         "app_dir": app_dir,
         "problem_dir": problem_dir,
         "testcases_file": testcases_file,
-        "file_exists": os.path.exists(testcases_file)
+        "file_exists": True
     }
     
-    if not os.path.exists(testcases_file):
+    # 读取测试用例（进程内缓存）
+    try:
+        testcases = judge_testcases(load_testcases(problem_id))
+        if not testcases:
+            return {
+                "status": "err",
+                "message": "No test cases found",
+                "results": []
+            }
+    except FileNotFoundError:
+        debug_info["file_exists"] = False
         return {
             "status": "err",
             "message": f"Test cases file not found: {testcases_file}",
             "debug": debug_info,
             "results": []
         }
+    except Exception as e:
+        return {
+            "status": "err",
+            "message": str(e),
+            "results": []
+        }
 
-    # 读取测试用例
+    # 确定执行模式与判题策略
     try:
-        testcases = read_testcases(testcases_file)
-        if not testcases:
+        config = load_problem_config(problem_id)
+    except Exception as e:
+        return {
+            "status": "err",
+            "message": str(e),
+            "results": []
+        }
+    mode = mode or config.get("execution_mode", DEFAULT_EXECUTION_MODE)
+    if mode not in EXECUTION_MODES:
+        return {
+            "status": "err",
+            "message": f"Unknown execution mode: {mode}",
+            "results": []
+        }
+
+    policy = policy or config.get("judging_policy", DEFAULT_JUDGING_POLICY)
+    if policy not in JUDGING_POLICIES:
+        return {
+            "status": "err",
+            "message": f"Unknown judging policy: {policy}",
+            "results": []
+        }
+
+    language = language or DEFAULT_LANGUAGE
+    if language != DEFAULT_LANGUAGE:
+        if language not in LANGUAGES:
             return {
                 "status": "err",
-                "message": "No test cases found",
+                "message": f"Unsupported language: {language}",
                 "results": []
             }
-    except Exception as e:
+        if not language_available(language):
+            return {
+                "status": "err",
+                "message": f"Language not available on this worker: {language}",
+                "results": []
+            }
+        try:
+            limits = language_limits(problem_limits(config), language)
+        except ValueError as e:
+            return {
+                "status": "err",
+                "message": str(e),
+                "results": []
+            }
+        # batch 模式依赖 Python zygote，其他语言逐个用例运行
+        return {
+            "testcases": testcases,
+            "config": config,
+            "mode": "process" if mode == "batch" else mode,
+            "policy": policy,
+            "limits": limits,
+            "runtime": DEFAULT_RUNTIME,
+            "language": language
+        }
+
+    runtime = runtime or config.get("runtime", DEFAULT_RUNTIME)
+    if runtime not in RUNTIMES:
+        return {
+            "status": "err",
+            "message": f"Unknown runtime: {runtime}",
+            "results": []
+        }
+    if not runtime_available(runtime):
+        return {
+            "status": "err",
+            "message": f"Runtime not available on this worker: {runtime}",
+            "results": []
+        }
+
+    try:
+        limits = runtime_limits(problem_limits(config), runtime)
+    except ValueError as e:
         return {
             "status": "err",
             "message": str(e),
             "results": []
         }
 
-    # 评测所有测试用例
-    results = []
-    for input_data, expected_output in testcases:
-        result = evaluate_testcase(user_code, input_data, expected_output)
-        results.append(result)
+    return {
+        "testcases": testcases,
+        "config": config,
+        "mode": mode,
+        "policy": policy,
+        "limits": limits,
+        "runtime": runtime,
+        "language": language
+    }
 
+def summarize_results(results: List[Dict]) -> Dict:
+    """
+    根据各用例结果确定整体状态并生成判题输出
+    """
     # 确定整体状态
     if any(r.get('error') for r in results):
         status = "err"
@@ -185,4 +1208,24 @@ def judge_submission(problem_id: str, submission_id: str, user_code: str) -> Dic
     if message:
         output["message"] = message
 
-    return output 
\ No newline at end of file
+    stats = aggregate_stats(results)
+    if stats:
+        output["stats"] = stats
+
+    return output
+
+def aggregate_stats(results: List[Dict]) -> Dict:
+    """
+    汇总所有已运行用例的资源统计
+    :return: {"cpu_time_ms": CPU 时间总和, "wall_time_ms": 墙钟时间总和, "max_rss_kb": 峰值内存最大值}，
+             没有任何统计时为空字典
+    """
+    case_stats = [r["stats"] for r in results if r.get("stats")]
+    if not case_stats:
+        return {}
+    aggregate = {"wall_time_ms": round(sum(s.get("wall_ms", 0) for s in case_stats), 1)}
+    if any("user_ms" in s for s in case_stats):
+        aggregate["cpu_time_ms"] = round(sum(s.get("user_ms", 0) + s.get("sys_ms", 0) for s in case_stats), 1)
+    if any("max_rss_kb" in s for s in case_stats):
+        aggregate["max_rss_kb"] = max(s.get("max_rss_kb", 0) for s in case_stats)
+    return aggregate
@@ -0,0 +1,218 @@
+"""
+判题任务队列
+
+判题任务按提交类型进入不同的队列，避免批量重判或慢题目堵住交互式提交：
+    interactive：网页 / API 的普通提交
+    heavy：重题目（问题配置 "queue": "heavy"，CPU 时间限制不低于 JUDGE_HEAVY_CPU_TIME，
+           或最长判题耗时超过 interactive 队列的可见性超时）
+    batch：批量重判等后台任务（python -m app.utils.rejudge）
+
+worker 按权重为每个队列启动一组进程（python -m app.utils.judge_queues）：
+heavy / batch 的并发数以各自的份额为上限，interactive 队列由所有进程共同消费，
+后台任务占满各自份额时交互式提交仍有专属的进程。
+
+JUDGE_QUEUE_WEIGHTS 设置权重，如 "interactive=2,heavy=1,batch=1"；
+JUDGE_WORKER_CONCURRENCY 为 worker 的总进程数（默认 CPU 核数）。
+启用公平调度（JUDGE_FAIR_SHARE=1）时 interactive 组内嵌 celery beat（-B），定期放行待判提交；
+多个 worker 主机各自运行 beat 只会增加放行的次数，不影响正确性。
+JUDGE_RESULT_WRITER=host 时启动器同时运行本机共享的结果写入进程（见 result_writer），
+先于 worker 启动，所有 worker 退出之后才停止，worker 热关闭期间完成的结果仍能写入。
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from app.utils.fair_share import fair_share_enabled
+
+# 提交类型 -> 队列名（SQS 队列名在账号内全局可见，因此带 judge- 前缀）
+QUEUES = {
+    "interactive": os.getenv("JUDGE_QUEUE_INTERACTIVE", "judge-interactive"),
+    "heavy": os.getenv("JUDGE_QUEUE_HEAVY", "judge-heavy"),
+    "batch": os.getenv("JUDGE_QUEUE_BATCH", "judge-batch"),
+}
+DEFAULT_KIND = "interactive"
+
+# 改为按类型路由之前的默认队列：由 interactive 进程继续消费，部署前已入队的任务不会丢失
+LEGACY_QUEUE = "celery"
+
+DEFAULT_WEIGHTS = "interactive=2,heavy=1,batch=1"
+
+# 各队列的消息可见性超时（秒），须与 sqs.tf 中的 visibility_timeout_seconds 一致
+# process_judge 以 acks_late 运行，判题结束才确认消息：判题时间超过可见性超时时消息会被重新投递、重复判题
+VISIBILITY_TIMEOUTS = {
+    "interactive": int(os.getenv("JUDGE_VISIBILITY_INTERACTIVE", 600)),
+    "heavy": int(os.getenv("JUDGE_VISIBILITY_HEAVY", 1800)),
+    "batch": int(os.getenv("JUDGE_VISIBILITY_BATCH", 1800)),
+}
+
+# CPU 时间限制（秒）不低于该值的问题进入 heavy 队列
+HEAVY_CPU_TIME = float(os.getenv("JUDGE_HEAVY_CPU_TIME", 5))
+
+# kombu Redis 传输为每个优先级额外使用的列表后缀（默认 priority_steps 为 0, 3, 6, 9）
+_REDIS_PRIORITY_SEP = "\x06\x16"
+_REDIS_PRIORITY_STEPS = (3, 6, 9)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """
+    解析队列权重
+    :param spec: 如 "interactive=2,heavy=1,batch=1"，未列出的类型权重为 0
+    :raises ValueError: 未知的类型或非法的权重
+    """
+    weights = {kind: 0.0 for kind in QUEUES}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        kind, _, value = part.partition("=")
+        kind = kind.strip()
+        if kind not in QUEUES:
+            raise ValueError(f"Unknown queue: {kind}")
+        weight = float(value)
+        if weight < 0:
+            raise ValueError(f"Invalid weight for {kind}: {value}")
+        weights[kind] = weight
+    if weights[DEFAULT_KIND] <= 0:
+        raise ValueError("interactive queue must have a positive weight")
+    return weights
+
+
+def queue_concurrency(total: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """
+    按权重把总进程数分给各队列：权重为正的队列至少 1 个进程，余数优先给 interactive
+    :return: {类型: 进程数}，权重为 0 的类型不出现
+    """
+    active = {kind: weight for kind, weight in weights.items() if weight > 0}
+    total = max(total, len(active))
+    share = sum(active.values())
+    counts = {kind: max(1, int(total * weight / share)) for kind, weight in active.items()}
+    # 保证 interactive 之外的份额之和不超过总数
+    counts[DEFAULT_KIND] = max(1, total - sum(n for kind, n in counts.items() if kind != DEFAULT_KIND))
+    return counts
+
+
+def worker_queues(kind: str) -> List[str]:
+    """
+    某一组 worker 进程消费的队列：自己的队列加上 interactive 队列
+    """
+    if kind == DEFAULT_KIND:
+        return [QUEUES[DEFAULT_KIND], LEGACY_QUEUE]
+    return [QUEUES[kind], QUEUES[DEFAULT_KIND]]
+
+
+def worker_commands(total: int, weights: Dict[str, float], app: str = "app.tasks",
+                    extra_args: Optional[List[str]] = None, beat: bool = False) -> List[List[str]]:
+    """
+    每组 worker 的 celery 启动命令
+    :param beat: 在 interactive 组内嵌 celery beat
+    """
+    commands = []
+    for kind, concurrency in queue_concurrency(total, weights).items():
+        commands.append([
+            "celery", "-A", app, "worker",
+            "-Q", ",".join(worker_queues(kind)),
+            "-c", str(concurrency),
+            "-n", f"{kind}@%h",
+            *(["-B"] if beat and kind == DEFAULT_KIND else []),
+            *(extra_args or [])
+        ])
+    return commands
+
+
+def queue_depth(broker_url: str, queue: str, region: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """
+    查询队列中等待的消息数
+    :param broker_url: Celery broker 地址（sqs:// 或 redis://）
+    :param region: SQS 所在区域
+    :return: {"depth": 等待中的消息数, "in_flight": 已取出未确认的消息数（Redis 为 0）}；
+             不支持的 broker 或查询失败时为 None
+    """
+    scheme = urlparse(broker_url).scheme
+    try:
+        if scheme == "sqs":
+            import boto3
+            sqs = boto3.client("sqs", region_name=region)
+            url = sqs.get_queue_url(QueueName=queue)["QueueUrl"]
+            attributes = sqs.get_queue_attributes(
+                QueueUrl=url,
+                AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"]
+            )["Attributes"]
+            return {
+                "depth": int(attributes["ApproximateNumberOfMessages"]),
+                "in_flight": int(attributes["ApproximateNumberOfMessagesNotVisible"])
+            }
+        if scheme in ("redis", "rediss"):
+            import redis
+            client = redis.Redis.from_url(broker_url, socket_connect_timeout=2, socket_timeout=2)
+            keys = [queue] + [f"{queue}{_REDIS_PRIORITY_SEP}{step}" for step in _REDIS_PRIORITY_STEPS]
+            pipe = client.pipeline()
+            for key in keys:
+                pipe.llen(key)
+            return {"depth": sum(pipe.execute()), "in_flight": 0}
+    except Exception as e:
+        print(f"[WARN] Failed to read depth of queue {queue}: {e}")
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Start Celery workers for the judge queues with weighted concurrency")
+    parser.add_argument("--concurrency", type=int,
+                        default=int(os.getenv("JUDGE_WORKER_CONCURRENCY", os.cpu_count() or 1)),
+                        help="total worker processes across all queues")
+    parser.add_argument("--weights", default=os.getenv("JUDGE_QUEUE_WEIGHTS", DEFAULT_WEIGHTS))
+    parser.add_argument("--dry-run", action="store_true", help="print the worker commands and exit")
+    parser.add_argument("celery_args", nargs=argparse.REMAINDER, help="extra arguments passed to every worker")
+    args = parser.parse_args(argv)
+
+    extra_args = [arg for arg in args.celery_args if arg != "--"]
+    commands = worker_commands(args.concurrency, parse_weights(args.weights), extra_args=extra_args,
+                               beat=fair_share_enabled())
+    for command in commands:
+        print(f"[INFO] {' '.join(command)}")
+    writer_command = result_writer_command()
+    if writer_command:
+        print(f"[INFO] {' '.join(writer_command)}")
+    if args.dry_run:
+        return 0
+
+    # 写入进程在单独的进程组中运行（仍在同一会话，worker 才能连接），终端的 Ctrl-C 不会先停掉它
+    writer = subprocess.Popen(writer_command, process_group=0) if writer_command else None
+    processes = [subprocess.Popen(command) for command in commands]
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    # 任意一组 worker（或写入进程）退出时停止其他组，由容器编排重启整个任务
+    while all(process.poll() is None for process in processes) and (writer is None or writer.poll() is None):
+        time.sleep(1)
+    forward(signal.SIGTERM, None)
+    returncode = 0
+    for process in processes:
+        process.wait()
+        returncode = returncode or process.returncode
+    if writer is not None:
+        if writer.poll() is None:
+            writer.terminate()
+        writer.wait()
+    return returncode
+
+
+def result_writer_command() -> Optional[List[str]]:
+    """JUDGE_RESULT_WRITER=host 时本机结果写入进程的启动命令"""
+    if os.getenv("JUDGE_RESULT_WRITER") != "host":
+        return None
+    return [sys.executable, "-m", "app.utils.result_writer"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
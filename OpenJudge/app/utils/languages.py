@@ -0,0 +1,363 @@
+"""
+编译型语言与 JavaScript 的构建
+
+Python 以外的语言先构建出可运行的产物，再由 judge 对每个用例运行同一个产物：
+C / C++ / Java 每个提交只编译一次，JavaScript 只需把源码写入构建目录。
+
+构建产物按内容寻址缓存在本机磁盘上（同一台机器的所有 worker 共享）：
+键为语言、编译/运行命令（含编译选项）、编译器版本与源码的哈希，
+相同代码重新提交或重新判题时直接复用，不再编译。编译器报告的编译错误同样缓存；
+编译超时与编译器无法启动与代码无关（机器繁忙、环境问题），不写入缓存，下次重新编译。
+目录数超过上限时按最近使用时间淘汰。
+判题期间通过 BuildCache.acquire 对条目的 build.json 持有共享锁（flock），淘汰时跳过加锁中的条目，
+不会删除其他 worker 正在运行的产物；淘汰的条目先改名为墓碑目录再删除，其他进程不会看到删了一半的条目。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from app.utils import metrics
+from app.utils.sandbox_io import kill_process_group
+
+# 各语言的构建与运行方式
+# source：源文件名；compile：编译命令（在构建目录中执行，None 表示无需编译）；
+# run：运行命令，{build} 为构建目录的绝对路径
+# time_factor / memory_factor：相对 Python 限制的倍数（与 judge.RUNTIMES 相同的含义）
+LANGUAGES = {
+    "c": {
+        "source": "main.c",
+        "compile": [os.getenv("JUDGE_CC", "gcc"), "-std=c11", "-O2", "-pipe", "-o", "main", "main.c", "-lm"],
+        "run": ["{build}/main"],
+        "time_factor": 1.0,
+        "memory_factor": 1.0,
+    },
+    "cpp": {
+        "source": "main.cpp",
+        "compile": [os.getenv("JUDGE_CXX", "g++"), "-std=c++17", "-O2", "-pipe", "-o", "main", "main.cpp"],
+        "run": ["{build}/main"],
+        "time_factor": 1.0,
+        "memory_factor": 1.0,
+    },
+    # JVM 的启动、JIT 与 GC 线程都计入 CPU 时间
+    "java": {
+        "source": "Main.java",
+        "compile": [os.getenv("JUDGE_JAVAC", "javac"), "-encoding", "UTF-8", "-d", ".", "Main.java"],
+        "run": [os.getenv("JUDGE_JAVA", "java"), "-Xss64m", "-XX:+UseSerialGC", "-cp", "{build}", "Main"],
+        "time_factor": 2.0,
+        "memory_factor": 2.0,
+    },
+    "javascript": {
+        "source": "main.js",
+        "compile": None,
+        "run": [os.getenv("JUDGE_NODE", "node"), "{build}/main.js"],
+        "time_factor": 1.0,
+        "memory_factor": 1.5,
+    },
+}
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "openjudge-builds")
+
+# 缓存的构建目录数上限
+DEFAULT_MAX_ENTRIES = int(os.getenv("JUDGE_BUILD_CACHE_SIZE", 512))
+
+# 单次编译的超时（秒）
+COMPILE_TIMEOUT = float(os.getenv("JUDGE_COMPILE_TIMEOUT", 10))
+
+# 编译错误信息保留的最大字符数
+COMPILE_ERROR_LIMIT = 4096
+
+# 构建目录中记录构建结果的文件
+BUILD_RECORD = "build.json"
+
+# 淘汰时条目先改名为以此开头的墓碑目录再删除
+TOMBSTONE_PREFIX = ".evict-"
+
+# acquire 在条目被淘汰后重新构建的最多次数
+ACQUIRE_ATTEMPTS = 3
+
+# 与代码无关的构建失败（不缓存）
+COMPILE_TIMED_OUT = "Compilation timed out"
+COMPILER_UNAVAILABLE = "Compiler not available"
+
+
+def _compiler_version(command: str) -> str:
+    # 以编译器可执行文件的路径与修改时间代表版本：升级编译器后旧产物自然失效
+    path = shutil.which(command)
+    if path is None:
+        return ""
+    path = os.path.realpath(path)
+    return f"{path}:{os.stat(path).st_mtime_ns}"
+
+
+def build_key(language: str, code: str) -> str:
+    """
+    构建缓存键：语言、编译与运行命令、编译器版本与源码的 sha256
+    """
+    spec = LANGUAGES[language]
+    tool = spec["compile"][0] if spec["compile"] else spec["run"][0]
+    material = json.dumps([language, spec["compile"], spec["run"], _compiler_version(tool)])
+    return hashlib.sha256(f"{material}\n{code}".encode()).hexdigest()
+
+
+def _compile(spec: Dict, build_dir: str) -> Tuple[Optional[str], bool]:
+    """
+    在构建目录中编译
+    :return: (编译错误信息，成功时为 None, 结果能否缓存)；编译超时或编译器无法启动时不能缓存
+    """
+    if spec["compile"] is None:
+        return None, True
+    try:
+        process = subprocess.Popen(
+            spec["compile"],
+            cwd=build_dir,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            # 编译器会启动 cc1 / as / ld 等子进程，超时时整组杀掉
+            start_new_session=True
+        )
+    except OSError as e:
+        return f"{COMPILER_UNAVAILABLE}: {e}", False
+    try:
+        output, _ = process.communicate(timeout=COMPILE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process.pid)
+        process.communicate()
+        return COMPILE_TIMED_OUT, False
+    if process.returncode < 0:
+        # 编译器被信号杀掉（如内存不足时被 OOM killer 杀掉），不是代码本身的错误
+        return f"Compiler killed by signal {-process.returncode}", False
+    if process.returncode != 0:
+        output = output.strip() or f"Compiler exited with code {process.returncode}"
+        return output[:COMPILE_ERROR_LIMIT], True
+    return None, True
+
+
+class BuildLease:
+    """
+    BuildCache.acquire 的返回值：持有构建条目 build.json 的共享锁，关闭前 prune 不会删除该条目
+    用法：with build_cache.acquire(language, code) as build: ...（build 与 BuildCache.build 的返回值相同）
+    """
+
+    def __init__(self, build: Dict, fd: Optional[int] = None):
+        self.build = build
+        self._fd = fd
+
+    def close(self) -> None:
+        if self._fd is not None:
+            # 关闭 fd 即释放 flock
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> Dict:
+        return self.build
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class BuildCache:
+    """
+    按内容寻址的构建产物缓存（线程安全；同一台机器的多个 worker 进程共享目录）
+    每个条目是 <cache_dir>/<键>/ 目录，包含源码、编译产物与 build.json
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def build(self, language: str, code: str) -> Dict:
+        """
+        构建（或从缓存取得）提交的运行命令
+        :param language: LANGUAGES 中的语言
+        :param code: 源码
+        :return: {"command": 运行命令, "error": None} 或 {"command": None, "error": 编译错误信息}；
+                 编译超时等与代码无关的失败额外带有 "transient": True，不写入缓存
+        :raises KeyError: 不支持的语言
+        """
+        return self._entry(language, code)[1]
+
+    def acquire(self, language: str, code: str) -> BuildLease:
+        """
+        构建（或从缓存取得）提交的运行命令，并在使用期间锁住该条目（见 BuildLease）
+        :raises KeyError: 不支持的语言
+        """
+        for _ in range(ACQUIRE_ATTEMPTS):
+            build_dir, build = self._entry(language, code)
+            if build["command"] is None:
+                return BuildLease(build)
+            fd = self._lock_entry(build_dir, fcntl.LOCK_SH)
+            if fd is not None:
+                return BuildLease(build, fd)
+            # 取得锁之前条目刚好被淘汰，重新构建
+        print(f"[WARN] Could not lock build cache entry {build_dir}, running it unlocked")
+        return BuildLease(build)
+
+    def _entry(self, language: str, code: str) -> Tuple[str, Dict]:
+        spec = LANGUAGES[language]
+        key = build_key(language, code)
+        build_dir = os.path.join(self.cache_dir, key)
+
+        record = self._read_record(build_dir)
+        if record is not None:
+            metrics.incr("build_cache.hit")
+            try:
+                # 更新最近使用时间，淘汰时据此排序
+                os.utime(build_dir)
+            except OSError:
+                pass
+        else:
+            metrics.incr("build_cache.miss")
+            record = self._build(spec, code, build_dir)
+
+        if record.get("transient"):
+            return build_dir, {"command": None, "error": record["error"], "transient": True}
+        if record["error"] is not None:
+            metrics.incr("build_cache.compile_error")
+            return build_dir, {"command": None, "error": record["error"]}
+        return build_dir, {"command": [part.replace("{build}", build_dir) for part in spec["run"]], "error": None}
+
+    @staticmethod
+    def _lock_entry(build_dir: str, operation: int) -> Optional[int]:
+        """
+        对条目的 build.json 加 flock
+        :param operation: LOCK_SH（使用中）或 LOCK_EX | LOCK_NB（淘汰）
+        :return: 持有锁的 fd；条目已不存在（已被淘汰）或加锁失败时为 None
+        """
+        path = os.path.join(build_dir, BUILD_RECORD)
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, operation)
+            # 打开之后、加锁之前条目可能已被改名为墓碑：确认路径仍指向同一个文件
+            if os.path.samestat(os.fstat(fd), os.stat(path)):
+                return fd
+        except OSError:
+            pass
+        os.close(fd)
+        return None
+
+    def _read_record(self, build_dir: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(build_dir, BUILD_RECORD), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _build(self, spec: Dict, code: str, build_dir: str) -> Dict:
+        # 在临时目录中构建，完成后整体改名为最终目录：其他进程只会看到完整的条目
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".build-", dir=self.cache_dir)
+        try:
+            with open(os.path.join(staging, spec["source"]), 'w') as f:
+                f.write(code)
+            error, cacheable = _compile(spec, staging)
+            record = {"error": error}
+            if not cacheable:
+                metrics.incr("build_cache.transient_error")
+                return dict(record, transient=True)
+            with open(os.path.join(staging, BUILD_RECORD), 'w') as f:
+                json.dump(record, f)
+            try:
+                os.rename(staging, build_dir)
+            except OSError:
+                # 其他 worker 已经构建了同一个条目，使用已有的
+                existing = self._read_record(build_dir)
+                if existing is not None:
+                    return existing
+                raise
+            staging = None
+        finally:
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+        self.prune()
+        return record
+
+    def prune(self) -> int:
+        """
+        条目数超过上限时删除最久未使用的条目；正在使用（持有共享锁）的条目跳过，由之后的淘汰处理
+        :return: 删除的条目数
+        """
+        with self._lock:
+            try:
+                names = os.listdir(self.cache_dir)
+            except OSError:
+                return 0
+            for name in names:
+                if name.startswith(TOMBSTONE_PREFIX):
+                    # 上次淘汰时进程退出遗留的墓碑
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            names = [name for name in names if not name.startswith(".")]
+            if len(names) <= self.max_entries:
+                return 0
+            entries = []
+            for name in names:
+                try:
+                    entries.append((os.stat(os.path.join(self.cache_dir, name)).st_mtime, name))
+                except OSError:
+                    continue
+            entries.sort()
+            # 只考虑最旧的超出部分：跳过的条目不由更新的条目顶替，缓存暂时超过上限
+            evicted = 0
+            for _, name in entries[:len(entries) - self.max_entries]:
+                if self._evict(os.path.join(self.cache_dir, name)):
+                    evicted += 1
+            if evicted:
+                metrics.incr("build_cache.evict", evicted)
+            return evicted
+
+    def _evict(self, build_dir: str) -> bool:
+        """
+        取得条目的独占锁后改名为墓碑并删除
+        :return: 是否删除；条目正在使用时为 False
+        """
+        fd = self._lock_entry(build_dir, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if fd is None:
+            return False
+        tombstone = os.path.join(self.cache_dir, f"{TOMBSTONE_PREFIX}{uuid.uuid4().hex}")
+        try:
+            os.rename(build_dir, tombstone)
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+        shutil.rmtree(tombstone, ignore_errors=True)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: 当前进程的命中/未命中/编译错误/淘汰计数
+        """
+        counters = metrics.snapshot()
+        return {
+            "hits": counters.get("build_cache.hit", 0),
+            "misses": counters.get("build_cache.miss", 0),
+            "compile_errors": counters.get("build_cache.compile_error", 0),
+            "evictions": counters.get("build_cache.evict", 0)
+        }
+
+
+build_cache = BuildCache(os.getenv("JUDGE_BUILD_CACHE_DIR", DEFAULT_CACHE_DIR))
+
+
+def language_available(language: str) -> bool:
+    """
+    语言已注册，且其编译器与运行命令在当前 worker 上可以找到
+    """
+    spec = LANGUAGES.get(language)
+    if spec is None:
+        return False
+    tools = [spec["run"][0]] + ([spec["compile"][0]] if spec["compile"] else [])
+    return all(tool.startswith("{build}") or shutil.which(tool) is not None for tool in tools)
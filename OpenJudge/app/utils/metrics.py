@@ -0,0 +1,31 @@
+"""
+进程内指标计数
+
+各模块通过 incr 累加计数器（如缓存命中/未命中），snapshot 返回当前所有指标的副本，
+用于日志或调试接口输出。计数只在当前进程内有效，Celery 每个 worker 进程各自统计。
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_counters: Dict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """
+    累加计数器
+    :param name: 指标名，如 testcase_cache.hit
+    :param amount: 增量
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> Dict[str, int]:
+    """
+    获取当前所有指标
+    :return: {指标名: 数值}
+    """
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,107 @@
+"""
+批量重判
+
+修改测试用例、资源限制或判题逻辑之后，把已有的提交重新判题。提交以 batch 类型入队（见 judge_queues），
+只占用 batch 组的 worker 份额，不会堵住交互式提交；重判不经过公平调度。
+
+    python -m app.utils.rejudge --problem 3 --dry-run            # 只统计
+    python -m app.utils.rejudge --problem 3 --result fail --result error
+    python -m app.utils.rejudge --submission <提交ID> --submission <提交ID>
+
+--result 按数据库中保存的结果过滤（见 RESULTS）。
+提交时指定的 runtime 没有保存，重判按问题配置的运行时执行；结果先重置为 pending 再入队。
+重判不读取判题结果缓存（verdict_cache）：缓存键不包含判题逻辑本身，修改判题逻辑后缓存的结果已经过期，
+重判得到的新结果会覆盖缓存。
+"""
+import argparse
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+# 每批重置状态并入队的提交数（一批一个事务）
+DEFAULT_BATCH_SIZE = 200
+
+# analysis_tasks.result 的取值（见 tasks.process_judge 的 status_mapping）；pending 为尚未判完
+RESULTS = ("ok", "fail", "error", "pending")
+
+
+def find_submissions(problem_ids: Sequence[str] = (), results: Sequence[str] = (),
+                     submission_ids: Sequence[str] = (), since: Optional[datetime] = None) -> List[str]:
+    """
+    按条件查找要重判的提交（条件之间为与的关系，未给出的条件不过滤）
+    :return: 按提交时间排序的提交ID
+    """
+    from app.models.analysis_task import AnalysisTask
+
+    query = AnalysisTask.query.with_entities(AnalysisTask.submission_id)
+    if problem_ids:
+        query = query.filter(AnalysisTask.problem_id.in_([str(problem_id) for problem_id in problem_ids]))
+    if results:
+        query = query.filter(AnalysisTask.result.in_(list(results)))
+    if submission_ids:
+        query = query.filter(AnalysisTask.submission_id.in_(list(submission_ids)))
+    if since is not None:
+        query = query.filter(AnalysisTask.created_at >= since)
+    return [row.submission_id for row in query.order_by(AnalysisTask.created_at).all()]
+
+
+def rejudge_submissions(submission_ids: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    把提交重置为 pending 并以 batch 类型重新入队
+    先提交状态再入队：worker 写回的结果不会被随后的重置覆盖
+    :return: {问题ID: 入队的提交数}
+    """
+    from app.models import db
+    from app.models.analysis_task import AnalysisTask
+    from app.tasks import enqueue_judge
+
+    queued = Counter()
+    for start in range(0, len(submission_ids), batch_size):
+        tasks = AnalysisTask.query.filter(
+            AnalysisTask.submission_id.in_(submission_ids[start:start + batch_size])
+        ).all()
+        for task in tasks:
+            task.result = "pending"
+        db.session.commit()
+        for task in tasks:
+            enqueue_judge(task.submission_id, task.problem_id, task.code, kind="batch", language=task.language,
+                          use_cache=False)
+            queued[task.problem_id] += 1
+        print(f"[INFO] Queued {sum(queued.values())}/{len(submission_ids)} submissions for rejudge")
+    return dict(queued)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rejudge existing submissions on the batch queue")
+    parser.add_argument("--problem", action="append", default=[], help="problem ID (repeatable)")
+    parser.add_argument("--result", action="append", default=[], choices=RESULTS,
+                        help="only submissions with this stored result (repeatable)")
+    parser.add_argument("--submission", action="append", default=[], help="submission ID (repeatable)")
+    parser.add_argument("--since-days", type=float, default=None,
+                        help="only submissions created within this many days")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count the submissions that would be rejudged")
+    args = parser.parse_args(argv)
+
+    if not (args.problem or args.submission):
+        parser.error("at least one --problem or --submission is required")
+
+    from app import create_app
+
+    since = None
+    if args.since_days is not None:
+        since = datetime.now(timezone.utc) - timedelta(days=args.since_days)
+
+    with create_app().app_context():
+        submission_ids = find_submissions(args.problem, args.result, args.submission, since)
+        if args.dry_run:
+            print(f"[INFO] {len(submission_ids)} submissions to rejudge")
+            return 0
+        for problem_id, count in sorted(rejudge_submissions(submission_ids, max(1, args.batch_size)).items()):
+            print(f"[INFO] Problem {problem_id}: {count} submissions queued")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
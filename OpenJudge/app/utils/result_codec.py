@@ -0,0 +1,163 @@
+"""
+判题结果的紧凑存储格式
+
+原先每个提交把完整的 judge_output（每个用例都带 input/expected）存两份。
+紧凑格式只保存每个用例的状态，以及未通过用例被截断的实际输出和错误信息：
+
+    {
+        "v": 1,
+        "status": "fail", "message": "...",      # judge_output 中除 results 外的字段原样保留
+        "problem_id": "1",
+        "tc": "测试用例内容哈希前缀",
+        "r": "PPFES",                            # 每个用例一个字符：P 通过 F 未通过 E 错误 S 跳过
+        "d": {"2": {"a": "实际输出"}, "3": {"e": "错误信息"}},
+        "t": [...]                               # 可选：各用例的资源统计
+    }
+
+读取时按用例序号从测试用例文件中取回 input/expected，还原为与旧格式相同的 results。
+没有 "v" 字段的旧数据原样返回。
+"""
+import json
+from typing import Dict, List, Optional, Union
+
+CODEC_VERSION = 1
+
+# 未通过用例保存的实际输出 / 错误信息的最大字符数
+ACTUAL_OUTPUT_LIMIT = 1024
+ERROR_TEXT_LIMIT = 4096
+
+_PASS, _FAIL, _ERROR, _SKIPPED = "P", "F", "E", "S"
+
+
+def _truncate(text: Optional[str], limit: int) -> Dict:
+    if text is None or len(text) <= limit:
+        return {"text": text, "truncated": False}
+    return {"text": text[:limit], "truncated": True}
+
+
+def encode_judge_output(judge_output: Dict, problem_id: str,
+                        testcase_digest: Optional[str] = None) -> Dict:
+    """
+    把 judge_submission 的返回值编码为紧凑格式
+    :param judge_output: 判题结果
+    :param problem_id: 问题ID（读取时据此还原 input/expected）
+    :param testcase_digest: 判题时测试用例文件的哈希，用于发现测试用例已变化的旧结果
+    :return: 紧凑格式的字典
+    """
+    encoded = {key: value for key, value in judge_output.items() if key != "results"}
+    codes = []
+    details = {}
+    stats = []
+    for index, result in enumerate(judge_output.get("results") or []):
+        if result.get("skipped"):
+            codes.append(_SKIPPED)
+        elif result.get("error"):
+            codes.append(_ERROR)
+            error = _truncate(result["error"], ERROR_TEXT_LIMIT)
+            details[str(index)] = {"e": error["text"]}
+            if error["truncated"]:
+                details[str(index)]["et"] = 1
+        elif result.get("pass"):
+            codes.append(_PASS)
+        else:
+            codes.append(_FAIL)
+            actual = _truncate(result.get("actual"), ACTUAL_OUTPUT_LIMIT)
+            details[str(index)] = {"a": actual["text"]}
+            if actual["truncated"]:
+                details[str(index)]["at"] = 1
+        stats.append(result.get("stats"))
+
+    encoded.update({
+        "v": CODEC_VERSION,
+        "problem_id": str(problem_id),
+        "tc": testcase_digest[:16] if testcase_digest else None,
+        "r": "".join(codes),
+        "d": details
+    })
+    if any(s is not None for s in stats):
+        encoded["t"] = stats
+    return encoded
+
+
+def is_compact(stored: Dict) -> bool:
+    return isinstance(stored, dict) and "v" in stored
+
+
+def load_stored_result(raw: Union[str, Dict, None]) -> Optional[Dict]:
+    """
+    解析 testcase_result 列中的值（历史数据是 JSON 字符串）
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        return json.loads(raw)
+    return raw
+
+
+def decode_judge_output(raw: Union[str, Dict, None]) -> Optional[Dict]:
+    """
+    还原为与 judge_submission 返回值相同结构的判题结果（含每个用例的 input/expected）
+    :param raw: testcase_result 列中的值，紧凑格式或旧格式均可
+    :return: 判题结果；测试用例已变化或无法读取时 input/expected 为 None
+    """
+    stored = load_stored_result(raw)
+    if not is_compact(stored):
+        return stored
+
+    output = {
+        key: value for key, value in stored.items()
+        if key not in ("v", "problem_id", "tc", "r", "d", "t")
+    }
+    testcases = _load_testcases(stored.get("problem_id"), stored.get("tc"))
+    stats = stored.get("t") or []
+    details = stored.get("d") or {}
+    from app.utils.judge import result_input
+    results: List[Dict] = []
+    for index, code in enumerate(stored.get("r", "")):
+        if testcases is not None and index < len(testcases):
+            input_data, expected_output = testcases[index]
+            expected_output = expected_output.strip()
+        else:
+            input_data, expected_output = None, None
+        detail = details.get(str(index), {})
+
+        result = {
+            **result_input(input_data),
+            "expected": expected_output,
+            "actual": None,
+            "pass": code == _PASS,
+            "error": None
+        }
+        if code == _PASS:
+            # 通过意味着去除首尾空白后的实际输出与期望输出相同
+            result["actual"] = expected_output
+        elif code == _FAIL:
+            result["actual"] = detail.get("a")
+            if detail.get("at"):
+                result["actual_truncated"] = True
+        elif code == _ERROR:
+            result["error"] = detail.get("e")
+            if detail.get("et"):
+                result["error_truncated"] = True
+        else:
+            result["skipped"] = True
+        if index < len(stats) and stats[index] is not None:
+            result["stats"] = stats[index]
+        results.append(result)
+
+    output["results"] = results
+    return output
+
+
+def _load_testcases(problem_id: Optional[str], digest_prefix: Optional[str]):
+    # 从测试用例缓存读取；测试用例在判题之后被修改时不再对应，放弃还原
+    # 与判题时相同，大输入只还原开头的预览
+    if not problem_id:
+        return None
+    from app.utils.judge import judge_testcases, load_testcases, testcase_digest
+    try:
+        if digest_prefix and not testcase_digest(problem_id).startswith(digest_prefix):
+            return None
+        return judge_testcases(load_testcases(problem_id))
+    except Exception:
+        return None
@@ -0,0 +1,394 @@
+"""
+判题结果的批量写入
+
+每个 process_judge 单独 get + commit 一行 AnalysisTask，高峰时对数据库是每秒数百个小事务。
+结果写入器在 worker 进程内缓冲完成的判题结果，满 N 条或最早的一条等待超过 T 毫秒时，
+由后台线程用一条语句批量写入：
+
+    PostgreSQL / SQLite（3.33+）：WITH v(...) AS (VALUES (...), (...))
+                                 UPDATE analysis_tasks AS t SET ... FROM v WHERE t.submission_id = v.submission_id
+    其他数据库：同一个事务内 executemany
+
+write 阻塞到所在批次提交成功才返回，process_judge 以 acks_late 运行，
+因此消息确认之前结果一定已经落库；批次失败时 write 抛出异常，由调用方回退到逐行写入。
+
+JUDGE_RESULT_WRITER 选择缓冲的范围（默认 0，关闭）：
+    host：本机所有 worker 进程共享一个写入进程（由 judge_queues 启动器随 worker 一起启动，
+          python -m app.utils.result_writer），worker 经 Unix socket 提交结果并等待落库，
+          prefork 池的多个子进程同时完成的结果合并成一批
+    1：每个 worker 进程各自缓冲，只有同一进程内同时有多个任务完成时（threads / gevent 池）才能合并；
+       prefork 池的每个子进程同一时间只运行一个任务，批大小始终为 1
+写入进程只接受与自己同一会话的进程（worker）的连接；沙箱进程都在新的会话中运行，无法提交结果。
+"""
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.utils import metrics
+
+TABLE = "analysis_tasks"
+
+# 写入的列及其在 PostgreSQL VALUES 中的类型（全为 NULL 的列没有类型，必须显式转换）
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("submission_id", "VARCHAR"),
+    ("result", "VARCHAR"),
+    ("testcase_result", "JSON"),
+    ("stdout", "TEXT"),
+    ("cpu_time_ms", "DOUBLE PRECISION"),
+    ("wall_time_ms", "DOUBLE PRECISION"),
+    ("max_rss_kb", "INTEGER"),
+    ("updated_at", "TIMESTAMP"),
+)
+
+# 每批最多写入的行数
+DEFAULT_BATCH_SIZE = int(os.getenv("JUDGE_RESULT_BATCH_SIZE", 50))
+# 第一条结果进入缓冲后最多等待的时间（毫秒）
+DEFAULT_FLUSH_MS = float(os.getenv("JUDGE_RESULT_FLUSH_MS", 20))
+# write 等待落库的最长时间（秒）
+WRITE_TIMEOUT = 30.0
+
+# 本机写入进程监听的 Unix socket
+DEFAULT_SOCKET = os.getenv("JUDGE_RESULT_WRITER_SOCKET",
+                           os.path.join(tempfile.gettempdir(), "openjudge-result-writer.sock"))
+
+
+def bulk_update_sql(count: int, cast: bool = True) -> str:
+    """
+    批量更新语句，参数名为 <列名>_<行号>；VALUES 的列名由 CTE 给出，PostgreSQL 与 SQLite 都能执行
+    :param cast: 是否把参数显式转换为列类型（PostgreSQL 需要；SQLite 不能转换：JSON / TIMESTAMP 按数值亲和性转换会改写值）
+    """
+    rows = ", ".join(
+        "(" + ", ".join(f"CAST(:{name}_{i} AS {sql_type})" if cast else f":{name}_{i}"
+                        for name, sql_type in COLUMNS) + ")"
+        for i in range(count)
+    )
+    assignments = ", ".join(f"{name} = v.{name}" for name, _ in COLUMNS if name != "submission_id")
+    names = ", ".join(name for name, _ in COLUMNS)
+    return (
+        f"WITH v({names}) AS (VALUES {rows}) "
+        f"UPDATE {TABLE} AS t SET {assignments} "
+        f"FROM v WHERE t.submission_id = v.submission_id"
+    )
+
+
+def supports_bulk_update(engine) -> bool:
+    """数据库是否支持 UPDATE ... FROM（SQLite 从 3.33 开始支持）"""
+    if engine.dialect.name == "postgresql":
+        return True
+    if engine.dialect.name == "sqlite":
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 33, 0)
+    return False
+
+
+def single_update_sql() -> str:
+    assignments = ", ".join(f"{name} = :{name}" for name, _ in COLUMNS if name != "submission_id")
+    return f"UPDATE {TABLE} SET {assignments} WHERE submission_id = :submission_id"
+
+
+def _bind_row(row: Dict) -> Dict:
+    # JSON 列与 ORM 写入时相同，按 json.dumps 序列化
+    params = {name: row.get(name) for name, _ in COLUMNS}
+    params["testcase_result"] = json.dumps(params["testcase_result"])
+    return params
+
+
+def _encode_row(row: Dict) -> bytes:
+    # updated_at 是 datetime，经 socket 传输时转换为 ISO 格式
+    data = dict(row)
+    if isinstance(data.get("updated_at"), datetime):
+        data["updated_at"] = data["updated_at"].isoformat()
+    return json.dumps(data).encode() + b"\n"
+
+
+def _decode_row(line: bytes) -> Dict:
+    row = json.loads(line)
+    if row.get("updated_at"):
+        row["updated_at"] = datetime.fromisoformat(row["updated_at"])
+    return row
+
+
+class ResultWriter:
+    """
+    进程内的判题结果批量写入器（线程安全）
+    :param engine: SQLAlchemy 引擎（后台线程直接使用引擎的连接池，不依赖应用上下文）
+    :param batch_size: 每批最多写入的行数
+    :param flush_ms: 第一条结果进入缓冲后最多等待的毫秒数
+    """
+
+    def __init__(self, engine, batch_size: int = DEFAULT_BATCH_SIZE, flush_ms: float = DEFAULT_FLUSH_MS):
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.flush_ms = flush_ms
+        self.owner_pid = os.getpid()
+        self._bulk = supports_bulk_update(engine)
+        self._cast = engine.dialect.name == "postgresql"
+        self._cond = threading.Condition()
+        # (行, Future, 进入缓冲的时间)
+        self._pending: List[Tuple[Dict, Future, float]] = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: Dict) -> Future:
+        """
+        缓冲一条结果
+        :param row: COLUMNS 中各列的值（testcase_result 为写入 JSON 列的值）
+        :return: 所在批次提交后完成的 Future
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Result writer is closed")
+            self._pending.append((row, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def write(self, row: Dict, timeout: float = WRITE_TIMEOUT) -> None:
+        """
+        写入一条结果，阻塞到所在批次提交成功
+        :raises Exception: 批次写入失败或等待超时
+        """
+        self.submit(row).result(timeout)
+
+    def _next_batch(self) -> Optional[List[Tuple[Dict, Future, float]]]:
+        with self._cond:
+            while True:
+                if self._pending:
+                    if len(self._pending) >= self.batch_size or self._closed:
+                        break
+                    remaining = self._pending[0][2] + self.flush_ms / 1000 - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[Dict, Future, float]]) -> None:
+        from sqlalchemy import text
+
+        started = time.monotonic()
+        try:
+            with self.engine.begin() as conn:
+                if self._bulk:
+                    params = {}
+                    for i, (row, _, _) in enumerate(batch):
+                        params.update({f"{name}_{i}": value for name, value in _bind_row(row).items()})
+                    conn.execute(text(bulk_update_sql(len(batch), self._cast)), params)
+                else:
+                    conn.execute(text(single_update_sql()), [_bind_row(row) for row, _, _ in batch])
+        except Exception as e:
+            metrics.incr("result_writer.errors")
+            print(f"[WARN] Result writer failed to flush {len(batch)} rows: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        metrics.incr("result_writer.flushes")
+        metrics.incr("result_writer.rows", len(batch))
+        metrics.incr("result_writer.flush_ms", int((finished - started) * 1000))
+        # 从进入缓冲到落库的等待时间
+        metrics.incr("result_writer.latency_ms", int(sum(finished - queued for _, _, queued in batch) * 1000))
+        for _, future, _ in batch:
+            future.set_result(None)
+
+    def close(self, timeout: float = WRITE_TIMEOUT) -> None:
+        """
+        写完缓冲中的结果后停止后台线程（worker 进程退出时调用）
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        """
+        :return: 当前进程累计的批次数、行数、平均批大小、平均单批写入耗时与平均落库延迟（毫秒）、失败批次数
+        """
+        counters = metrics.snapshot()
+        flushes = counters.get("result_writer.flushes", 0)
+        rows = counters.get("result_writer.rows", 0)
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "flushes": flushes,
+            "rows": rows,
+            "pending": pending,
+            "avg_batch_size": rows / flushes if flushes else 0.0,
+            "avg_flush_ms": counters.get("result_writer.flush_ms", 0) / flushes if flushes else 0.0,
+            "avg_latency_ms": counters.get("result_writer.latency_ms", 0) / rows if rows else 0.0,
+            "errors": counters.get("result_writer.errors", 0)
+        }
+
+
+class HostResultWriterClient:
+    """
+    worker 进程连接本机写入进程的客户端，write 与 ResultWriter.write 相同：阻塞到所在批次提交成功
+    连接在进程内复用，断开后下次写入时重连
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.path = path
+        self.owner_pid = os.getpid()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def write(self, row: Dict, timeout: float = WRITE_TIMEOUT) -> None:
+        """
+        :raises Exception: 写入进程不可用、批次写入失败或等待超时
+        """
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self._sock.settimeout(timeout)
+                    self._sock.connect(self.path)
+                    self._reader = self._sock.makefile('rb')
+                self._sock.settimeout(timeout)
+                self._sock.sendall(_encode_row(row))
+                line = self._reader.readline()
+                if not line:
+                    raise ConnectionError("Result writer closed the connection")
+                reply = json.loads(line)
+            except Exception:
+                self.close()
+                raise
+        if reply.get("error"):
+            raise RuntimeError(reply["error"])
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            finally:
+                self._sock = self._reader = None
+
+
+def _peer_pid(conn: socket.socket) -> int:
+    # SO_PEERCRED：struct ucred {pid, uid, gid}
+    pid, _, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return pid
+
+
+def _serve_connection(conn: socket.socket, writer: ResultWriter) -> None:
+    """一个 worker 进程的连接：逐条读取结果，交给共享的 ResultWriter，落库后回复"""
+    with conn, conn.makefile('rb') as reader:
+        for line in reader:
+            try:
+                writer.write(_decode_row(line))
+                reply = {"ok": True}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            try:
+                conn.sendall(json.dumps(reply).encode() + b"\n")
+            except OSError:
+                return
+
+
+def serve(engine, path: str = DEFAULT_SOCKET) -> None:
+    """
+    本机写入进程的主循环：每个 worker 连接一个线程，所有连接共享一个 ResultWriter
+    只接受与本进程同一会话的进程（judge_queues 启动的 worker）
+    """
+    writer = ResultWriter(engine)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(128)
+    session = os.getsid(0)
+    print(f"[INFO] Result writer listening on {path}")
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                allowed = os.getsid(_peer_pid(conn)) == session
+            except OSError:
+                allowed = False
+            if not allowed:
+                print("[WARN] Result writer rejected a connection from outside the worker session")
+                conn.close()
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, writer), name="result-writer-conn",
+                             daemon=True).start()
+    finally:
+        server.close()
+        writer.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_result_writer(engine):
+    """
+    获取当前进程的结果写入器（懒加载），见模块说明中的 JUDGE_RESULT_WRITER
+    :param engine: 进程内写入器首次创建时使用的 SQLAlchemy 引擎
+    :return: ResultWriter 或 HostResultWriterClient；禁用时为 None
+    """
+    global _writer
+    mode = os.getenv("JUDGE_RESULT_WRITER", "0")
+    if mode in ("0", "", "false"):
+        return None
+    with _writer_lock:
+        if _writer is None or _writer.owner_pid != os.getpid():
+            # fork 出的新 worker 进程创建自己的后台线程 / 连接
+            _writer = HostResultWriterClient() if mode == "host" else ResultWriter(engine)
+        return _writer
+
+
+def close_result_writer() -> None:
+    """
+    写完并关闭当前进程的结果写入器（未创建时什么也不做）
+    """
+    with _writer_lock:
+        if _writer is not None and _writer.owner_pid == os.getpid():
+            _writer.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Shared judge result writer for all worker processes on this host")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+    from app.utils.task_results import database_url
+
+    # 后台线程一次只写一批，一个连接即可
+    engine = create_engine(database_url(), pool_size=1, max_overflow=1, pool_pre_ping=True)
+    try:
+        serve(engine, args.socket)
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
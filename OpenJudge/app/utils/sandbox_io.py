@@ -0,0 +1,595 @@
+"""
+沙箱进程的输入输出处理
+
+增量读取子进程输出并与期望输出流式比较：一旦输出确定不匹配、或超过输出上限，
+立即停止读取，由调用方杀掉子进程，避免无限输出撑爆 worker 内存。
+"""
+import asyncio
+import errno
+import math
+import os
+import resource
+import select
+import signal
+import selectors
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, NamedTuple, Optional, Set, Tuple, Union
+
+# 输出超过上限时的错误信息
+OUTPUT_LIMIT_EXCEEDED = "output_limit_exceeded"
+# CPU 时间超过限制（与墙钟超时 "Execution timed out" 区分）
+TIME_LIMIT_EXCEEDED = "time_limit_exceeded"
+# 峰值内存超过限制
+MEMORY_LIMIT_EXCEEDED = "memory_limit_exceeded"
+
+# 读取结束的原因
+STOP_EOF = "eof"
+STOP_TIMEOUT = "timeout"
+STOP_MISMATCH = "mismatch"
+STOP_OUTPUT_LIMIT = "output_limit"
+
+# str.strip() 会去掉的 ASCII 空白字符
+_WHITESPACE = frozenset(b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f")
+
+CHUNK_SIZE = 65536
+
+# 内存 rlimit 相对内存限制的倍数：RLIMIT_DATA 按已映射的私有可写内存计算，略大于峰值常驻内存，
+# 留出余量避免未超限的程序分配失败；是否超限仍按 rusage 的峰值内存精确判定
+MEMORY_RLIMIT_FACTOR = float(os.getenv("JUDGE_MEMORY_RLIMIT_FACTOR", 1.25))
+
+# 内存分配失败时各运行时输出的错误信息（分配超过 RLIMIT_DATA 时出现）
+_OUT_OF_MEMORY_MARKERS = (
+    "MemoryError", "std::bad_alloc", "java.lang.OutOfMemoryError", "JavaScript heap out of memory"
+)
+
+# 回收沙箱进程组时等待残留进程退出的最长时间（秒）
+GROUP_REAP_TIMEOUT = 1.0
+
+_PR_SET_CHILD_SUBREAPER = 36
+
+
+class InputSlice(NamedTuple):
+    """
+    文件中的一段数据（如测试用例包中某个用例的输入）
+    作为子进程的标准输入时由内核通过 sendfile 直接从文件写入管道，worker 中不生成 Python 字符串
+    """
+    fd: int
+    offset: int
+    length: int
+
+    def read(self, limit: Optional[int] = None) -> bytes:
+        """读取（开头的 limit 字节）内容"""
+        size = self.length if limit is None else min(limit, self.length)
+        return os.pread(self.fd, size, self.offset)
+
+
+def stdin_payload(input_data: Union[str, InputSlice]) -> Union[bytes, InputSlice]:
+    """
+    把用例输入转换为 communicate_fds / communicate_async 接受的形式
+    """
+    if isinstance(input_data, InputSlice):
+        return input_data
+    return input_data.encode()
+
+
+class _StdinFeeder:
+    """
+    向非阻塞的 stdin 管道写入输入：bytes 按块写入，InputSlice 用 sendfile 从文件直接写入
+    """
+
+    def __init__(self, data: Union[bytes, InputSlice]):
+        if isinstance(data, InputSlice):
+            self.source = data
+            self.offset = data.offset
+            self.remaining = data.length
+            self.view = None
+        else:
+            self.source = None
+            self.view = memoryview(data)
+            self.remaining = len(self.view)
+
+    def write(self, fd: int) -> None:
+        try:
+            if self.source is None:
+                written = os.write(fd, self.view[:CHUNK_SIZE])
+                self.view = self.view[written:]
+            else:
+                written = self._sendfile(fd)
+                if not written:
+                    # 文件比索引记录的短（已损坏），不再写入
+                    self.remaining = 0
+                    return
+                self.offset += written
+            self.remaining -= written
+        except BlockingIOError:
+            pass
+        except BrokenPipeError:
+            # 子进程不再读取输入
+            self.remaining = 0
+
+    def _sendfile(self, fd: int) -> int:
+        try:
+            return os.sendfile(fd, self.source.fd, self.offset, self.remaining)
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+        # 不支持 sendfile 写入管道时按块读写，内存占用仍只有一个块
+        return os.write(fd, os.pread(self.source.fd, min(self.remaining, CHUNK_SIZE), self.offset))
+
+
+class OutputComparator:
+    """
+    流式判断 actual.strip() == expected.strip()
+    只有在结果已经确定不相等时才报告不匹配；遇到非 ASCII 的首尾字符（可能是 Unicode 空白）
+    时放弃提前判断，留给最终比较
+    """
+
+    def __init__(self, expected_output: str):
+        self.expected = expected_output.strip().encode()
+        self.pos = 0
+        self.started = False
+        self.undecided = False
+        self.mismatch = False
+        self.after_cr = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        :return: 输出是否已确定与期望不符
+        """
+        if self.mismatch or self.undecided:
+            return self.mismatch
+        for byte in chunk:
+            # 与 decode_output 一致的换行转换：\r\n 和 \r 都视为 \n
+            if byte == 0x0D:
+                byte, self.after_cr = 0x0A, True
+            elif byte == 0x0A and self.after_cr:
+                self.after_cr = False
+                continue
+            else:
+                self.after_cr = False
+            if byte >= 0x80 and (not self.started or self.pos >= len(self.expected)):
+                # 首尾的非 ASCII 字节可能属于 Unicode 空白，无法提前判断
+                self.undecided = True
+                return False
+            if not self.started:
+                if byte in _WHITESPACE:
+                    continue
+                self.started = True
+            if self.pos < len(self.expected):
+                if byte != self.expected[self.pos]:
+                    self.mismatch = True
+                    return True
+                self.pos += 1
+            elif byte not in _WHITESPACE:
+                # 期望输出已全部匹配，之后只允许出现空白
+                self.mismatch = True
+                return True
+        return False
+
+
+def decode_output(data: bytes) -> str:
+    """
+    按文本模式解码子进程输出（统一换行符），与 subprocess 的 text=True 行为一致
+    """
+    return data.decode('utf-8', 'replace').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def communicate_fds(stdin_fd: int, stdout_fd: int, stderr_fd: int,
+                    input_bytes: Union[bytes, InputSlice],
+                    deadline: float, comparator: Optional[OutputComparator] = None,
+                    output_limit: Optional[int] = None, group: Optional[int] = None) -> Dict:
+    """
+    向子进程写入输入并增量读取输出，直到输出管道关闭、超时、输出不匹配或超过上限
+    所有 fd 在返回前关闭
+    :param input_bytes: 输入内容，或文件中的一段（InputSlice，经 sendfile 写入，不读入内存）
+    :param group: 沙箱进程的 pid（即进程组 ID）；沙箱进程退出后立即杀掉进程组中残留的进程，
+                  避免它们继续持有输出管道，使读取一直等到超时
+    :return: {"stdout": bytes, "stderr": bytes, "stop": 结束原因}
+    """
+    chunks = {stdout_fd: [], stderr_fd: []}
+    sizes = {stdout_fd: 0, stderr_fd: 0}
+    feeder = _StdinFeeder(input_bytes)
+    stop = STOP_EOF
+    exit_fd = None
+    if group is not None:
+        try:
+            exit_fd = os.pidfd_open(group)
+        except (AttributeError, OSError):
+            exit_fd = None
+
+    with selectors.DefaultSelector() as sel:
+        if exit_fd is not None:
+            sel.register(exit_fd, selectors.EVENT_READ)
+        if feeder.remaining:
+            os.set_blocking(stdin_fd, False)
+            sel.register(stdin_fd, selectors.EVENT_WRITE)
+        else:
+            os.close(stdin_fd)
+        sel.register(stdout_fd, selectors.EVENT_READ)
+        sel.register(stderr_fd, selectors.EVENT_READ)
+
+        while len(sel.get_map()) > (exit_fd is not None) and stop == STOP_EOF:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                stop = STOP_TIMEOUT
+                break
+            for key, _ in sel.select(remaining):
+                fd = key.fd
+                if fd == exit_fd:
+                    # 沙箱进程已退出（尚未回收）：管道中已有的输出照常读完
+                    sel.unregister(fd)
+                    os.close(fd)
+                    exit_fd = None
+                    kill_process_group(group)
+                    continue
+                if fd == stdin_fd:
+                    feeder.write(fd)
+                    if not feeder.remaining:
+                        sel.unregister(fd)
+                        os.close(fd)
+                    continue
+
+                data = os.read(fd, CHUNK_SIZE)
+                if not data:
+                    sel.unregister(fd)
+                    os.close(fd)
+                    continue
+                chunks[fd].append(data)
+                sizes[fd] += len(data)
+                if output_limit is not None and sizes[fd] > output_limit:
+                    stop = STOP_OUTPUT_LIMIT
+                    break
+                if fd == stdout_fd and comparator is not None and comparator.feed(data):
+                    stop = STOP_MISMATCH
+                    break
+
+        for key in list(sel.get_map().values()):
+            sel.unregister(key.fd)
+            os.close(key.fd)
+
+    return {
+        "stdout": b''.join(chunks[stdout_fd]),
+        "stderr": b''.join(chunks[stderr_fd]),
+        "stop": stop
+    }
+
+
+async def communicate_async(process: asyncio.subprocess.Process,
+                            input_bytes: Union[bytes, InputSlice],
+                            comparator: Optional[OutputComparator] = None,
+                            output_limit: Optional[int] = None) -> Dict:
+    """
+    communicate_fds 的 asyncio 版本（超时由调用方用 wait_for 控制）
+    返回时输出管道可能尚未读完，调用方需要在 stop 不是 eof 时杀掉子进程
+    InputSlice 按块从文件读出后写入（asyncio 的管道 transport 不支持 sendfile），内存占用只有一个块
+    :return: {"stdout": bytes, "stderr": bytes, "stop": 结束原因}
+    """
+    state = {"stop": STOP_EOF}
+    stdout_chunks, stderr_chunks = [], []
+
+    async def feed_stdin():
+        try:
+            if isinstance(input_bytes, InputSlice):
+                offset, end = input_bytes.offset, input_bytes.offset + input_bytes.length
+                while offset < end:
+                    chunk = os.pread(input_bytes.fd, min(CHUNK_SIZE, end - offset), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            elif input_bytes:
+                process.stdin.write(input_bytes)
+                await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def read(stream, chunks, check):
+        size = 0
+        while True:
+            data = await stream.read(CHUNK_SIZE)
+            if not data:
+                return
+            chunks.append(data)
+            size += len(data)
+            if output_limit is not None and size > output_limit:
+                state["stop"] = STOP_OUTPUT_LIMIT
+                return
+            if check and comparator is not None and comparator.feed(data):
+                state["stop"] = STOP_MISMATCH
+                return
+
+    writer = asyncio.ensure_future(feed_stdin())
+    readers = [
+        asyncio.ensure_future(read(process.stdout, stdout_chunks, True)),
+        asyncio.ensure_future(read(process.stderr, stderr_chunks, False)),
+    ]
+    try:
+        pending = set(readers)
+        while pending and state["stop"] == STOP_EOF:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in [writer] + readers:
+            task.cancel()
+        await asyncio.gather(writer, *readers, return_exceptions=True)
+
+    return {
+        "stdout": b''.join(stdout_chunks),
+        "stderr": b''.join(stderr_chunks),
+        "stop": state["stop"]
+    }
+
+
+def interpret_outcome(outcome: Dict, returncode: Optional[int]) -> tuple[Optional[str], Optional[str]]:
+    """
+    把 sandbox_io 的读取结果转换为 (输出结果, 错误信息)
+    :param outcome: communicate_fds / communicate_async 的返回值
+    :param returncode: 子进程退出码
+    """
+    if outcome["stop"] == STOP_TIMEOUT:
+        return None, "Execution timed out"
+    if outcome["stop"] == STOP_OUTPUT_LIMIT:
+        return None, OUTPUT_LIMIT_EXCEEDED
+    if outcome["stop"] == STOP_MISMATCH:
+        # 输出已确定不匹配，子进程被提前杀掉，返回已读到的部分输出
+        return decode_output(outcome["stdout"]).strip(), None
+    if returncode == -signal.SIGXCPU:
+        # 内核在 CPU 时间达到 RLIMIT_CPU 时发送 SIGXCPU
+        return None, TIME_LIMIT_EXCEEDED
+    if returncode != 0:
+        return None, decode_output(outcome["stderr"]).strip()
+    return decode_output(outcome["stdout"]).strip(), None
+
+
+def wait_child(pid: int, deadline: Optional[float] = None) -> Optional[Tuple[int, object]]:
+    """
+    回收子进程并取得它的资源使用情况（wait4）
+    :param pid: 子进程 pid
+    :param deadline: time.monotonic() 截止时间，为 None 时一直等待
+    :return: (退出码, rusage)；到截止时间仍未退出时返回 None
+    """
+    if deadline is None:
+        _, status, rusage = os.wait4(pid, 0)
+        return os.waitstatus_to_exitcode(status), rusage
+
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        while True:
+            reaped, status, rusage = os.wait4(pid, os.WNOHANG)
+            if reaped:
+                return os.waitstatus_to_exitcode(status), rusage
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if pidfd is not None:
+                # 子进程退出时 pidfd 变为可读
+                select.select([pidfd], [], [], remaining)
+            else:
+                time.sleep(min(remaining, 0.005))
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def usage_stats(wall_time: float, user_time: Optional[float] = None,
+                sys_time: Optional[float] = None, max_rss_kb: Optional[int] = None) -> Dict:
+    """
+    单次执行的资源统计（毫秒 / KB），无法取得的项不出现
+    """
+    stats = {"wall_ms": round(wall_time * 1000, 1)}
+    if user_time is not None:
+        stats["user_ms"] = round(user_time * 1000, 1)
+    if sys_time is not None:
+        stats["sys_ms"] = round(sys_time * 1000, 1)
+    if max_rss_kb is not None:
+        stats["max_rss_kb"] = int(max_rss_kb)
+    return stats
+
+
+def rusage_stats(rusage, wall_time: float) -> Dict:
+    """
+    由 wait4 的 rusage 生成资源统计
+    不包含峰值内存：由 worker 直接启动的子进程，ru_maxrss 包含 fork 时从 worker 复制的常驻内存
+    """
+    return usage_stats(wall_time, rusage.ru_utime, rusage.ru_stime)
+
+
+def cpu_rlimit(cpu_time: float) -> Tuple[int, int]:
+    """
+    CPU 时间限制对应的 RLIMIT_CPU (soft, hard)，单位为整秒
+    到达 soft 时内核发送 SIGXCPU，hard 再多 1 秒作为兜底（SIGKILL）；精确判定由 rusage 完成
+    """
+    soft = max(1, math.ceil(cpu_time))
+    return soft, soft + 1
+
+
+def limit_cpu_time(pid: int, cpu_time: Optional[float]) -> None:
+    """
+    给已启动的子进程设置 RLIMIT_CPU
+    RLIMIT_CPU 按进程累计的 CPU 时间计算，启动后立即设置与 exec 前设置效果相同，
+    且不需要 preexec_fn（preexec_fn 会让 subprocess 放弃 vfork 快速路径，并且在多线程中不安全）
+    """
+    if cpu_time is None:
+        return
+    try:
+        resource.prlimit(pid, resource.RLIMIT_CPU, cpu_rlimit(cpu_time))
+    except (ProcessLookupError, PermissionError):
+        # 子进程已经退出
+        pass
+
+
+def memory_rlimit(memory_mb: float) -> Tuple[int, int]:
+    """
+    内存限制（MB）对应的 RLIMIT_DATA (soft, hard)，单位为字节
+    """
+    limit = int(memory_mb * MEMORY_RLIMIT_FACTOR * 1024 * 1024)
+    return limit, limit
+
+
+def limit_memory(pid: int, memory_mb: Optional[float]) -> None:
+    """
+    给已启动的子进程设置 RLIMIT_DATA，超过限制的分配直接失败，而不是等运行结束后才按峰值内存判定
+    使用 RLIMIT_DATA 而不是 RLIMIT_AS：JVM 与 V8 启动时预留大量不提交的地址空间，RLIMIT_AS 会让它们无法启动
+    """
+    if memory_mb is None:
+        return
+    try:
+        resource.prlimit(pid, resource.RLIMIT_DATA, memory_rlimit(memory_mb))
+    except (ProcessLookupError, PermissionError):
+        # 子进程已经退出
+        pass
+
+
+def is_out_of_memory(error: Optional[str]) -> bool:
+    """
+    错误信息是否表示内存分配失败（Python MemoryError、C++ bad_alloc、JVM / V8 内存不足）
+    """
+    return bool(error) and any(marker in error for marker in _OUT_OF_MEMORY_MARKERS)
+
+
+def set_child_subreaper() -> bool:
+    """
+    把当前进程设为 child subreaper（PR_SET_CHILD_SUBREAPER）
+    沙箱进程退出后，它 fork 出的孤儿进程由本进程收养而不是 init，才能被 reap_process_group 回收，
+    不会以僵尸的形式残留
+    :return: 是否设置成功（非 Linux 平台为 False）
+    """
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(_PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def kill_process_group(pgid: int) -> None:
+    """
+    杀掉整个沙箱进程组（沙箱进程以 start_new_session 启动，pid 即进程组 ID）
+    """
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class SandboxGroups:
+    """
+    一次并发评测中正在运行的沙箱进程组，提前停止时一起杀掉（见 judge.evaluate_testcases_parallel）
+    运行沙箱的代码通过 sandbox_groups 找到当前的集合，在启动后登记、回收前注销
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Set[int] = set()
+        self.stopped = False
+
+    def add(self, pgid: int) -> None:
+        with self._lock:
+            if not self.stopped:
+                self._groups.add(pgid)
+                return
+        # 停止之后才启动的沙箱立即杀掉
+        self._kill(pgid)
+
+    def discard(self, pgid: int) -> None:
+        with self._lock:
+            self._groups.discard(pgid)
+
+    def stop(self) -> int:
+        """
+        杀掉所有已登记的进程组，之后登记的进程组也会立即杀掉
+        持锁发送信号：进程组注销（随后被回收）之前不会被杀错
+        :return: 杀掉的进程组数
+        """
+        with self._lock:
+            self.stopped = True
+            for pgid in self._groups:
+                self._kill(pgid)
+            return len(self._groups)
+
+    @staticmethod
+    def _kill(pgid: int) -> None:
+        # zygote 先回复子进程的 pid 再由子进程 setsid，刚启动的子进程可能还没有自己的进程组，因此同时杀掉进程本身
+        try:
+            os.kill(pgid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        kill_process_group(pgid)
+
+
+# 当前线程所属的并发评测（未在并发评测中运行时为 None）
+sandbox_groups: ContextVar[Optional[SandboxGroups]] = ContextVar("sandbox_groups", default=None)
+
+
+def track_sandbox(pgid: int) -> None:
+    """登记刚启动的沙箱进程组（不在并发评测中时什么也不做）"""
+    groups = sandbox_groups.get()
+    if groups is not None:
+        groups.add(pgid)
+
+
+def untrack_sandbox(pgid: int) -> None:
+    groups = sandbox_groups.get()
+    if groups is not None:
+        groups.discard(pgid)
+
+
+def _group_members(pgid: int) -> Dict[int, str]:
+    # 扫描 /proc 找出进程组中的进程：{pid: 状态}，只在进程组有残留时调用
+    members = {}
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return members
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能含空格与括号，从最后一个 ')' 之后解析：状态 ppid pgrp ...
+        fields = stat[stat.rindex(b')') + 2:].split()
+        if int(fields[2]) == pgid:
+            members[int(name)] = fields[0].decode()
+    return members
+
+
+def reap_process_group(pgid: int, timeout: float = GROUP_REAP_TIMEOUT) -> int:
+    """
+    清理沙箱进程组：杀掉用户代码 fork 出、在沙箱进程退出后仍残留的子孙进程，并回收其中已成为本进程
+    子进程的僵尸（需要先调用 set_child_subreaper）
+    必须在沙箱进程本身被回收之后调用；进程组为空时只需一次系统调用
+    :param pgid: 进程组 ID（沙箱进程的 pid）
+    :param timeout: 等待残留进程退出的最长时间（秒）
+    :return: 残留的进程数
+    """
+    try:
+        os.killpg(pgid, 0)
+    except (ProcessLookupError, PermissionError):
+        return 0
+
+    leaked = len(_group_members(pgid))
+    kill_process_group(pgid)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            while os.waitpid(-pgid, os.WNOHANG)[0]:
+                pass
+        except ChildProcessError:
+            pass
+        # 不属于本进程的僵尸由其父进程（或 init）回收，不再等待
+        if all(state == 'Z' for state in _group_members(pgid).values()):
+            break
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.001)
+    return leaked
+
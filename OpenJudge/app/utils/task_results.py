@@ -0,0 +1,131 @@
+"""
+Celery 任务结果的存储开关与清理
+
+判题结果由 process_judge 写入 analysis_tasks，Celery 的结果后端（同一个 PostgreSQL 的 celery_taskmeta 表）
+保存的是同一份结果的副本，没有任何地方读取。默认 process_judge 不再写结果后端（ignore_result），
+返回值也只保留提交ID与判题状态；JUDGE_STORE_TASK_RESULTS=1 恢复写入（仍为精简的返回值）。
+
+关闭写入之前积累的 celery_taskmeta 行用本模块清理，按批删除，避免长时间锁表：
+    python -m app.utils.task_results --dry-run          # 只统计
+    python -m app.utils.task_results --older-than-days 1 --vacuum
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Celery 数据库结果后端的默认表名
+TASK_TABLE = "celery_taskmeta"
+GROUP_TABLE = "celery_tasksetmeta"
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def store_task_results() -> bool:
+    """是否把 process_judge 的返回值写入 Celery 结果后端（默认不写）"""
+    return os.getenv("JUDGE_STORE_TASK_RESULTS", "0") not in ("0", "", "false")
+
+
+def database_url(url: Optional[str] = None) -> str:
+    """
+    清理使用的 SQLAlchemy 地址：与结果后端相同的数据库（去掉 Celery 的 db+ 前缀）
+    """
+    url = url or os.environ.get("DATABASE_URL", "")
+    if url.startswith("db+"):
+        url = url[len("db+"):]
+    if not url:
+        raise ValueError("DATABASE_URL is not set")
+    return url
+
+
+def count_task_results(engine, before: datetime) -> Dict[str, Optional[int]]:
+    """
+    :return: {表名: date_done 早于 before 的行数}，表不存在时为 None
+    """
+    from sqlalchemy import inspect, text
+
+    existing = set(inspect(engine).get_table_names())
+    counts = {}
+    with engine.connect() as conn:
+        for table in (TASK_TABLE, GROUP_TABLE):
+            if table not in existing:
+                counts[table] = None
+                continue
+            counts[table] = conn.execute(
+                text(f"SELECT COUNT(*) FROM {table} WHERE date_done < :before"), {"before": before}
+            ).scalar()
+    return counts
+
+
+def purge_task_results(engine, before: datetime, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    删除 date_done 早于 before 的任务结果，每批一个事务
+    :return: {表名: 删除的行数}
+    """
+    from sqlalchemy import inspect, text
+
+    existing = set(inspect(engine).get_table_names())
+    deleted = {}
+    for table in (TASK_TABLE, GROUP_TABLE):
+        deleted[table] = 0
+        if table not in existing:
+            continue
+        statement = text(
+            f"DELETE FROM {table} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE date_done < :before LIMIT :limit)"
+        )
+        while True:
+            with engine.begin() as conn:
+                count = conn.execute(statement, {"before": before, "limit": batch_size}).rowcount
+            deleted[table] += count
+            if count < batch_size:
+                break
+            print(f"[INFO] Deleted {deleted[table]} rows from {table}")
+    return deleted
+
+
+def vacuum_task_results(engine) -> None:
+    """PostgreSQL：整理删除后的表，把空间还给后续写入（VACUUM 不能在事务中执行）"""
+    from sqlalchemy import inspect, text
+
+    if engine.dialect.name != "postgresql":
+        return
+    existing = set(inspect(engine).get_table_names())
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in (TASK_TABLE, GROUP_TABLE):
+            if table in existing:
+                conn.execute(text(f"VACUUM ANALYZE {table}"))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Delete stored Celery task results from the result backend tables")
+    parser.add_argument("--database-url", default=None, help="defaults to DATABASE_URL")
+    parser.add_argument("--older-than-days", type=float, default=0,
+                        help="only delete results finished more than this many days ago")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="run VACUUM ANALYZE afterwards (PostgreSQL)")
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be deleted")
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+
+    engine = create_engine(database_url(args.database_url))
+    before = datetime.utcnow() - timedelta(days=args.older_than_days)
+    try:
+        if args.dry_run:
+            for table, count in count_task_results(engine, before).items():
+                print(f"[INFO] {table}: {'table not found' if count is None else f'{count} rows to delete'}")
+            return 0
+        for table, count in purge_task_results(engine, before, max(1, args.batch_size)).items():
+            print(f"[INFO] {table}: deleted {count} rows")
+        if args.vacuum:
+            vacuum_task_results(engine)
+            print("[INFO] Vacuumed task result tables")
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
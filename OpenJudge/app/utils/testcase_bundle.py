@@ -0,0 +1,243 @@
+"""
+二进制测试用例包（testcases.bundle）
+
+testcases.txt 只能表示单行的输入/输出，且每次都要完整解析。测试用例包的格式为：
+
+    文件头   "<4sHHI"   magic b"OJTC"、版本号、保留字段、用例数
+    索引     "<QQQQ" × 用例数   每个用例的 (输入偏移, 输入长度, 期望输出偏移, 期望输出长度)
+    数据区   UTF-8 编码的输入与期望输出，原样存放（支持多行与 MB 级数据）
+
+读取时整个文件通过 mmap 映射，按索引切片访问单个用例，不需要解析或复制整个文件。
+
+从 testcases.txt 转换：
+    python -m app.utils.testcase_bundle app/problems/1/testcases.txt
+    python -m app.utils.testcase_bundle app/problems          # 转换所有问题
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Sequence
+from typing import Iterable, List, Tuple, Union
+
+from app.utils.sandbox_io import InputSlice
+
+BUNDLE_MAGIC = b"OJTC"
+BUNDLE_VERSION = 1
+BUNDLE_FILENAME = "testcases.bundle"
+
+_HEADER = struct.Struct("<4sHHI")
+_INDEX_ENTRY = struct.Struct("<QQQQ")
+
+
+class BundleError(Exception):
+    pass
+
+
+def is_bundle(path: str) -> bool:
+    """
+    判断文件是否为测试用例包（检查 magic）
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+    except OSError:
+        return False
+
+
+class TestcaseBundle(Sequence):
+    """
+    只读的测试用例序列，元素为 (输入, 期望输出)，访问时才解码对应的数据
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise BundleError(f"Truncated testcase bundle: {path}")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # 另外保留一个与映射对应同一文件的 fd，供 sendfile 直接把输入写入子进程的 stdin
+            # （文件被原子替换后仍指向旧内容，与映射一致）
+            self._fd = os.dup(f.fileno())
+
+        magic, version, _, count = _HEADER.unpack_from(self._map, 0)
+        if magic != BUNDLE_MAGIC:
+            raise BundleError(f"Not a testcase bundle: {path}")
+        if version != BUNDLE_VERSION:
+            raise BundleError(f"Unsupported testcase bundle version {version}: {path}")
+        if _HEADER.size + count * _INDEX_ENTRY.size > size:
+            raise BundleError(f"Truncated testcase bundle: {path}")
+        self._count = count
+        self._view = memoryview(self._map)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        input_view, expected_view = self.views(index)
+        return (
+            str(input_view, 'utf-8', 'replace'),
+            str(expected_view, 'utf-8', 'replace')
+        )
+
+    def spans(self, index: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """
+        获取用例在文件中的位置
+        :return: ((输入偏移, 输入长度), (期望输出偏移, 期望输出长度))
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("testcase index out of range")
+        input_offset, input_length, expected_offset, expected_length = _INDEX_ENTRY.unpack_from(
+            self._map, _HEADER.size + index * _INDEX_ENTRY.size
+        )
+        return (input_offset, input_length), (expected_offset, expected_length)
+
+    def views(self, index: int) -> Tuple[memoryview, memoryview]:
+        """
+        获取用例输入与期望输出的零拷贝视图
+        :return: (输入, 期望输出) 的 memoryview，指向映射的文件内容
+        """
+        (input_offset, input_length), (expected_offset, expected_length) = self.spans(index)
+        end = max(input_offset + input_length, expected_offset + expected_length)
+        if end > len(self._map):
+            raise BundleError(f"Corrupted testcase bundle: {self.path}")
+        return (
+            self._view[input_offset:input_offset + input_length],
+            self._view[expected_offset:expected_offset + expected_length]
+        )
+
+    def input_slice(self, index: int) -> InputSlice:
+        """
+        获取用例输入在文件中的位置，用于不经过 Python 字符串直接写入子进程的 stdin
+        """
+        (input_offset, input_length), _ = self.spans(index)
+        if input_offset + input_length > len(self._map):
+            raise BundleError(f"Corrupted testcase bundle: {self.path}")
+        return InputSlice(self._fd, input_offset, input_length)
+
+    def sliced(self, threshold: int) -> "SlicedTestcases":
+        """
+        :return: 不小于 threshold 字节的输入以 InputSlice 表示的视图，见 SlicedTestcases
+        """
+        return SlicedTestcases(self, threshold)
+
+    def __del__(self):
+        fd = getattr(self, "_fd", None)
+        if fd is not None:
+            os.close(fd)
+
+    def __repr__(self) -> str:
+        return f"TestcaseBundle({self.path!r}, {self._count} cases)"
+
+
+class SlicedTestcases(Sequence):
+    """
+    TestcaseBundle 的判题视图，元素为 (输入, 期望输出)：
+    输入不小于 threshold 字节时为 InputSlice（运行时经 sendfile 写入子进程，不解码为字符串），否则为 str
+    """
+
+    def __init__(self, bundle: TestcaseBundle, threshold: int):
+        self.bundle = bundle
+        self.threshold = threshold
+
+    def __len__(self) -> int:
+        return len(self.bundle)
+
+    def __getitem__(self, index) -> Union[Tuple[Union[str, InputSlice], str], list]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.bundle)))]
+        input_view, expected_view = self.bundle.views(index)
+        expected_output = str(expected_view, 'utf-8', 'replace')
+        if len(input_view) >= self.threshold:
+            return self.bundle.input_slice(index), expected_output
+        return str(input_view, 'utf-8', 'replace'), expected_output
+
+
+def write_bundle(path: str, testcases: Iterable[Tuple[str, str]]) -> int:
+    """
+    写出测试用例包（先写临时文件再原子替换，正在使用旧文件映射的进程不受影响）
+    :param path: 输出路径
+    :param testcases: (输入, 期望输出) 列表，内容原样保存
+    :return: 用例数
+    """
+    payloads: List[Tuple[bytes, bytes]] = [
+        (input_data.encode(), expected_output.encode())
+        for input_data, expected_output in testcases
+    ]
+    offset = _HEADER.size + len(payloads) * _INDEX_ENTRY.size
+    index = []
+    for input_bytes, expected_bytes in payloads:
+        index.append((offset, len(input_bytes), offset + len(input_bytes), len(expected_bytes)))
+        offset += len(input_bytes) + len(expected_bytes)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, 0, len(payloads)))
+            for entry in index:
+                f.write(_INDEX_ENTRY.pack(*entry))
+            for input_bytes, expected_bytes in payloads:
+                f.write(input_bytes)
+                f.write(expected_bytes)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(payloads)
+
+
+def convert_testcases(txt_path: str, bundle_path: str = None) -> str:
+    """
+    把 testcases.txt 转换为同目录下的 testcases.bundle
+    :return: 生成的测试用例包路径
+    """
+    # 与 judge 读取 testcases.txt 的解析规则保持一致
+    from app.utils.testcase_cache import parse_testcases
+
+    bundle_path = bundle_path or os.path.join(os.path.dirname(txt_path), BUNDLE_FILENAME)
+    with open(txt_path, 'rb') as f:
+        testcases = parse_testcases(f.read())
+    write_bundle(bundle_path, testcases)
+    return bundle_path
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert testcases.txt files into testcase bundles")
+    parser.add_argument("paths", nargs="+",
+                        help="testcases.txt files, problem directories, or the problems root")
+    args = parser.parse_args(argv)
+
+    sources = []
+    for path in args.paths:
+        if os.path.isfile(path):
+            sources.append(path)
+        elif os.path.isfile(os.path.join(path, "testcases.txt")):
+            sources.append(os.path.join(path, "testcases.txt"))
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                candidate = os.path.join(path, name, "testcases.txt")
+                if os.path.isfile(candidate):
+                    sources.append(candidate)
+
+    if not sources:
+        print("No testcases.txt found", file=sys.stderr)
+        return 1
+    for source in sources:
+        bundle_path = convert_testcases(source)
+        print(f"{source} -> {bundle_path} ({len(TestcaseBundle(bundle_path))} cases)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+测试用例缓存
+
+每个进程缓存已解析的测试用例，避免每次判题都重新读取、解析 testcases.txt。
+以问题ID为键，按文件 mtime/大小判断是否需要重新检查；文件被改写时再比较内容的
+sha256，内容未变则继续使用缓存。条目数超过上限时淘汰最久未使用的问题（LRU）。
+二进制测试用例包（*.bundle）以 mmap 方式缓存，不整体读入内存。
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from app.utils import metrics
+from app.utils.testcase_bundle import BundleError, TestcaseBundle
+
+Testcases = Tuple[Tuple[str, str], ...]
+
+_DIGEST_CHUNK_SIZE = 1 << 20
+
+# 缓存的问题数上限
+DEFAULT_MAX_ENTRIES = int(os.getenv("JUDGE_TESTCASE_CACHE_SIZE", 256))
+
+
+def parse_testcases(data: bytes) -> Testcases:
+    """
+    解析测试用例文件内容：奇数行为输入，偶数行为期望输出，多余的最后一行忽略
+    :param data: 文件内容
+    :return: (输入, 期望输出) 元组组成的元组
+    """
+    # 与 open(path, 'r').readlines() 相同的解码与换行处理
+    lines = io.TextIOWrapper(io.BytesIO(data)).readlines()
+    return tuple(
+        (lines[i].strip(), lines[i + 1].strip())
+        for i in range(0, len(lines) - 1, 2)
+    )
+
+
+def _file_digest(path: str) -> str:
+    # 分块计算，不把大文件整体读入内存
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_DIGEST_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class TestcaseCache:
+    """
+    进程内测试用例缓存（线程安全）
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # problem_id -> {"path", "stat", "digest", "testcases"}
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, problem_id: str, path: str) -> Sequence[Tuple[str, str]]:
+        """
+        获取问题的测试用例
+        :param problem_id: 问题ID
+        :param path: 测试用例文件路径
+        :return: 不可变的测试用例序列（元组或 TestcaseBundle）
+        :raises FileNotFoundError: 测试用例文件不存在
+        """
+        return self._load(str(problem_id), path)["testcases"]
+
+    def digest(self, problem_id: str, path: str) -> str:
+        """
+        获取测试用例文件内容的 sha256（十六进制）
+        """
+        return self._load(str(problem_id), path)["digest"]
+
+    def _load(self, problem_id: str, path: str) -> Dict:
+        st = os.stat(path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(problem_id)
+            if entry is not None and entry["path"] == path and entry["stat"] == stat_key:
+                self._entries.move_to_end(problem_id)
+                metrics.incr("testcase_cache.hit")
+                return entry
+
+        if path.endswith(".bundle"):
+            data = None
+            digest = _file_digest(path)
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            entry = self._entries.get(problem_id)
+            if entry is not None and entry["path"] == path and entry["digest"] == digest:
+                # 文件被重写但内容未变：只更新 stat
+                entry["stat"] = stat_key
+                self._entries.move_to_end(problem_id)
+                metrics.incr("testcase_cache.hit")
+                return entry
+
+        entry = {
+            "path": path,
+            "stat": stat_key,
+            "digest": digest,
+            "testcases": TestcaseBundle(path) if data is None else parse_testcases(data)
+        }
+        with self._lock:
+            self._entries[problem_id] = entry
+            self._entries.move_to_end(problem_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("testcase_cache.evict")
+        metrics.incr("testcase_cache.miss")
+        return entry
+
+    def warm(self, files: Iterable[Tuple[str, str]]) -> int:
+        """
+        预先加载测试用例（worker 启动时调用）
+        :param files: (问题ID, 测试用例文件路径) 列表
+        :return: 成功加载的问题数
+        """
+        loaded = 0
+        for problem_id, path in files:
+            try:
+                self._load(str(problem_id), path)
+                loaded += 1
+            except (OSError, BundleError):
+                continue
+        return loaded
+
+    def invalidate(self, problem_id: Optional[str] = None) -> None:
+        """
+        清除某个问题（或全部问题）的缓存
+        """
+        with self._lock:
+            if problem_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(problem_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: 当前缓存条目数与命中/未命中计数
+        """
+        counters = metrics.snapshot()
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "entries": size,
+            "hits": counters.get("testcase_cache.hit", 0),
+            "misses": counters.get("testcase_cache.miss", 0),
+            "evictions": counters.get("testcase_cache.evict", 0)
+        }
+
+
+testcase_cache = TestcaseCache()
@@ -0,0 +1,166 @@
+"""
+判题结果缓存
+
+学生经常对同一道题重复提交完全相同的代码。以 (问题ID, 问题指纹, 规范化代码哈希)
+为键把判题结果缓存在 Redis 中，所有 worker 共享，命中时直接复用结果、不再运行测试用例。
+
+问题指纹由测试用例内容哈希与评测配置计算（见 judge.problem_fingerprint），
+测试用例或配置变化后旧条目自然失效；条目按 TTL 过期淘汰。
+只缓存完全由用户代码决定的结果（见 is_cacheable）：判题机的故障（进程启动失败、zygote 崩溃、
+编译超时等）与超时一样不缓存，相同代码重新提交时会重新判题。
+Redis 不可用时视为未命中，不影响判题。
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Optional
+
+from app.utils import metrics
+from app.utils.redis_client import redis_client
+from app.utils.sandbox_io import MEMORY_LIMIT_EXCEEDED, OUTPUT_LIMIT_EXCEEDED
+
+KEY_PREFIX = "verdict"
+HITS_KEY = "verdict_cache:hits"
+MISSES_KEY = "verdict_cache:misses"
+
+# 缓存条目的过期时间（秒），0 表示禁用缓存
+DEFAULT_TTL = int(os.getenv("JUDGE_VERDICT_CACHE_TTL", 24 * 3600))
+
+# 由用户代码决定的错误：输出 / 内存超限（超时与负载有关，不在其中）
+_USER_LIMIT_ERRORS = (OUTPUT_LIMIT_EXCEEDED, MEMORY_LIMIT_EXCEEDED)
+
+# 用户代码抛出的异常（解释器输出的 traceback）
+_TRACEBACK_HEADER = "Traceback (most recent call last):"
+
+# 语法错误：最后一行为 SyntaxError / IndentationError / TabError
+_SYNTAX_ERROR = re.compile(r"^(SyntaxError|IndentationError|TabError): ", re.MULTILINE)
+
+
+def normalize_code(code: str) -> str:
+    """
+    规范化用户代码：统一换行符、去掉末尾空白（不改变程序语义）
+    """
+    return code.replace('\r\n', '\n').replace('\r', '\n').rstrip()
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(normalize_code(code).encode()).hexdigest()
+
+
+def is_user_outcome(result: Dict) -> bool:
+    """
+    用例结果是否完全由用户代码决定（白名单）：
+    通过 / 答案错误 / 被跳过，输出或内存超限，用户代码的异常 traceback 与语法错误；
+    其他错误（超时、判题机故障、编译超时、只写了 stderr 的非零退出等）无法区分来源，一律视为不确定
+    """
+    error = result.get("error")
+    if not error or result.get("skipped"):
+        return True
+    if error in _USER_LIMIT_ERRORS:
+        return True
+    return _TRACEBACK_HEADER in error or _SYNTAX_ERROR.search(error) is not None
+
+
+def is_cacheable(judge_output: Dict) -> bool:
+    """
+    只缓存确定性的判题结果：必须有用例结果，且每个用例的结果都由用户代码决定
+    """
+    results = judge_output.get("results") or []
+    if not results:
+        return False
+    return all(is_user_outcome(r) for r in results)
+
+
+class VerdictCache:
+    """
+    基于 Redis 的判题结果缓存
+    """
+
+    def __init__(self, client, ttl: int = DEFAULT_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def key(self, problem_id: str, fingerprint: str, code: str) -> str:
+        return f"{KEY_PREFIX}:{problem_id}:{fingerprint}:{code_hash(code)}"
+
+    def get(self, problem_id: str, fingerprint: str, code: str) -> Optional[Dict]:
+        """
+        :return: 缓存的判题结果，未命中或 Redis 不可用时为 None
+        """
+        if not self.enabled:
+            return None
+        try:
+            cached = self.client.get(self.key(problem_id, fingerprint, code))
+            self.client.incr(HITS_KEY if cached is not None else MISSES_KEY)
+        except Exception as e:
+            print(f"[WARN] Verdict cache unavailable: {e}")
+            return None
+        if cached is None:
+            metrics.incr("verdict_cache.miss")
+            return None
+        metrics.incr("verdict_cache.hit")
+        return json.loads(cached)
+
+    def put(self, problem_id: str, fingerprint: str, code: str, judge_output: Dict) -> bool:
+        """
+        写入判题结果（不确定的结果不写入）
+        :return: 是否写入成功
+        """
+        if not self.enabled or not is_cacheable(judge_output):
+            return False
+        try:
+            self.client.set(self.key(problem_id, fingerprint, code), json.dumps(judge_output), ex=self.ttl)
+            return True
+        except Exception as e:
+            print(f"[WARN] Verdict cache unavailable: {e}")
+            return False
+
+    def discard(self, problem_id: str, fingerprint: str, code: str) -> bool:
+        """
+        删除一个条目（重判时旧结果作废；新结果不可缓存时也不会再读到旧结果）
+        :return: 是否删除了条目
+        """
+        if not self.enabled:
+            return False
+        try:
+            return bool(self.client.delete(self.key(problem_id, fingerprint, code)))
+        except Exception as e:
+            print(f"[WARN] Verdict cache unavailable: {e}")
+            return False
+
+    def invalidate(self, problem_id: str) -> int:
+        """
+        删除某个问题的所有缓存条目（测试用例变化后条目会自动失效，此方法用于立即释放空间）
+        :return: 删除的条目数
+        """
+        deleted = 0
+        batch = []
+        for key in self.client.scan_iter(match=f"{KEY_PREFIX}:{problem_id}:*", count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += self.client.delete(*batch)
+                batch = []
+        if batch:
+            deleted += self.client.delete(*batch)
+        return deleted
+
+    def stats(self) -> Dict:
+        """
+        :return: 所有 worker 累计的命中/未命中次数与命中率
+        """
+        hits, misses = self.client.mget(HITS_KEY, MISSES_KEY)
+        hits, misses = int(hits or 0), int(misses or 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0
+        }
+
+
+verdict_cache = VerdictCache(redis_client)
@@ -0,0 +1,588 @@
+"""
+预热沙箱进程池（zygote / fork server）
+
+每个 Celery worker 进程维护若干个已完成解释器启动、预先导入常用标准库的 zygote 进程。
+每次执行时由 zygote fork 出一个全新的子进程运行用户代码，
+因此只需要付出 fork() 的开销，而不是完整的解释器冷启动。
+
+batch 模式为每个提交单独启动一个 zygote，并预先载入（只编译一次）该提交的代码（见 Zygote.load），
+之后每个用例 fork 出的子进程直接运行载入的代码对象。
+
+用户代码只在 fork 出的子进程中运行：子进程关闭控制通道，标准输入输出是 worker 直接读写的管道，
+输出比较、超时与输出上限都在 worker 中判定，zygote 只回报退出码与资源使用，也不接收期望输出。
+zygote 设为不可 dump（PR_SET_DUMPABLE=0），同一用户的沙箱进程不能经 /proc/<pid>/fd 重新打开控制通道。
+
+zygote 也用来启动外部命令（见 get_spawner_pool）：子进程 fork 之后直接 exec 请求中的命令。
+wait4 的 ru_maxrss 包含子进程 fork 时从父进程复制的常驻内存，由内存占用很大的 worker 直接启动的沙箱进程
+会把 worker 自身的内存算作峰值；从很小的 zygote 启动，峰值内存才接近子进程自身的占用。
+
+本文件同时是 zygote 进程自身的入口：python3 zygote.py <控制socket的fd>
+"""
+import builtins
+import gc
+import importlib.util
+import json
+import marshal
+import os
+import queue
+import resource
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+# zygote 中预先导入的标准库，fork 出的子进程直接继承
+PRELOAD_MODULES = (
+    "math", "cmath", "collections", "itertools", "functools", "heapq", "bisect",
+    "re", "string", "random", "decimal", "fractions", "statistics", "operator",
+    "copy", "array", "datetime", "typing", "traceback",
+)
+
+MAX_MESSAGE_SIZE = 1 << 20
+
+MEMFD_PREFIX = "/dev/fd/"
+
+# 子进程退出（或被杀掉）之后等待 zygote 回报退出码与资源使用的最长时间（秒）
+REPORT_TIMEOUT = 5.0
+
+_PR_SET_DUMPABLE = 4
+
+
+# ---------------------------------------------------------------------------
+# zygote 进程端
+# ---------------------------------------------------------------------------
+
+def _exit_status(exc: SystemExit) -> int:
+    """按解释器的规则把 SystemExit 转换成退出码"""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code & 0xFF
+    sys.stderr.write(f"{exc.code}\n")
+    return 1
+
+
+def _load_code(request: dict, program_fd: Optional[int]):
+    """优先使用预编译的 .pyc（解释器版本一致时），否则编译源码"""
+    data = b''
+    if program_fd is not None:
+        # 与其他进程共享同一个文件描述，用 pread 避免竞争偏移量
+        data = os.pread(program_fd, os.fstat(program_fd).st_size, 0)
+        os.close(program_fd)
+    elif request.get("program"):
+        with open(request["program"], 'rb') as f:
+            data = f.read()
+    if data[:4] == importlib.util.MAGIC_NUMBER:
+        return marshal.loads(data[16:])
+    return compile(request["code"], "solution.py", "exec")
+
+
+def _compile_error(exc: BaseException) -> str:
+    """与解释器直接运行脚本时相同的编译错误信息"""
+    if isinstance(exc, SyntaxError):
+        return ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+    return str(exc)
+
+
+def _exec_command(command: list, program_fd: Optional[int]) -> None:
+    """在子进程中 exec 外部命令；memfd 镜像（最后一个参数）换成收到的 fd 号"""
+    if program_fd is not None:
+        os.set_inheritable(program_fd, True)
+        command = command[:-1] + [f"{MEMFD_PREFIX}{program_fd}"]
+    try:
+        os.execvp(command[0], command)
+    except OSError as e:
+        # 与 worker 直接启动时 Popen 抛出的错误信息一致
+        sys.stderr.write(f"{OSError(e.errno, e.strerror, command[0])}\n")
+        sys.stderr.flush()
+        os._exit(127)
+
+
+def _run_child(request: dict, fds: list, loaded=None) -> None:
+    """
+    fork 出的子进程：接管标准输入输出并执行用户代码（或 exec 外部命令），永不返回
+    :param loaded: 预先载入的代码对象（见 Zygote.load），请求中没有代码时运行它
+    """
+    status = 1
+    try:
+        program_fd = fds[3] if len(fds) > 3 else None
+        # 独立的会话与进程组，用户代码 fork 出的子孙进程随之一起清理
+        os.setsid()
+        for target, fd in enumerate(fds[:3]):
+            os.dup2(fd, target)
+            os.close(fd)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if request.get("cpu_rlimit"):
+            resource.setrlimit(resource.RLIMIT_CPU, tuple(request["cpu_rlimit"]))
+        if request.get("memory_rlimit"):
+            resource.setrlimit(resource.RLIMIT_DATA, tuple(request["memory_rlimit"]))
+        if request.get("cpu") is not None:
+            # 执行槽分配的核心
+            try:
+                os.sched_setaffinity(0, {request["cpu"]})
+            except OSError:
+                pass
+        if request.get("command"):
+            _exec_command(request["command"], program_fd)
+
+        try:
+            if loaded is not None and request.get("code") is None and program_fd is None:
+                code_obj = loaded
+            else:
+                code_obj = _load_code(request, program_fd)
+        except SyntaxError as e:
+            sys.stderr.write(''.join(traceback.format_exception_only(type(e), e)))
+            return
+        try:
+            exec(code_obj, {'__name__': '__main__', '__builtins__': builtins})
+            status = 0
+        except SystemExit as e:
+            status = _exit_status(e)
+        except BaseException as e:
+            # 去掉 zygote 自身的栈帧，与直接运行脚本时的 traceback 一致
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            status = 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except BaseException:
+                pass
+        os._exit(status)
+
+
+def serve(control_fd: int) -> None:
+    """zygote 主循环：接收执行请求，fork 子进程并回报其 pid、退出码与资源使用"""
+    # 以脚本运行时 sys.path[0] 为本目录
+    from sandbox_io import reap_process_group, set_child_subreaper
+
+    # 收养沙箱进程遗留的孤儿进程，由 reap_process_group 回收
+    set_child_subreaper()
+    _set_undumpable()
+    for name in PRELOAD_MODULES:
+        __import__(name)
+    # 预热编译器，并冻结现有对象，避免子进程中的 GC 触发大量写时复制
+    exec(compile("_ = int('0')\nprint", "solution.py", "exec"), {})
+    if hasattr(gc, "freeze"):
+        # PyPy 没有 gc.freeze
+        gc.freeze()
+
+    control = socket.socket(fileno=control_fd)
+    loaded = None
+    while True:
+        try:
+            payload, fds, _, _ = socket.recv_fds(control, MAX_MESSAGE_SIZE, 4)
+        except OSError:
+            return
+        if not payload:
+            # 父进程已退出
+            return
+
+        request = json.loads(payload)
+        if request.get("op") == "ping":
+            control.send(json.dumps({"op": "pong", "pid": os.getpid()}).encode())
+            continue
+        if request.get("op") == "load":
+            # 只编译一次，之后不带代码的 run 请求都运行它
+            try:
+                loaded, error = compile(request["code"], "solution.py", "exec", dont_inherit=True), None
+            except (SyntaxError, ValueError) as e:
+                loaded, error = None, _compile_error(e)
+            control.send(json.dumps({"op": "loaded", "error": error}).encode())
+            continue
+
+        pid = os.fork()
+        if pid == 0:
+            control.close()
+            _run_child(request, fds, loaded)
+        for fd in fds:
+            os.close(fd)
+        control.send(json.dumps({"pid": pid}).encode())
+
+        _, status, rusage = os.wait4(pid, 0)
+        leaked = reap_process_group(pid)
+        control.send(json.dumps({
+            "pid": pid,
+            "returncode": os.waitstatus_to_exitcode(status),
+            "rusage": [rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss],
+            "leaked": leaked
+        }).encode())
+
+
+def _set_undumpable() -> None:
+    # /proc/<pid>/fd 只有 root 可以访问，沙箱进程拿不到 zygote 的控制通道
+    try:
+        import ctypes
+        ctypes.CDLL(None, use_errno=True).prctl(_PR_SET_DUMPABLE, 0, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# worker 进程端
+# ---------------------------------------------------------------------------
+
+class ZygoteError(Exception):
+    """zygote 不可用，用户代码还没有开始运行"""
+    pass
+
+
+class ZygoteLost(ZygoteError):
+    """子进程已经 fork（用户代码已经运行）之后 zygote 失去响应"""
+    pass
+
+
+class Zygote:
+    """一个 zygote 进程及其控制通道，同一时间只服务一次执行"""
+
+    def __init__(self, python: str = 'python3'):
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.process = subprocess.Popen(
+            [python, os.path.abspath(__file__), str(child_sock.fileno())],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            pass_fds=(child_sock.fileno(),),
+        )
+        child_sock.close()
+        self.control = parent_sock
+        self.runs = 0
+        self.last_checked = time.monotonic()
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def ping(self, timeout: float = 1.0) -> bool:
+        """健康检查：zygote 需要在 timeout 内回应 pong"""
+        try:
+            self.control.settimeout(timeout)
+            self.control.send(json.dumps({"op": "ping"}).encode())
+            reply = json.loads(self.control.recv(MAX_MESSAGE_SIZE) or b'{}')
+            self.last_checked = time.monotonic()
+            return reply.get("op") == "pong"
+        except (OSError, ValueError):
+            return False
+
+    def load(self, code: str, timeout: float = 10.0) -> Optional[str]:
+        """
+        在 zygote 中编译并载入代码，之后 run(code=None, ...) 运行载入的代码
+        :return: 编译错误信息，成功时为 None
+        :raises ZygoteError: zygote 没有回应
+        """
+        try:
+            self.control.settimeout(timeout)
+            self.control.send(json.dumps({"op": "load", "code": code}).encode())
+            reply = json.loads(self.control.recv(MAX_MESSAGE_SIZE) or b'{}')
+        except (OSError, ValueError) as e:
+            raise ZygoteError(f"zygote unavailable: {e}")
+        if reply.get("op") != "loaded":
+            raise ZygoteError("zygote did not load the code")
+        return reply.get("error")
+
+    def close(self) -> None:
+        try:
+            self.control.close()
+        finally:
+            if self.alive():
+                self.process.kill()
+            self.process.wait()
+
+    def run(self, code: Optional[str], input_data: str, timeout: float, program: Optional[str] = None,
+            expected_output: Optional[str] = None, output_limit: Optional[int] = None,
+            cpu_limit: Optional[float] = None,
+            cpu: Optional[int] = None,
+            memory_limit: Optional[float] = None,
+            command: Optional[List[str]] = None) -> Tuple[Optional[str], Optional[str], dict]:
+        """
+        通过 zygote fork 一个子进程运行用户代码，参数与返回值与 judge.execute_code 相同
+        code 与 program 都为 None 时运行 load 载入的代码；给出 command 时子进程 exec 该命令
+        出现协议错误时抛出 ZygoteError，由调用方回收该 zygote
+        """
+        # zygote 进程本身以脚本运行、不导入 app 包，因此在 worker 侧按需导入
+        from app.utils import metrics
+        from app.utils.sandbox_io import (
+            STOP_EOF, STOP_TIMEOUT, OutputComparator, communicate_fds, cpu_rlimit, interpret_outcome, memory_rlimit,
+            stdin_payload, track_sandbox, untrack_sandbox, usage_stats
+        )
+
+        start_time = time.monotonic()
+        self.runs += 1
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        child_fds = [stdin_r, stdout_w, stderr_w]
+        request = {
+            "op": "run",
+            "code": code,
+            "program": program,
+            "cpu_rlimit": cpu_rlimit(cpu_limit) if cpu_limit is not None else None,
+            "memory_rlimit": memory_rlimit(memory_limit) if memory_limit is not None else None,
+            "cpu": cpu,
+            "command": command
+        }
+        # memfd 镜像（/dev/fd/N）只在本进程有效，随标准输入输出一起传给 zygote
+        if command and command[-1].startswith(MEMFD_PREFIX):
+            image_fd = [int(command[-1][len(MEMFD_PREFIX):])]
+        elif program and program.startswith(MEMFD_PREFIX):
+            image_fd = [int(program[len(MEMFD_PREFIX):])]
+            request["program"] = None
+        else:
+            image_fd = []
+        try:
+            self.control.settimeout(timeout + 1)
+            socket.send_fds(self.control, [json.dumps(request).encode()], child_fds + image_fd)
+            started = json.loads(self.control.recv(MAX_MESSAGE_SIZE) or b'{}')
+        except (OSError, ValueError) as e:
+            for fd in child_fds + [stdin_w, stdout_r, stderr_r]:
+                os.close(fd)
+            raise ZygoteError(f"zygote unavailable: {e}")
+        for fd in child_fds:
+            os.close(fd)
+        if "pid" not in started:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise ZygoteError("zygote did not start the child")
+
+        pid = started["pid"]
+        track_sandbox(pid)
+        try:
+            pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            pidfd = None
+
+        try:
+            # 与 judge._run_program 相同的截止时间：从开始执行算起
+            deadline = start_time + timeout
+            comparator = OutputComparator(expected_output) if expected_output is not None else None
+            outcome = communicate_fds(stdin_w, stdout_r, stderr_r, stdin_payload(input_data),
+                                      deadline, comparator, output_limit)
+            if outcome["stop"] != STOP_EOF:
+                _kill(pid, pidfd)
+                metrics.incr("sandbox.killed")
+            elif not _wait_exit(pid, pidfd, deadline):
+                # 输出管道已关闭，但子进程到截止时间仍在运行：与 process 模式一样按超时处理
+                _kill(pid, pidfd)
+                metrics.incr("sandbox.killed")
+                outcome["stop"] = STOP_TIMEOUT
+            try:
+                # 子进程已退出或已被杀掉，zygote 回收后立即回报
+                self.control.settimeout(REPORT_TIMEOUT)
+                finished = json.loads(self.control.recv(MAX_MESSAGE_SIZE) or b'null')
+            except (OSError, ValueError) as e:
+                _kill(pid, pidfd)
+                raise ZygoteLost(f"lost zygote while waiting for child: {e}")
+            if finished is None:
+                # zygote 退出时连接关闭，recv 读到 EOF
+                _kill(pid, pidfd)
+                raise ZygoteLost("lost zygote while waiting for child: connection closed")
+        finally:
+            untrack_sandbox(pid)
+            if pidfd is not None:
+                os.close(pidfd)
+
+        if finished.get("leaked"):
+            metrics.incr("sandbox.leaked", finished["leaked"])
+            print(f"[WARN] Killed {finished['leaked']} leaked processes from sandbox {pid}")
+        actual_output, error = interpret_outcome(outcome, finished.get("returncode"))
+        user_time, sys_time, max_rss_kb = finished.get("rusage") or (None, None, None)
+        return actual_output, error, usage_stats(time.monotonic() - start_time, user_time, sys_time, max_rss_kb)
+
+
+def _wait_exit(pid: int, pidfd: Optional[int], deadline: float) -> bool:
+    """
+    等待 zygote 的子进程退出（子进程不是本进程的子进程，不能 wait，只能监听 pidfd）
+    :return: 截止时间之前是否已经退出
+    """
+    while True:
+        remaining = deadline - time.monotonic()
+        if pidfd is not None:
+            # 子进程退出时 pidfd 变为可读
+            return bool(select.select([pidfd], [], [], max(0.0, remaining))[0])
+        # 没有 pidfd 时轮询 /proc：退出后 zygote 回收之前子进程是僵尸进程（状态 Z）
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            return True
+        if stat[stat.rindex(b")") + 2:][:1] == b"Z":
+            return True
+        if remaining <= 0:
+            return False
+        time.sleep(min(remaining, 0.005))
+
+
+def _kill(pid: int, pidfd: Optional[int]) -> None:
+    try:
+        if pidfd is not None:
+            signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    # 子进程以自己的 pid 为进程组，连同它 fork 出的进程一起杀掉
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ZygotePool:
+    """
+    每个 worker 进程内的 zygote 池
+    :param size: zygote 数量
+    :param max_runs: 每个 zygote 执行多少次后回收重建
+    :param health_interval: 空闲 zygote 超过该秒数未检查时，取出前先做一次健康检查
+    :param lazy: 不预先启动，取用时池中没有空闲 zygote 才启动新的
+    """
+
+    def __init__(self, size: int, max_runs: int = 200, health_interval: float = 30.0,
+                 python: str = 'python3', lazy: bool = False):
+        self.size = size
+        self.max_runs = max_runs
+        self.health_interval = health_interval
+        self.python = python
+        self.owner_pid = os.getpid()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        # lazy 时按需启动，最多 size 个
+        self._started = 0 if lazy else size
+        for _ in range(self._started):
+            self._idle.put(Zygote(python))
+
+    def _checkout(self, wait: float) -> Optional[Zygote]:
+        try:
+            zygote = self._idle.get_nowait()
+        except queue.Empty:
+            zygote = self._grow()
+            if zygote is not None:
+                return zygote
+            try:
+                zygote = self._idle.get(timeout=wait)
+            except queue.Empty:
+                return None
+        healthy = zygote.alive()
+        if healthy and time.monotonic() - zygote.last_checked > self.health_interval:
+            healthy = zygote.ping()
+        if not healthy:
+            zygote = self._replace(zygote)
+        return zygote
+
+    def _grow(self) -> Optional[Zygote]:
+        """池未满时启动一个新的 zygote，等它完成启动再交给调用方（启动时间不计入执行时间）"""
+        with self._lock:
+            if self._started >= self.size:
+                return None
+            self._started += 1
+        try:
+            zygote = Zygote(self.python)
+            if zygote.ping(timeout=10.0):
+                return zygote
+            zygote.close()
+        except OSError as e:
+            print(f"[WARN] Failed to start zygote: {e}")
+        with self._lock:
+            self._started -= 1
+        return None
+
+    def _replace(self, zygote: Zygote) -> Zygote:
+        """崩溃恢复 / 回收：关闭旧 zygote 并启动新的"""
+        zygote.close()
+        return Zygote(self.python)
+
+    def run(self, code: str, input_data: str, timeout: float, program: Optional[str] = None,
+            expected_output: Optional[str] = None, output_limit: Optional[int] = None,
+            cpu_limit: Optional[float] = None, cpu: Optional[int] = None,
+            wait: float = 1.0, memory_limit: Optional[float] = None,
+            command: Optional[List[str]] = None) -> Optional[Tuple[Optional[str], Optional[str], dict]]:
+        """
+        在池中执行一次代码
+        :return: (输出结果, 错误信息, 资源统计)；没有可用 zygote、或 zygote 在 fork 子进程之前失败时返回 None，
+                 由调用方回退到冷启动；用户代码已经运行之后 zygote 失去响应时返回判题失败，不再重新执行
+        """
+        zygote = self._checkout(wait)
+        if zygote is None:
+            return None
+        try:
+            return zygote.run(code, input_data, timeout, program, expected_output, output_limit,
+                              cpu_limit, cpu, memory_limit, command)
+        except ZygoteLost as e:
+            zygote = self._replace(zygote)
+            return None, f"Judge harness failed: {e}", None
+        except ZygoteError:
+            zygote = self._replace(zygote)
+            return None
+        finally:
+            if zygote.runs >= self.max_runs or not zygote.alive():
+                zygote = self._replace(zygote)
+            self._idle.put(zygote)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# 运行时名称 -> 该运行时的 zygote 池
+_pools: Dict[str, ZygotePool] = {}
+_pool_lock = threading.Lock()
+
+
+def get_zygote_pool(runtime: str = "cpython", python: str = 'python3') -> Optional[ZygotePool]:
+    """
+    获取当前进程中某个运行时的 zygote 池（懒加载）
+    池大小：cpython 为 JUDGE_ZYGOTE_POOL_SIZE，其他运行时为 JUDGE_ZYGOTE_POOL_SIZE_<运行时>（如
+    JUDGE_ZYGOTE_POOL_SIZE_PYPY），为 0（默认）时禁用；fork 出的新 worker 进程会重建自己的池
+    :param runtime: 运行时名称（见 judge.RUNTIMES）
+    :param python: 该运行时的解释器命令
+    """
+    env = "JUDGE_ZYGOTE_POOL_SIZE" if runtime == "cpython" else f"JUDGE_ZYGOTE_POOL_SIZE_{runtime.upper()}"
+    size = int(os.getenv(env, 0))
+    if size <= 0:
+        return None
+    with _pool_lock:
+        pool = _pools.get(runtime)
+        if pool is None or pool.owner_pid != os.getpid():
+            pool = _pools[runtime] = ZygotePool(
+                size,
+                max_runs=int(os.getenv("JUDGE_ZYGOTE_MAX_RUNS", 200)),
+                health_interval=float(os.getenv("JUDGE_ZYGOTE_HEALTH_INTERVAL", 30)),
+                python=python,
+            )
+        return pool
+
+
+_spawner: Optional[ZygotePool] = None
+
+
+def get_spawner_pool() -> Optional[ZygotePool]:
+    """
+    获取当前进程中启动外部命令（judge._run_program）用的 zygote 池（懒加载，按需增长）
+    JUDGE_SPAWNER=0 时禁用，改由 worker 直接启动，此时资源统计中没有峰值内存；
+    池大小为 JUDGE_SPAWNER_POOL_SIZE（默认 CPU 核数），超出的并发执行同样由 worker 直接启动
+    """
+    global _spawner
+    if os.getenv("JUDGE_SPAWNER", "1") == "0":
+        return None
+    with _pool_lock:
+        if _spawner is None or _spawner.owner_pid != os.getpid():
+            _spawner = ZygotePool(
+                int(os.getenv("JUDGE_SPAWNER_POOL_SIZE", os.cpu_count() or 1)),
+                max_runs=int(os.getenv("JUDGE_ZYGOTE_MAX_RUNS", 200)),
+                health_interval=float(os.getenv("JUDGE_ZYGOTE_HEALTH_INTERVAL", 30)),
+                python=sys.executable,
+                lazy=True,
+            )
+        return _spawner
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]))
@@ -1,5 +1,6 @@
 import os
 import base64
+import json
 import uuid
 from datetime import datetime,timezone
 from flask import request, jsonify, Blueprint,current_app
@@ -7,8 +8,39 @@ from app.views import api
 from app.models import db
 from app.models.analysis_task import AnalysisTask
 from app.utils.time_convert import to_rfc3339_seconds_zulu
-from app.tasks import process_judge
-from app.utils.auth import login_required_api
+from app.tasks import enqueue_judge, queue_depths
+from app.utils.auth import get_current_user, login_required_api
+from app.utils.judge import RUNTIMES
+from app.utils.result_codec import decode_judge_output, load_stored_result
+
+
+def _testcase_result_payload(raw, compact: bool):
+    """
+    按请求返回测试结果：默认还原为含 input/expected 的完整格式，
+    compact=true 时直接返回存储的紧凑格式
+    """
+    if raw is None:
+        return None
+    if compact:
+        return load_stored_result(raw)
+    return decode_judge_output(raw)
+
+
+def _wants_compact() -> bool:
+    return request.args.get("compact", "").lower() in ("1", "true", "yes")
+
+
+def _fair_share_user(authenticated_user_id=None):
+    """
+    公平调度的分组键：只使用已认证的用户ID，请求体中的 user_id 由客户端任意填写，不能作为分组依据；
+    未登录的请求按客户端地址分组（经反向代理时所有匿名请求共用一组，不会挤占登录用户的名额）
+    """
+    if authenticated_user_id is not None:
+        return authenticated_user_id
+    user = get_current_user()
+    if user is not None:
+        return user.id
+    return f"ip:{request.remote_addr}"
 
 
 @api.route("/judge", methods=["POST"])
@@ -22,6 +54,8 @@ def submit_judge():
         data = request.get_json()
         problem_id = data.get("problem_id")
         user_code = data.get("code")
+        # 可选：运行时（如 pypy），为空时使用问题配置中的运行时
+        runtime = data.get("runtime")
         # 使用当前登录用户的ID（整数）
         user_id = request.current_user.id
 
@@ -46,6 +80,12 @@ def submit_judge():
         if len(user_code) > 50000:  # 50KB限制
             return jsonify({"error": "code_too_long", "detail": "code cannot exceed 50KB"}), 400
 
+        if runtime is not None and (not isinstance(runtime, str) or runtime not in RUNTIMES):
+            return jsonify({
+                "error": "invalid_runtime",
+                "detail": f"runtime must be one of: {', '.join(RUNTIMES)}"
+            }), 400
+
         # detect dangerous code patterns
         dangerous_patterns = [
             'import os', 'import subprocess', 'import sys', 'import socket', 
@@ -76,7 +116,7 @@ def submit_judge():
         db.session.commit()
 
         # 调用 Celery 异步任务
-        process_judge.delay(submission_id, problem_id, user_code)
+        enqueue_judge(submission_id, problem_id, user_code, user_id=user_id, runtime=runtime)
         
         return jsonify({
             "submission_id": task.submission_id,
@@ -137,7 +177,7 @@ def get_judge_result():
             "code": task.code,
             "result": task.result,
             "stdout": task.stdout,
-            "testcase_result": task.testcase_result,
+            "testcase_result": json.dumps(_testcase_result_payload(task.testcase_result, _wants_compact())) if task.testcase_result else None,
             "created_at": to_rfc3339_seconds_zulu(task.created_at) if task.created_at else None,
             "updated_at": to_rfc3339_seconds_zulu(task.updated_at) if task.updated_at else None,
         }), 200
@@ -177,6 +217,19 @@ def list_judge_tasks():
         }), 500
 
 
+@api.route("/judge/queues", methods=["GET"])
+@login_required_api
+def judge_queue_depths():
+    """各判题队列的积压（用于监控与扩缩容）"""
+    try:
+        return jsonify({"queues": queue_depths()}), 200
+    except Exception as e:
+        return jsonify({
+            "error": "internal_error",
+            "detail": str(e)
+        }), 500
+
+
 @api.route("/analysis", methods=["POST"])
 def submit_analysis():
     """提交代码分析请求"""
@@ -261,13 +314,14 @@ def submit_analysis():
             user_id=user_id,
             problem_id=problem_id,
             code=user_code,
+            language=language,
             result="pending"
         )
         db.session.add(task)
         db.session.commit()
 
         # 调用 Celery 异步任务
-        process_judge.delay(submission_id, problem_id, user_code)
+        enqueue_judge(submission_id, problem_id, user_code, user_id=_fair_share_user(), language=language)
         
         return jsonify({
             "id": task.submission_id,
@@ -314,9 +368,8 @@ def get_analysis_result(submission_id):
             status = "processing"
         elif task.testcase_result:
             # 解析测试结果
-            import json
             try:
-                test_results = json.loads(task.testcase_result)
+                test_results = load_stored_result(task.testcase_result)
                 if isinstance(test_results, list):
                     all_passed = all(result.get("pass", False) for result in test_results)
                     status = "completed" if all_passed else "completed"
@@ -334,6 +387,7 @@ def get_analysis_result(submission_id):
             "status": status,
             "user_id": task.user_id,
             "problem_id": task.problem_id,
+            "language": task.language or "python",
             "code": task.code,
             "result": task.result,
             "stdout": task.stdout,
@@ -344,9 +398,7 @@ def get_analysis_result(submission_id):
         # 添加测试结果详情
         if task.testcase_result:
             try:
-                import json
-                test_results = json.loads(task.testcase_result)
-                response["results"] = test_results
+                response["results"] = _testcase_result_payload(task.testcase_result, _wants_compact())
             except:
                 response["results"] = []
 
@@ -359,8 +411,11 @@ def get_analysis_result(submission_id):
         }), 500
 
 
-def submit_judge_internal(data):
-    """内部判题提交函数，供Web界面调用"""
+def submit_judge_internal(data, authenticated_user_id=None):
+    """
+    内部判题提交函数，供Web界面调用
+    :param authenticated_user_id: 已登录用户的ID，公平调度按此分组（data 中的 user_id 只用于保存记录）
+    """
     try:
         problem_id = data.get("problem_id")
         user_code = data.get("code")
@@ -421,7 +476,7 @@ def submit_judge_internal(data):
         db.session.commit()
 
         # 调用 Celery 异步任务
-        process_judge.delay(submission_id, problem_id, user_code)
+        enqueue_judge(submission_id, problem_id, user_code, user_id=_fair_share_user(authenticated_user_id))
         
         return {
             "success": True,
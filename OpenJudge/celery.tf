@@ -11,11 +11,16 @@ resource "aws_ecs_task_definition" "celery_worker" {
     {
       name      = "celery-worker",
       image     = docker_image.coughoverflow.name,
-      command   = ["sh", "-c", "sleep 5 && celery -A app.tasks worker --loglevel=info"],
+      command   = ["sh", "-c", "sleep 5 && python3 -m app.utils.judge_queues -- --loglevel=info"],
       environment = [
         {
           name  = "DATABASE_URL"
           value = "postgresql://${local.database_username}:${local.database_password}@${aws_db_instance.postgres.address}:${aws_db_instance.postgres.port}/${aws_db_instance.postgres.db_name}"
+        },
+        {
+          # 本机所有 worker 进程共享一个结果写入进程，合并写入 analysis_tasks
+          name  = "JUDGE_RESULT_WRITER"
+          value = "host"
         }
       ],
       logConfiguration = {
@@ -1,7 +1,7 @@
 resource "aws_sqs_queue" "celery_queue" {
   name = "celery"
 
-  visibility_timeout_seconds = 90
+  visibility_timeout_seconds = 600
   message_retention_seconds  = 345600
   receive_wait_time_seconds  = 10
   delay_seconds              = 0
@@ -14,4 +14,50 @@ resource "aws_sqs_queue" "celery_queue" {
 
 resource "aws_sqs_queue" "celery_dlq" {
   name = "celery-dead-letter"
-}
\ No newline at end of file
+}
+
+# 判题任务按提交类型分队列（见 app/utils/judge_queues.py），celery 队列保留给部署前已入队的任务
+# process_judge 判题结束才确认消息（acks_late），可见性超时必须大于最长判题耗时（judge.max_judge_time），
+# 并与 judge_queues.VISIBILITY_TIMEOUTS 一致；超过 interactive 超时的问题自动进入 heavy 队列
+resource "aws_sqs_queue" "judge_interactive" {
+  name = "judge-interactive"
+
+  visibility_timeout_seconds = 600
+  message_retention_seconds  = 345600
+  receive_wait_time_seconds  = 10
+  delay_seconds              = 0
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.celery_dlq.arn
+    maxReceiveCount     = 3
+  })
+}
+
+# 重题目运行时间更长，可见性超时相应放宽，避免任务未完成就被重新投递
+resource "aws_sqs_queue" "judge_heavy" {
+  name = "judge-heavy"
+
+  visibility_timeout_seconds = 1800
+  message_retention_seconds  = 345600
+  receive_wait_time_seconds  = 10
+  delay_seconds              = 0
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.celery_dlq.arn
+    maxReceiveCount     = 3
+  })
+}
+
+resource "aws_sqs_queue" "judge_batch" {
+  name = "judge-batch"
+
+  visibility_timeout_seconds = 1800
+  message_retention_seconds  = 345600
+  receive_wait_time_seconds  = 10
+  delay_seconds              = 0
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.celery_dlq.arn
+    maxReceiveCount     = 3
+  })
+}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Fair-Share Scheduling Simulation - time to verdict per user under skewed load
+
+Discrete-event simulation of the judge fleet. One student floods the queue
+near a deadline while everyone else submits a few times. Two dispatch
+policies are compared:
+
+  fifo        every submission goes straight to the Celery queue (old behaviour)
+  fair-share  per-user pending lists released round-robin with a per-user
+              in-flight cap (same release order as app/utils/fair_share.py)
+
+Reports p50 / p95 time to verdict for the heavy user and for everyone else.
+Runs entirely in memory, no Redis or Celery needed.
+
+Usage:
+    python test/benchmark_fair_share.py
+    python test/benchmark_fair_share.py --workers 4 --spam 500 --cap 1 --seed 7
+"""
+
+import argparse
+import heapq
+import random
+import statistics
+import sys
+from collections import defaultdict, deque
+
+HEAVY_USER = "spammer"
+
+
+def percentile(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def generate_load(args, rng):
+    """Return [(arrival_time, user, service_time)] sorted by arrival"""
+    submissions = []
+    # The heavy user floods the queue in a short burst right before the deadline
+    for _ in range(args.spam):
+        submissions.append((rng.uniform(0, args.burst), HEAVY_USER))
+    # Everyone else submits a few times over the whole window
+    for user in range(args.users):
+        for _ in range(args.per_user):
+            submissions.append((rng.uniform(0, args.window), f"user{user}"))
+    submissions.sort()
+    # Judge time: lognormal around --service seconds (most fast, a few slow)
+    return [(arrival, user, rng.lognormvariate(0, 0.5) * args.service) for arrival, user in submissions]
+
+
+class FairShareModel:
+    """In-memory model of the Redis ring / pending lists / in-flight sets"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.pending = defaultdict(deque)
+        self.inflight = defaultdict(int)
+        self.ring = deque()
+        self.active = set()
+
+    def submit(self, user, job):
+        self.pending[user].append(job)
+        if user not in self.active:
+            self.active.add(user)
+            self.ring.append(user)
+
+    def release(self):
+        for _ in range(len(self.ring)):
+            user = self.ring.popleft()
+            if not self.pending[user]:
+                self.active.discard(user)
+            elif self.inflight[user] >= self.cap:
+                self.ring.append(user)
+            else:
+                job = self.pending[user].popleft()
+                self.inflight[user] += 1
+                if self.pending[user]:
+                    self.ring.append(user)
+                else:
+                    self.active.discard(user)
+                return job
+        return None
+
+    def complete(self, user):
+        self.inflight[user] -= 1
+
+
+def simulate(load, workers, policy, cap):
+    """
+    Run the simulation
+    Returns {user: [time to verdict, ...]} and the time the last verdict was produced
+    """
+    # Events: (time, order, kind, payload)
+    events = [(arrival, i, "arrive", i) for i, (arrival, _, _) in enumerate(load)]
+    heapq.heapify(events)
+    order = len(load)
+    celery_queue = deque()
+    idle = workers
+    model = FairShareModel(cap) if policy == "fair-share" else None
+    verdicts = defaultdict(list)
+    now = 0.0
+
+    def dispatch():
+        nonlocal idle, order
+        if model is not None:
+            job = model.release()
+            while job is not None:
+                celery_queue.append(job)
+                job = model.release()
+        while idle and celery_queue:
+            job = celery_queue.popleft()
+            idle -= 1
+            order += 1
+            heapq.heappush(events, (now + load[job][2], order, "done", job))
+
+    while events:
+        now, _, kind, job = heapq.heappop(events)
+        arrival, user, _ = load[job]
+        if kind == "arrive":
+            if model is not None:
+                model.submit(user, job)
+            else:
+                celery_queue.append(job)
+        else:
+            idle += 1
+            verdicts[user].append(now - arrival)
+            if model is not None:
+                model.complete(user)
+        dispatch()
+    return verdicts, now
+
+
+def summarize(verdicts):
+    heavy = verdicts[HEAVY_USER]
+    others = [t for user, times in verdicts.items() if user != HEAVY_USER for t in times]
+    per_user_p95 = [percentile(times, 95) for user, times in verdicts.items() if user != HEAVY_USER]
+    return {
+        "heavy_p50": percentile(heavy, 50) if heavy else 0.0,
+        "heavy_p95": percentile(heavy, 95) if heavy else 0.0,
+        "others_p50": percentile(others, 50),
+        "others_p95": percentile(others, 95),
+        "worst_user_p95": max(per_user_p95)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate per-user fair-share dispatch under skewed load")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent judge processes in the fleet")
+    parser.add_argument("--service", type=float, default=1.0, help="median judge time per submission (s)")
+    parser.add_argument("--spam", type=int, default=400, help="submissions from the heavy user")
+    parser.add_argument("--burst", type=float, default=20.0, help="seconds over which the heavy user submits")
+    parser.add_argument("--users", type=int, default=60, help="number of other users")
+    parser.add_argument("--per-user", type=int, default=3, help="submissions per other user")
+    parser.add_argument("--window", type=float, default=90.0, help="seconds over which other users submit")
+    parser.add_argument("--cap", type=int, default=2, help="per-user in-flight cap (JUDGE_FAIR_SHARE_INFLIGHT)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    load = generate_load(args, random.Random(args.seed))
+    print(f"🚀 {len(load)} submissions: {args.spam} from one user in {args.burst:.0f}s, "
+          f"{args.users} users x {args.per_user} over {args.window:.0f}s, {args.workers} workers")
+
+    header = f"{'policy':>10} | {'heavy p50':>10} {'heavy p95':>10} | {'others p50':>10} {'others p95':>10} " \
+             f"{'worst user p95':>14} | {'makespan':>9}"
+    print(header)
+    print("-" * len(header))
+    results = {}
+    for policy in ("fifo", "fair-share"):
+        verdicts, makespan = simulate(load, args.workers, policy, args.cap)
+        summary = summarize(verdicts)
+        results[policy] = summary
+        print(f"{policy:>10} | {summary['heavy_p50']:>9.1f}s {summary['heavy_p95']:>9.1f}s | "
+              f"{summary['others_p50']:>9.1f}s {summary['others_p95']:>9.1f}s {summary['worst_user_p95']:>13.1f}s | "
+              f"{makespan:>8.1f}s")
+
+    fifo, fair = results["fifo"]["others_p95"], results["fair-share"]["others_p95"]
+    print()
+    print(f"📊 p95 time to verdict for other users: {fifo:.1f}s -> {fair:.1f}s "
+          f"({fifo / fair:.1f}x better)" if fair else "📊 no waiting under fair-share")
+    if fair > fifo:
+        print("⚠️ Fair-share did not improve p95 for other users with these parameters")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Runtime Benchmark - compare Python runtimes (CPython / PyPy) on the problem set
+
+Runs every problem's reference solution (app/problems/<id>/reference.py) against
+its test cases under each registered runtime, using the same sandbox path as the
+judge (app.utils.judge.execute_code). Runtimes whose interpreter is not installed
+on this machine are skipped.
+
+Usage (from the OpenJudge directory):
+    python test/benchmark_runtimes.py
+    python test/benchmark_runtimes.py 1 3 --runs 10 --runtimes cpython pypy
+"""
+
+import argparse
+import os
+import statistics
+import sys
+
+# Add project root to path for importing the app package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.utils.judge import (
+    PROBLEMS_DIR, RUNTIMES, _problem_dir, build_testcase_result, execute_code,
+    judge_testcases, load_testcases, runtime_available
+)
+
+REFERENCE_FILENAME = "reference.py"
+DEFAULT_RUNS = 5
+# Generous timeout so slow runtimes are measured rather than cut off
+TIMEOUT = 10
+
+
+def problem_ids_with_reference():
+    return sorted(
+        (name for name in os.listdir(PROBLEMS_DIR)
+         if os.path.exists(os.path.join(PROBLEMS_DIR, name, REFERENCE_FILENAME))),
+        key=lambda name: (not name.isdigit(), int(name) if name.isdigit() else name)
+    )
+
+
+def measure(problem_id, runtime, runs):
+    """
+    Run the reference solution over all test cases `runs` times
+    Returns median total wall / CPU milliseconds per run and the peak RSS
+    """
+    with open(os.path.join(_problem_dir(problem_id), REFERENCE_FILENAME), 'r') as f:
+        code = f.read()
+    testcases = judge_testcases(load_testcases(problem_id))
+
+    walls, cpus, rss = [], [], 0
+    for _ in range(runs):
+        wall, cpu = 0.0, 0.0
+        for input_data, expected_output in testcases:
+            actual_output, error, stats = execute_code(code, input_data, TIMEOUT, runtime=runtime)
+            result = build_testcase_result(input_data, expected_output, actual_output, error, stats)
+            if not result["pass"]:
+                raise RuntimeError(f"reference failed under {runtime}: {error or actual_output!r}")
+            wall += stats["wall_ms"]
+            cpu += stats.get("user_ms", 0) + stats.get("sys_ms", 0)
+            rss = max(rss, stats.get("max_rss_kb", 0))
+        walls.append(wall)
+        cpus.append(cpu)
+    return {
+        "wall_ms": statistics.median(walls),
+        "cpu_ms": statistics.median(cpus),
+        "max_rss_kb": rss,
+        "testcases": len(testcases)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Python runtimes on the problem set")
+    parser.add_argument("problem_ids", nargs="*", help="problems to run (default: all with a reference solution)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--runtimes", nargs="+", default=list(RUNTIMES), choices=list(RUNTIMES))
+    args = parser.parse_args()
+
+    runtimes = []
+    for runtime in args.runtimes:
+        if runtime_available(runtime):
+            runtimes.append(runtime)
+        else:
+            print(f"⚠️ Skipping {runtime}: '{RUNTIMES[runtime]['command']}' not found")
+    if not runtimes:
+        print("❌ No runtime available")
+        sys.exit(1)
+    baseline = runtimes[0]
+
+    print(f"🚀 Benchmarking {', '.join(runtimes)} ({args.runs} runs per problem, median of totals)")
+    header = f"{'problem':>8} {'cases':>5}"
+    for runtime in runtimes:
+        header += f" | {runtime + ' wall':>12} {runtime + ' cpu':>12} {'rss':>8}"
+        if runtime != baseline:
+            header += f" {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+
+    totals = {runtime: 0.0 for runtime in runtimes}
+    failed = False
+    for problem_id in args.problem_ids or problem_ids_with_reference():
+        row = f"{problem_id:>8}"
+        measured = {}
+        for runtime in runtimes:
+            try:
+                measured[runtime] = measure(problem_id, runtime, args.runs)
+            except Exception as e:
+                print(f"{problem_id:>8} ❌ {e}")
+                failed = True
+                break
+        if len(measured) != len(runtimes):
+            continue
+
+        row += f" {measured[baseline]['testcases']:>5}"
+        for runtime in runtimes:
+            m = measured[runtime]
+            totals[runtime] += m["cpu_ms"]
+            row += f" | {m['wall_ms']:>10.1f}ms {m['cpu_ms']:>10.1f}ms {m['max_rss_kb'] // 1024:>6}MB"
+            if runtime != baseline:
+                speedup = measured[baseline]["cpu_ms"] / m["cpu_ms"] if m["cpu_ms"] else float("inf")
+                row += f" {speedup:>7.2f}x"
+        print(row)
+
+    print()
+    for runtime in runtimes:
+        line = f"📊 {runtime}: total CPU {totals[runtime]:.1f}ms"
+        if runtime != baseline and totals[runtime]:
+            line += f" ({totals[baseline] / totals[runtime]:.2f}x vs {baseline}, "
+            line += f"time limits scaled by {RUNTIMES[runtime]['time_factor']})"
+        print(line)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Shared setup for the offline unit tests
+
+The unit tests import the app package directly (no running server needed).
+Run from the OpenJudge directory:
+    python -m pytest test/unit -q
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def worker_db(tmp_path_factory):
+    """
+    The worker's Flask app and database (app.tasks.worker_app) on a throwaway SQLite file
+    worker_app keeps one app per process, so every test in the session shares this database
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'judge.db'}"
+    from app.models import db
+    from app.tasks import worker_app
+
+    worker_app()
+    return db
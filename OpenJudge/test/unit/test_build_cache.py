@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Build Cache Unit Tests - eviction never deletes a build that is in use
+"""
+
+import os
+import shutil
+
+import pytest
+
+from app.utils.languages import TOMBSTONE_PREFIX, BuildCache
+
+pytestmark = pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc not installed")
+
+
+def program(n):
+    return f'#include <stdio.h>\nint main(void) {{ printf("{n}\\n"); return 0; }}\n'
+
+
+def entry_dir(build):
+    return os.path.dirname(build["command"][0])
+
+
+def test_prune_skips_entries_in_use(tmp_path):
+    cache = BuildCache(str(tmp_path), max_entries=1)
+
+    with cache.acquire("c", program(0)) as in_use:
+        # Each new build prunes down to one entry; the oldest one is locked
+        cache.build("c", program(1))
+        newest = cache.build("c", program(2))
+
+        assert os.path.exists(in_use["command"][0])
+        assert os.path.exists(newest["command"][0])
+
+    # Released: the next prune may evict it
+    assert cache.prune() >= 1
+    assert not os.path.exists(entry_dir(in_use))
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(TOMBSTONE_PREFIX)]
+
+
+def test_eviction_removes_whole_entries(tmp_path):
+    cache = BuildCache(str(tmp_path), max_entries=2)
+    builds = [cache.build("c", program(n)) for n in range(5)]
+
+    names = sorted(name for name in os.listdir(tmp_path) if not name.startswith("."))
+    assert len(names) == 2
+    for name in names:
+        assert sorted(os.listdir(tmp_path / name)) == ["build.json", "main", "main.c"]
+    assert os.path.exists(builds[-1]["command"][0])
+
+
+def test_acquire_rebuilds_an_evicted_entry(tmp_path):
+    cache = BuildCache(str(tmp_path), max_entries=1)
+    first = cache.build("c", program(0))
+    cache.build("c", program(1))
+    assert not os.path.exists(first["command"][0])
+
+    with cache.acquire("c", program(0)) as build:
+        assert build["command"] == first["command"]
+        assert os.path.exists(build["command"][0])
+
+
+def test_compile_error_lease_holds_nothing(tmp_path):
+    cache = BuildCache(str(tmp_path), max_entries=1)
+    with cache.acquire("c", "int main( {") as build:
+        assert build["command"] is None
+        assert build["error"]
+    assert cache.prune() == 0
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Calibration Unit Tests - limits are derived from the same measurement the judge uses
+"""
+
+from app.utils.calibrate import derive_limits, measure_reference
+from app.utils.judge import evaluate_testcases, load_problem_config, load_testcases, problem_limits
+
+PROBLEM_ID = "1"
+
+
+def test_reference_measured_like_the_judge_from_big_heap_worker(monkeypatch):
+    monkeypatch.delenv("JUDGE_SPAWNER", raising=False)
+    # Resident heap of the "worker": 300 MB of touched pages
+    heap = bytearray(300 * 1024 * 1024)
+    for offset in range(0, len(heap), 4096):
+        heap[offset] = 1
+
+    measured = measure_reference(PROBLEM_ID, runs=2)
+    limits = dict(problem_limits(load_problem_config(PROBLEM_ID)), **derive_limits(measured))
+    with open(f"app/problems/{PROBLEM_ID}/reference.py") as f:
+        results = evaluate_testcases(f.read(), load_testcases(PROBLEM_ID), limits=limits)
+    del heap
+
+    assert 0 < max(measured["max_rss_kb"]) < 64 * 1024
+    # The reference passes under the limits derived from it, judged in the same (big) process
+    assert all(result["pass"] for result in results)
+    assert all(result["stats"]["max_rss_kb"] <= limits["memory_mb"] * 1024 for result in results)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Memory Stats Unit Tests - peak memory is measured for the sandbox child, not the worker
+"""
+
+import sys
+
+from app.utils.judge import _run_program
+
+PRINT_ONE = [sys.executable, "-c", "print(1)"]
+
+
+def test_small_program_from_big_heap_worker_reports_small_peak(monkeypatch):
+    monkeypatch.delenv("JUDGE_SPAWNER", raising=False)
+    # Resident heap of the "worker": 300 MB of touched pages
+    heap = bytearray(300 * 1024 * 1024)
+    for offset in range(0, len(heap), 4096):
+        heap[offset] = 1
+
+    output, error, stats = _run_program(PRINT_ONE, "", 5)
+
+    assert (output, error) == ("1", None)
+    assert stats["max_rss_kb"] < 64 * 1024
+    del heap
+
+
+def test_direct_spawn_omits_peak(monkeypatch):
+    monkeypatch.setenv("JUDGE_SPAWNER", "0")
+
+    output, error, stats = _run_program(PRINT_ONE, "", 5)
+
+    assert (output, error) == ("1", None)
+    assert "max_rss_kb" not in stats
+    assert "user_ms" in stats
+
+
+def test_spawned_command_not_found(monkeypatch):
+    monkeypatch.delenv("JUDGE_SPAWNER", raising=False)
+
+    output, error, _ = _run_program(["no-such-judge-command"], "", 5)
+
+    assert output is None
+    assert "No such file or directory" in error
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Output Comparator Unit Tests - streaming comparison and output limit agree with the final strip() comparison
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+from app.utils.judge import _run_program
+from app.utils.sandbox_io import (
+    OUTPUT_LIMIT_EXCEEDED, STOP_EOF, STOP_MISMATCH, STOP_OUTPUT_LIMIT, OutputComparator, communicate_fds,
+    decode_output
+)
+
+# (expected output, program output) pairs covering whitespace and newline handling
+CASES = [
+    ("1\n2", b"1\n2"),
+    ("1\n2", b"1\n2\n"),
+    ("1\n2", b"  1\n2 \t\n\n\n"),
+    ("1\n2", b"1\r\n2\r\n"),
+    ("1\n2", b"1\r2\r"),
+    ("1\n2", b"1\n\n2"),
+    ("1\n2", b"1 \n2"),
+    ("1\n2", b"1\n2\n3"),
+    ("1\n2", b"1\n"),
+    ("1\n2", b"12"),
+    ("even", b"odd\n"),
+    ("café", "café\n".encode()),
+    ("x", "x　".encode()),
+]
+
+
+def _feed(comparator, chunks):
+    mismatch = False
+    for chunk in chunks:
+        mismatch = comparator.feed(chunk) or mismatch
+    return mismatch
+
+
+def _communicate(stdout_data, comparator=None, output_limit=None):
+    """Runs communicate_fds against pipes that already hold the whole program output"""
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    os.write(stdout_w, stdout_data)
+    for fd in (stdin_r, stdout_w, stderr_w):
+        os.close(fd)
+    return communicate_fds(stdin_w, stdout_r, stderr_r, b"", time.monotonic() + 5, comparator, output_limit)
+
+
+@pytest.mark.parametrize("expected, actual", CASES)
+def test_mismatch_only_when_final_comparison_fails(expected, actual):
+    equal = decode_output(actual).strip() == expected.strip()
+
+    mismatch = _feed(OutputComparator(expected), [actual])
+
+    assert not (mismatch and equal)
+    if not equal and actual.isascii() and not expected.startswith(decode_output(actual).strip()):
+        # ASCII output that differs is caught while streaming, unless it is still a prefix of the
+        # expected output (only EOF decides that)
+        assert mismatch
+
+
+@pytest.mark.parametrize("expected, actual", CASES)
+def test_chunk_boundaries_do_not_change_the_result(expected, actual):
+    whole = _feed(OutputComparator(expected), [actual])
+
+    for split in range(1, len(actual)):
+        # The split may fall between \r and \n, or inside a line
+        assert _feed(OutputComparator(expected), [actual[:split], actual[split:]]) == whole
+    assert _feed(OutputComparator(expected), [bytes([b]) for b in actual]) == whole
+
+
+def test_crlf_split_across_chunks_is_one_newline():
+    comparator = OutputComparator("1\n2")
+
+    assert not _feed(comparator, [b"1\r", b"\n2\r", b"\n"])
+    assert _feed(OutputComparator("1\n\n2"), [b"1\r", b"\n2"])
+
+
+def test_stream_stops_at_first_mismatch():
+    outcome = _communicate(b"wrong answer\n", OutputComparator("right answer"))
+
+    assert outcome["stop"] == STOP_MISMATCH
+
+
+def test_matching_stream_reads_to_eof():
+    outcome = _communicate(b"1\r\n2\r\n\n", OutputComparator("1\n2"))
+
+    assert outcome["stop"] == STOP_EOF
+    assert decode_output(outcome["stdout"]).strip() == "1\n2"
+
+
+def test_output_exactly_at_limit_is_accepted():
+    outcome = _communicate(b"a" * 100, output_limit=100)
+
+    assert outcome["stop"] == STOP_EOF
+    assert outcome["stdout"] == b"a" * 100
+
+
+def test_output_one_byte_over_limit_is_rejected():
+    outcome = _communicate(b"a" * 101, output_limit=100)
+
+    assert outcome["stop"] == STOP_OUTPUT_LIMIT
+
+
+@pytest.mark.parametrize("spawner", ["1", "0"])
+def test_program_output_limit_boundary(monkeypatch, spawner):
+    monkeypatch.setenv("JUDGE_SPAWNER", spawner)
+    command = [sys.executable, "-c", "import sys; sys.stdout.write('a' * 1000)"]
+
+    assert _run_program(command, "", 5, output_limit=1000)[:2] == ("a" * 1000, None)
+    assert _run_program(command, "", 5, output_limit=999)[:2] == (None, OUTPUT_LIMIT_EXCEEDED)
+
+
+@pytest.mark.parametrize("spawner", ["1", "0"])
+def test_mismatching_program_is_killed_early(monkeypatch, spawner):
+    monkeypatch.setenv("JUDGE_SPAWNER", spawner)
+    command = [sys.executable, "-c", "import time; print('odd', flush=True); time.sleep(30)"]
+
+    started = time.monotonic()
+    output, error, _ = _run_program(command, "", 20, expected_output="even")
+
+    assert (output, error) == ("odd", None)
+    assert time.monotonic() - started < 10
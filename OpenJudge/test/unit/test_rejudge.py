@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Rejudge Unit Tests - result filters and verdict cache bypass
+"""
+
+import uuid
+
+import fakeredis
+import pytest
+
+from app import tasks
+from app.models.analysis_task import AnalysisTask
+from app.utils import rejudge
+from app.utils.verdict_cache import VerdictCache
+
+PROBLEM_ID = "1"
+STALE = {"status": "fail", "message": "stale", "results": [{"input": "1", "pass": False, "error": None}]}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = VerdictCache(fakeredis.FakeRedis())
+    monkeypatch.setattr(tasks, "verdict_cache", cache)
+    return cache
+
+
+def add_submission(db, code):
+    submission_id = str(uuid.uuid4())
+    db.session.add(AnalysisTask(submission_id=submission_id, user_id=1, problem_id=PROBLEM_ID,
+                                code=code, result="fail"))
+    db.session.commit()
+    return submission_id
+
+
+def reference_code():
+    with open(f"app/problems/{PROBLEM_ID}/reference.py") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("result", ["wrong_answer", "accepted", "runtime_error"])
+def test_result_filter_rejects_values_that_are_never_stored(result, capsys):
+    with pytest.raises(SystemExit) as exc:
+        rejudge.main(["--problem", PROBLEM_ID, "--result", result])
+    assert exc.value.code == 2
+    assert "invalid choice" in capsys.readouterr().err
+
+
+def test_rejudge_enqueues_without_the_verdict_cache(worker_db, monkeypatch):
+    submission_id = add_submission(worker_db, "print(1)")
+    queued = []
+    monkeypatch.setattr(tasks, "enqueue_judge", lambda *args, **kwargs: queued.append((args, kwargs)))
+
+    assert submission_id in rejudge.find_submissions([PROBLEM_ID], ["fail"])
+    rejudge.rejudge_submissions([submission_id])
+
+    assert worker_db.session.get(AnalysisTask, submission_id).result == "pending"
+    (args, kwargs), = queued
+    assert args[0] == submission_id
+    assert kwargs["kind"] == "batch" and kwargs["use_cache"] is False
+
+
+def test_process_judge_without_cache_rejudges_and_replaces_the_entry(worker_db, cache):
+    code = reference_code()
+    fingerprint = tasks.problem_fingerprint(PROBLEM_ID, None, None, None)
+    cache.put(PROBLEM_ID, fingerprint, code, STALE)
+
+    cached_id = add_submission(worker_db, code)
+    tasks.process_judge(cached_id, PROBLEM_ID, code)
+    worker_db.session.expire_all()
+    assert worker_db.session.get(AnalysisTask, cached_id).stdout == "stale"
+
+    rejudged_id = add_submission(worker_db, code)
+    tasks.process_judge(rejudged_id, PROBLEM_ID, code, use_cache=False)
+    worker_db.session.expire_all()
+    assert worker_db.session.get(AnalysisTask, rejudged_id).result == "ok"
+    assert cache.get(PROBLEM_ID, fingerprint, code)["status"] == "ok"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Result Codec Unit Tests - compact encode/decode round trip and legacy rows in the result views
+"""
+
+import json
+import uuid
+
+import pytest
+
+from app.models.analysis_task import AnalysisTask
+from app.tasks import worker_app
+from app.utils import judge
+from app.utils.judge import judge_submission, load_testcases
+from app.utils.result_codec import (
+    ACTUAL_OUTPUT_LIMIT, ERROR_TEXT_LIMIT, decode_judge_output, encode_judge_output, is_compact
+)
+# As in run.py: the analysis views add their routes before any app registers the blueprint
+from app.views import analysis  # noqa: F401
+
+PROBLEM_ID = "1"
+# Prints "even" for every input: passes the even cases, fails the odd ones
+HALF_RIGHT = "input()\nprint('even')\n"
+
+LEGACY_OUTPUT = {
+    "status": "fail",
+    "message": "1/2 testcases passed",
+    "results": [
+        {"input": "2", "expected": "even", "actual": "even", "pass": True, "error": None},
+        {"input": "3", "expected": "odd", "actual": "even", "pass": False, "error": None},
+    ]
+}
+
+
+def _stored(judge_output):
+    # testcase_result is a JSON column: encode and read back through JSON
+    return json.loads(json.dumps(encode_judge_output(judge_output, PROBLEM_ID, judge.testcase_digest(PROBLEM_ID))))
+
+
+def _synthetic_output():
+    testcases = load_testcases(PROBLEM_ID)[:4]
+    results = []
+    for index, (input_data, expected_output) in enumerate(testcases):
+        result = {"input": input_data, "expected": expected_output.strip(), "actual": None,
+                  "pass": False, "error": None, "stats": {"wall_ms": 1.5 + index}}
+        if index == 0:
+            result.update({"actual": expected_output.strip(), "pass": True})
+        elif index == 1:
+            result["actual"] = "x" * (ACTUAL_OUTPUT_LIMIT + 10)
+        elif index == 2:
+            result["error"] = "Traceback\n" + "e" * ERROR_TEXT_LIMIT
+        else:
+            result["skipped"] = True
+        results.append(result)
+    return {"status": "fail", "message": "1/4 testcases passed", "results": results}
+
+
+def test_judged_submission_round_trips(worker_db):
+    judge_output = judge_submission(PROBLEM_ID, str(uuid.uuid4()), HALF_RIGHT)
+    outcomes = {(result["pass"], bool(result["error"])) for result in judge_output["results"]}
+    assert (True, False) in outcomes and (False, False) in outcomes
+
+    stored = _stored(judge_output)
+
+    assert is_compact(stored)
+    assert "input" not in json.dumps(stored["d"])
+    assert decode_judge_output(stored) == judge_output
+
+
+def test_round_trip_truncates_long_failures():
+    judge_output = _synthetic_output()
+
+    decoded = decode_judge_output(_stored(judge_output))
+
+    passed, failed, errored, skipped = decoded["results"]
+    assert passed == judge_output["results"][0]
+    assert failed["actual"] == "x" * ACTUAL_OUTPUT_LIMIT and failed["actual_truncated"]
+    assert errored["error"] == judge_output["results"][2]["error"][:ERROR_TEXT_LIMIT]
+    assert errored["error_truncated"]
+    assert skipped["skipped"] and skipped["actual"] is None
+    for original, result in zip(judge_output["results"], decoded["results"]):
+        assert (result["input"], result["expected"], result["stats"]) == (
+            original["input"], original["expected"], original["stats"]
+        )
+    assert {key: decoded[key] for key in ("status", "message")} == {"status": "fail", "message": "1/4 testcases passed"}
+
+
+def test_changed_testcases_drop_input_but_keep_verdicts():
+    stored = encode_judge_output(_synthetic_output(), PROBLEM_ID, "0" * 64)
+
+    decoded = decode_judge_output(stored)
+
+    assert [result["input"] for result in decoded["results"]] == [None] * 4
+    assert [result["pass"] for result in decoded["results"]] == [True, False, False, False]
+    assert decoded["results"][3]["skipped"]
+
+
+@pytest.mark.parametrize("raw", [LEGACY_OUTPUT, json.dumps(LEGACY_OUTPUT)])
+def test_legacy_rows_decode_unchanged(raw):
+    assert decode_judge_output(raw) == LEGACY_OUTPUT
+
+
+@pytest.fixture
+def client(worker_db):
+    return worker_app().test_client()
+
+
+def _add_task(db, testcase_result):
+    submission_id = str(uuid.uuid4())
+    db.session.add(AnalysisTask(submission_id=submission_id, user_id=1, problem_id=PROBLEM_ID,
+                                code="print('even')", result="fail", testcase_result=testcase_result))
+    db.session.commit()
+    return submission_id
+
+
+# Rows written before the codec held the full judge output, as a dict or as a JSON string
+@pytest.mark.parametrize("testcase_result", [LEGACY_OUTPUT, json.dumps(LEGACY_OUTPUT)])
+@pytest.mark.parametrize("query", ["", "?compact=1"])
+def test_analysis_view_renders_legacy_rows(worker_db, client, testcase_result, query):
+    submission_id = _add_task(worker_db, testcase_result)
+
+    response = client.get(f"/api/v1/analysis/{submission_id}{query}")
+
+    assert response.status_code == 200
+    assert response.get_json()["results"] == LEGACY_OUTPUT
+
+
+def test_analysis_view_expands_compact_rows(worker_db, client):
+    judge_output = _synthetic_output()
+    stored = _stored(judge_output)
+    submission_id = _add_task(worker_db, stored)
+
+    full = client.get(f"/api/v1/analysis/{submission_id}").get_json()["results"]
+    compact = client.get(f"/api/v1/analysis/{submission_id}?compact=1").get_json()["results"]
+
+    assert full == decode_judge_output(stored)
+    assert [result["input"] for result in full["results"]] == [r["input"] for r in judge_output["results"]]
+    assert compact == stored
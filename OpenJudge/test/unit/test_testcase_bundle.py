@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Testcase Bundle Unit Tests - round trip, corrupt files, and cache reload when the bundle is rebuilt
+"""
+
+import os
+import struct
+
+import pytest
+
+from app.utils import testcase_bundle, testcase_cache
+from app.utils.sandbox_io import InputSlice
+from app.utils.testcase_bundle import (
+    BUNDLE_MAGIC, BUNDLE_VERSION, BundleError, convert_testcases, is_bundle, write_bundle
+)
+from app.utils.testcase_cache import parse_testcases
+
+TESTCASES = [
+    ("", ""),
+    ("1 2", "3"),
+    ("", "empty input"),
+    ("no output", ""),
+    ("line 1\nline 2\n", "multi\r\nline\n"),
+    ("héllo, 世界 🌍", "Grüße ✓"),
+    ("x" * 200000, "big"),
+]
+
+
+@pytest.fixture
+def bundle_path(tmp_path):
+    path = str(tmp_path / "testcases.bundle")
+    write_bundle(path, TESTCASES)
+    return path
+
+
+def _bump_mtime(path, seconds):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_round_trip_keeps_payloads_verbatim(bundle_path):
+    bundle = testcase_bundle.TestcaseBundle(bundle_path)
+
+    assert is_bundle(bundle_path)
+    assert len(bundle) == len(TESTCASES)
+    assert list(bundle) == TESTCASES
+    assert bundle[-1] == TESTCASES[-1]
+    assert bundle[1:3] == TESTCASES[1:3]
+    with pytest.raises(IndexError):
+        bundle[len(TESTCASES)]
+
+
+def test_empty_bundle(tmp_path):
+    path = str(tmp_path / "testcases.bundle")
+
+    assert write_bundle(path, []) == 0
+    assert list(testcase_bundle.TestcaseBundle(path)) == []
+
+
+def test_input_slice_reads_the_encoded_input(bundle_path):
+    bundle = testcase_bundle.TestcaseBundle(bundle_path)
+
+    for index, (input_data, _) in enumerate(TESTCASES):
+        input_slice = bundle.input_slice(index)
+        assert input_slice.length == len(input_data.encode())
+        assert input_slice.read() == input_data.encode()
+
+
+def test_sliced_view_uses_input_slice_above_threshold(bundle_path):
+    sliced = testcase_bundle.TestcaseBundle(bundle_path).sliced(1024)
+
+    for (input_data, expected_output), (case_input, case_expected) in zip(TESTCASES, sliced):
+        assert case_expected == expected_output
+        if len(input_data.encode()) >= 1024:
+            assert isinstance(case_input, InputSlice)
+            assert case_input.read() == input_data.encode()
+        else:
+            assert case_input == input_data
+
+
+def test_convert_matches_testcases_txt_parsing(tmp_path):
+    txt = tmp_path / "testcases.txt"
+    txt.write_bytes("2\neven\n  7 \r\nodd\nünïcode\n✓\ntrailing\n".encode())
+
+    bundle_path = convert_testcases(str(txt))
+
+    assert list(testcase_bundle.TestcaseBundle(bundle_path)) == list(parse_testcases(txt.read_bytes()))
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    BUNDLE_MAGIC,
+    b"OJTC\x01\x00",
+])
+def test_truncated_header_is_rejected(tmp_path, data):
+    path = tmp_path / "testcases.bundle"
+    path.write_bytes(data)
+
+    with pytest.raises(BundleError, match="Truncated"):
+        testcase_bundle.TestcaseBundle(str(path))
+
+
+def test_wrong_magic_is_rejected(tmp_path):
+    path = tmp_path / "testcases.bundle"
+    path.write_bytes(b"1 2\n3\n" * 4)
+
+    assert not is_bundle(str(path))
+    with pytest.raises(BundleError, match="Not a testcase bundle"):
+        testcase_bundle.TestcaseBundle(str(path))
+
+
+def test_unknown_version_is_rejected(bundle_path):
+    with open(bundle_path, "r+b") as f:
+        f.seek(len(BUNDLE_MAGIC))
+        f.write(struct.pack("<H", BUNDLE_VERSION + 1))
+
+    with pytest.raises(BundleError, match="version"):
+        testcase_bundle.TestcaseBundle(bundle_path)
+
+
+def test_truncated_index_is_rejected(bundle_path):
+    with open(bundle_path, "r+b") as f:
+        f.truncate(struct.calcsize("<4sHHI") + 8)
+
+    with pytest.raises(BundleError, match="Truncated"):
+        testcase_bundle.TestcaseBundle(bundle_path)
+
+
+def test_truncated_data_is_rejected_on_access(bundle_path):
+    size = os.path.getsize(bundle_path)
+    with open(bundle_path, "r+b") as f:
+        # Cut into the input of the last case
+        f.truncate(size - 10)
+    bundle = testcase_bundle.TestcaseBundle(bundle_path)
+
+    # Cases that still fit in the file stay readable
+    assert bundle[0] == TESTCASES[0]
+    with pytest.raises(BundleError, match="Corrupted"):
+        bundle[-1]
+    with pytest.raises(BundleError, match="Corrupted"):
+        bundle.input_slice(len(TESTCASES) - 1)
+
+
+def test_cache_reloads_when_bundle_is_rebuilt(bundle_path):
+    cache = testcase_cache.TestcaseCache()
+    old_bundle = cache.get("1", bundle_path)
+    old_digest = cache.digest("1", bundle_path)
+
+    write_bundle(bundle_path, [("1", "odd"), ("2", "even")])
+    _bump_mtime(bundle_path, 1)
+
+    assert list(cache.get("1", bundle_path)) == [("1", "odd"), ("2", "even")]
+    assert cache.digest("1", bundle_path) != old_digest
+    # The replaced file stays mapped for judges still using the old bundle
+    assert list(old_bundle) == TESTCASES
+
+
+def test_cache_keeps_entry_when_bundle_is_rewritten_unchanged(bundle_path):
+    cache = testcase_cache.TestcaseCache()
+    bundle = cache.get("1", bundle_path)
+    digest = cache.digest("1", bundle_path)
+
+    write_bundle(bundle_path, TESTCASES)
+    _bump_mtime(bundle_path, 1)
+
+    assert cache.get("1", bundle_path) is bundle
+    assert cache.digest("1", bundle_path) == digest
+
+
+def test_cache_reloads_when_testcases_txt_changes(tmp_path):
+    txt = tmp_path / "testcases.txt"
+    txt.write_text("1\nodd\n")
+    cache = testcase_cache.TestcaseCache()
+    digest = cache.digest("1", str(txt))
+
+    txt.write_text("2\neven\n")
+    _bump_mtime(str(txt), 1)
+
+    assert cache.get("1", str(txt)) == (("2", "even"),)
+    assert cache.digest("1", str(txt)) != digest
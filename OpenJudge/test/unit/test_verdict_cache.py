@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Verdict Cache Unit Tests - only user-determined verdicts are cached, fingerprint covers every judging input
+"""
+
+import json
+import os
+import uuid
+
+import fakeredis
+import pytest
+
+from app import tasks
+from app.models.analysis_task import AnalysisTask
+from app.utils import judge
+from app.utils.judge import build_testcase_result, compile_error_results, summarize_results
+from app.utils.languages import COMPILE_TIMED_OUT, COMPILER_UNAVAILABLE
+from app.utils.sandbox_io import MEMORY_LIMIT_EXCEEDED, OUTPUT_LIMIT_EXCEEDED, TIME_LIMIT_EXCEEDED
+from app.utils.verdict_cache import VerdictCache, is_cacheable
+
+PROBLEM_ID = "1"
+CODE = "print(input())"
+TESTCASES = [("2", "even"), ("3", "odd"), ("4", "even")]
+
+TRACEBACK = 'Traceback (most recent call last):\n  File "<string>", line 1\nZeroDivisionError: division by zero'
+SYNTAX_ERROR = '  File "main.py", line 1\n    print(\n         ^\nSyntaxError: \'(\' was never closed'
+
+# Build failures that come from the compiler host, not from the code
+COMPILE_FAILURES = [
+    COMPILE_TIMED_OUT,
+    f"{COMPILER_UNAVAILABLE}: [Errno 2] No such file or directory: 'g++'",
+    "Compiler killed by signal 9",
+]
+# Errors that depend on the judging host or its load, not only on the code
+UNCERTAIN_ERRORS = COMPILE_FAILURES + [
+    "Execution timed out",
+    TIME_LIMIT_EXCEEDED,
+    "Judge harness failed: lost zygote while waiting for child: connection closed",
+    "[Errno 24] Too many open files",
+]
+USER_ERRORS = [TRACEBACK, SYNTAX_ERROR, OUTPUT_LIMIT_EXCEEDED, MEMORY_LIMIT_EXCEEDED]
+
+
+@pytest.fixture
+def cache():
+    return VerdictCache(fakeredis.FakeRedis())
+
+
+def _judge_output(error):
+    results = []
+    for index, (input_data, expected_output) in enumerate(TESTCASES):
+        if index == 1:
+            results.append(build_testcase_result(input_data, expected_output, None, error))
+        else:
+            results.append(build_testcase_result(input_data, expected_output, expected_output, None))
+    return summarize_results(results)
+
+
+@pytest.mark.parametrize("error", UNCERTAIN_ERRORS)
+def test_uncertain_errors_are_never_cached(cache, error):
+    judge_output = _judge_output(error)
+
+    assert not is_cacheable(judge_output)
+    assert not cache.put(PROBLEM_ID, "fp", CODE, judge_output)
+    assert cache.get(PROBLEM_ID, "fp", CODE) is None
+
+
+@pytest.mark.parametrize("error", COMPILE_FAILURES)
+def test_compile_failures_outside_the_code_are_never_cached(cache, error):
+    judge_output = summarize_results(compile_error_results(TESTCASES, error, "first_failure"))
+
+    assert any(result.get("skipped") for result in judge_output["results"])
+    assert not cache.put(PROBLEM_ID, "fp", CODE, judge_output)
+
+
+@pytest.mark.parametrize("error", USER_ERRORS + [None])
+def test_user_outcomes_are_cached(cache, error):
+    judge_output = _judge_output(error)
+
+    assert cache.put(PROBLEM_ID, "fp", CODE, judge_output)
+    assert cache.get(PROBLEM_ID, "fp", CODE) == json.loads(json.dumps(judge_output))
+
+
+def test_wrong_answer_and_skipped_cases_are_cached(cache):
+    results = [build_testcase_result("3", "odd", "even", None), {"input": "4", "skipped": True, "pass": False}]
+
+    assert cache.put(PROBLEM_ID, "fp", CODE, summarize_results(results))
+
+
+def test_output_without_results_is_not_cached(cache):
+    assert not cache.put(PROBLEM_ID, "fp", CODE, {"status": "err", "message": "Unknown runtime: nope", "results": []})
+
+
+def test_process_judge_does_not_cache_timeouts(worker_db, cache, monkeypatch):
+    monkeypatch.setattr(tasks, "verdict_cache", cache)
+    monkeypatch.setattr(tasks, "judge_submission", lambda *args, **kwargs: _judge_output("Execution timed out"))
+    submission_id = str(uuid.uuid4())
+    worker_db.session.add(AnalysisTask(submission_id=submission_id, user_id=1, problem_id=PROBLEM_ID,
+                                       code=CODE, result="pending"))
+    worker_db.session.commit()
+
+    tasks.process_judge(submission_id, PROBLEM_ID, CODE)
+
+    fingerprint = tasks.problem_fingerprint(PROBLEM_ID, None, None, None)
+    assert cache.get(PROBLEM_ID, fingerprint, CODE) is None
+    assert not cache.client.keys("verdict:*")
+
+
+@pytest.fixture
+def problem(tmp_path, monkeypatch):
+    """A throwaway problem directory, returned as (problem_id, directory)"""
+    monkeypatch.setattr(judge, "PROBLEMS_DIR", str(tmp_path))
+    problem_id = "7"
+    directory = tmp_path / problem_id
+    directory.mkdir()
+    (directory / "testcases.txt").write_text("2\neven\n3\nodd\n")
+    return problem_id, directory
+
+
+def _rewrite(path, text):
+    # A new mtime, so the testcase cache looks at the file again
+    mtime_ns = os.stat(path).st_mtime_ns
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns + 10 ** 9, mtime_ns + 10 ** 9))
+
+
+def test_fingerprint_follows_testcase_content(problem):
+    problem_id, directory = problem
+    fingerprint = judge.problem_fingerprint(problem_id)
+
+    _rewrite(directory / "testcases.txt", "2\neven\n3\nodd\n")
+    assert judge.problem_fingerprint(problem_id) == fingerprint
+
+    _rewrite(directory / "testcases.txt", "2\neven\n5\nodd\n")
+    assert judge.problem_fingerprint(problem_id) != fingerprint
+
+
+def test_fingerprint_follows_limits_config(problem):
+    problem_id, directory = problem
+    fingerprints = {judge.problem_fingerprint(problem_id)}
+
+    for config in ({"limits": {"wall_time": 2}}, {"limits": {"wall_time": 3}},
+                   {"limits": {"wall_time": 3, "memory_mb": 64}}, {"execution_mode": "batch"}):
+        path = directory / "config.json"
+        if path.exists():
+            _rewrite(path, json.dumps(config))
+        else:
+            path.write_text(json.dumps(config))
+        fingerprints.add(judge.problem_fingerprint(problem_id))
+
+    assert len(fingerprints) == 5
+
+
+def test_fingerprint_follows_policy_runtime_and_language(problem):
+    problem_id, _ = problem
+    fingerprint = judge.problem_fingerprint(problem_id)
+
+    variants = [
+        judge.problem_fingerprint(problem_id, policy="first_failure"),
+        judge.problem_fingerprint(problem_id, runtime="pypy"),
+        judge.problem_fingerprint(problem_id, language="cpp"),
+        judge.problem_fingerprint(problem_id, language="java"),
+    ]
+
+    assert len({fingerprint, *variants}) == 5
+    # Defaults keep the fingerprint (and existing cache entries) unchanged
+    assert judge.problem_fingerprint(problem_id, language=judge.DEFAULT_LANGUAGE) == fingerprint
+
+
+def test_changed_fingerprint_misses_the_cache(cache, problem):
+    problem_id, directory = problem
+    judge_output = _judge_output(None)
+    cache.put(problem_id, judge.problem_fingerprint(problem_id), CODE, judge_output)
+
+    _rewrite(directory / "testcases.txt", "2\neven\n3\nodd\n4\neven\n")
+
+    assert cache.get(problem_id, judge.problem_fingerprint(problem_id), CODE) is None
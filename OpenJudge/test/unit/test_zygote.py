@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Zygote Unit Tests - verdict parity between batch (zygote) and process mode
+"""
+
+import time
+
+from app.utils.judge import DEFAULT_LIMITS, evaluate_testcase, evaluate_testcases_batch
+
+# wall limit = max(1, 0.5 * 3) = 1.5s per case
+LIMITS = dict(DEFAULT_LIMITS, wall_time=1, cpu_time=0.5)
+
+# Closes stdout/stderr (the worker sees EOF) and keeps running
+SPIN_AFTER_EOF = "import os\nos.close(1)\nos.close(2)\nwhile True:\n    pass\n"
+
+
+def test_spin_after_eof_same_verdict_in_batch_and_process_mode():
+    process = evaluate_testcase(SPIN_AFTER_EOF, "", "x", limits=LIMITS)
+
+    started = time.monotonic()
+    batch = evaluate_testcases_batch(SPIN_AFTER_EOF, [("", "x"), ("", "x")], policy="full", limits=LIMITS)
+    elapsed = time.monotonic() - started
+
+    assert process["error"] in ("Execution timed out", "time_limit_exceeded")
+    for result in batch:
+        assert result["error"] == process["error"]
+    # Each case is stopped at its own deadline, not after the harness gives up on the zygote
+    assert elapsed < 2 * 1.5 + 2
+
+
+def test_pool_does_not_rerun_code_after_zygote_is_lost(tmp_path, monkeypatch):
+    from app.utils import zygote
+    from app.utils.judge import execute_code
+
+    monkeypatch.setenv("JUDGE_ZYGOTE_POOL_SIZE", "1")
+    monkeypatch.setattr(zygote, "_pools", {})
+    runs = tmp_path / "runs"
+    # Records each run, then kills the zygote it was forked from
+    code = (f"import os, signal\nopen({str(runs)!r}, 'a').write('x')\n"
+            "os.kill(os.getppid(), signal.SIGKILL)\nprint('done')\n")
+
+    try:
+        output, error, _ = execute_code(code, "", timeout=2)
+    finally:
+        for pool in zygote._pools.values():
+            pool.close()
+
+    assert runs.read_text() == "x"
+    assert error.startswith("Judge harness failed")